@@ -1,3 +1,5 @@
+import logging
+
 from django.contrib.auth import authenticate, login
 from django.shortcuts import render, redirect
 
@@ -6,9 +8,10 @@ from django.contrib.auth import get_user_model  #recommended way to get the user
 
 User = get_user_model()
 
+logger = logging.getLogger(__name__)
+
 # Create your views here.
 def login_view(request):
-    print(request.method, request.POST or None)
     if request.method == "POST":
         username = request.POST.get("username" or None)
         password = request.POST.get("password" or None)
@@ -16,18 +19,17 @@ def login_view(request):
             user = authenticate(request, username=username, password=password)
             if user is not None:
                 login(request, user)
-                print("login here!")
+                logger.info("User %s logged in", user.pk)
                 return redirect('/')
             else:
-                print("Invalid credentials")
+                logger.info("Invalid credentials for %s", username)
         else:
-            print("Missing username or password")
+            logger.info("Login without username or password")
 
     return render(request, 'auth/login.html', {})
 
 def register_view(request):
     if request.method == "POST":
-        print(request.POST)
         username = request.POST.get("username")
         email = request.POST.get("email")
         password = request.POST.get("password")
@@ -5,6 +5,19 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
+
+Set ASYNC_VIEWS=True to route home/about to their async versions and run
+one event loop per worker, each holding many concurrent connections:
+
+    gunicorn cfehome.asgi:application -k uvicorn_worker.UvicornWorker -w 4
+
+or without gunicorn:
+
+    uvicorn cfehome.asgi:application --workers 4
+
+cfehome.gunicorn_conf (used by the Docker runner) picks this up on its
+own when ASYNC_VIEWS is set.
+Compare both setups with `python manage.py bench_views`.
 """
 
 import os
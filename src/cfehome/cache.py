@@ -0,0 +1,126 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from helpers import metrics
+
+PAGE_CACHE_HITS = metrics.counter("page_cache_hits_total", "Pages served from the page cache")
+PAGE_CACHE_MISSES = metrics.counter("page_cache_misses_total", "Cacheable pages rendered on a cache miss")
+PAGE_CACHE_BYPASS = metrics.counter("page_cache_bypass_total", "Requests that skipped the page cache")
+
+
+def page_cache_key(request, user):
+    state = "auth" if user.is_authenticated else "anon"
+    url = hashlib.md5(request.build_absolute_uri(request.path).encode()).hexdigest()
+    return f"pages:{state}:{url}"
+
+
+def _cacheable_request(request, user):
+    if request.method not in ("GET", "HEAD"):
+        return False
+    #every ?utm_source=... or random string would be a new entry, filling the cache
+    if request.META.get("QUERY_STRING"):
+        return False
+    if user.is_authenticated:
+        return False
+    #flash messages belong to one visitor (len() doesn't mark them as seen)
+    if len(messages.get_messages(request)):
+        return False
+    return True
+
+
+def _cacheable_response(request, response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        #a CSRF token in the page would only be valid for this visitor
+        and not request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+    )
+
+
+def _bypass(response):
+    PAGE_CACHE_BYPASS.inc()
+    response["X-Cache"] = "BYPASS"
+    return response
+
+
+def _hit(cached):
+    PAGE_CACHE_HITS.inc()
+    content, content_type = cached
+    response = HttpResponse(content, content_type=content_type)
+    response["X-Cache"] = "HIT"
+    return response
+
+
+def _async_cache_view(view_func, timeout):
+    async def _wrapped_view(request, *args, **kwargs):
+        page_timeout = settings.PAGE_CACHE_TIMEOUT if timeout is None else timeout
+        #loads the session too, so the message check below doesn't query
+        user = await request.auser()
+        if not page_timeout or not _cacheable_request(request, user):
+            return _bypass(await view_func(request, *args, **kwargs))
+        key = page_cache_key(request, user)
+        cached = await cache.aget(key)
+        if cached is not None:
+            return _hit(cached)
+        PAGE_CACHE_MISSES.inc()
+        response = await view_func(request, *args, **kwargs)
+        if _cacheable_response(request, response):
+            await cache.aset(key, (response.content, response["Content-Type"]), page_timeout)
+        response["X-Cache"] = "MISS"
+        return response
+    return markcoroutinefunction(wraps(view_func)(_wrapped_view))
+
+
+def cache_anonymous_page(view_func=None, timeout=None):
+    """
+    Serve the rendered page from the cache for anonymous visitors, keyed by
+    URL and auth state, for `timeout` (default settings.PAGE_CACHE_TIMEOUT)
+    seconds. Logged-in users, requests with pending messages or a query
+    string and non-GET requests always get a fresh render. Responses carry an X-Cache header
+    (HIT, MISS or BYPASS). Works on sync and async views.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            return _async_cache_view(view_func, timeout)
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            page_timeout = settings.PAGE_CACHE_TIMEOUT if timeout is None else timeout
+            if not page_timeout or not _cacheable_request(request, request.user):
+                return _bypass(view_func(request, *args, **kwargs))
+            key = page_cache_key(request, request.user)
+            cached = cache.get(key)
+            if cached is not None:
+                return _hit(cached)
+            PAGE_CACHE_MISSES.inc()
+            response = view_func(request, *args, **kwargs)
+            if _cacheable_response(request, response):
+                cache.set(key, (response.content, response["Content-Type"]), page_timeout)
+            response["X-Cache"] = "MISS"
+            return response
+        return _wrapped_view
+    if view_func is None:
+        return decorator
+    return decorator(view_func)
+
+
+def page_cache_stats():
+    """
+    Hits, misses and bypasses of the page cache in this process.
+    """
+    hits = PAGE_CACHE_HITS.value
+    misses = PAGE_CACHE_MISSES.value
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "bypass": PAGE_CACHE_BYPASS.value,
+        "hit_ratio": hits / lookups if lookups else None,
+    }
@@ -0,0 +1,92 @@
+"""
+Django's PostgreSQL backend taking connections from a psycopg_pool
+ConnectionPool, one per database alias and process:
+
+    "OPTIONS": {"pool": {"min_size": 2, "max_size": 10, "timeout": 30, ...}}
+
+The keys are ConnectionPool arguments. Closing a connection (at the end of
+each request, CONN_MAX_AGE must be 0) gives it back to the pool, so a
+worker holds at most max_size connections whatever its thread count.
+Pool statistics are exported as db_pool_* gauges in helpers.metrics.
+
+Django 5.1 has this built in as OPTIONS["pool"]; this backend can go when
+the project is on 5.1.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base
+from psycopg import IsolationLevel
+
+from helpers import metrics
+
+
+def collect_pool_stats():
+    for alias, pool in DatabaseWrapper._connection_pools.items():
+        for stat, value in pool.get_stats().items():
+            name = "db_pool_" + stat.removeprefix("pool_")
+            metrics.gauge(metrics.key(name, alias=alias), "psycopg_pool statistic").set(value)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    _connection_pools = {}
+
+    @property
+    def pool(self):
+        pool_options = self.settings_dict["OPTIONS"].get("pool")
+        if self.alias == NO_DB_ALIAS or not pool_options:
+            return None
+        if self.alias not in self._connection_pools:
+            if self.settings_dict["CONN_MAX_AGE"] != 0:
+                raise ImproperlyConfigured("A pooled database needs CONN_MAX_AGE = 0, the pool keeps the connections.")
+            try:
+                from psycopg_pool import ConnectionPool
+            except ImportError as e:
+                raise ImproperlyConfigured("Pooled connections need psycopg_pool, install psycopg[pool].") from e
+            connect_kwargs = self.get_connection_params()
+            #Django sets the autocommit mode it wants after checkout
+            connect_kwargs["autocommit"] = True
+            pool = ConnectionPool(
+                kwargs=connect_kwargs,
+                #opened by the first connection, not in the master process before a fork
+                open=False,
+                check=ConnectionPool.check_connection if self.settings_dict["CONN_HEALTH_CHECKS"] else None,
+                name=self.alias,
+                **({} if pool_options is True else pool_options),
+            )
+            #threads racing here build a pool each, the first one stored wins
+            self._connection_pools.setdefault(self.alias, pool)
+            metrics.register_collector(collect_pool_stats)
+        return self._connection_pools[self.alias]
+
+    def close_pool(self):
+        pool = self._connection_pools.pop(self.alias, None)
+        if pool is not None:
+            pool.close()
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop("pool", None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        isolation_level = self.settings_dict["OPTIONS"].get("isolation_level")
+        try:
+            self.isolation_level = IsolationLevel(isolation_level) if isolation_level is not None else IsolationLevel.READ_COMMITTED
+        except ValueError:
+            raise ImproperlyConfigured(f"Invalid transaction isolation level {isolation_level} specified.")
+        pool.open()
+        connection = pool.getconn()
+        if isolation_level is not None:
+            connection.isolation_level = self.isolation_level
+        return connection
+
+    def _close(self):
+        if self.connection is None or self.pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            #back to the pool it came from, it may have been replaced since
+            self.connection._pool.putconn(self.connection)
+            self.connection = None
@@ -0,0 +1,137 @@
+"""
+Gunicorn configuration for production, derived from the environment and
+the CPUs this container may use:
+
+    gunicorn -c python:cfehome.gunicorn_conf
+
+GUNICORN_WORKER_CLASS   sync, gthread or uvicorn (default: uvicorn with
+                        ASYNC_VIEWS, gthread otherwise)
+WEB_CONCURRENCY         worker processes (default depends on the class)
+GUNICORN_THREADS        threads per gthread worker (default 4)
+GUNICORN_PRELOAD        import the app and warm it up once before forking
+GUNICORN_TIMEOUT        seconds before a silent worker is killed
+GUNICORN_GRACEFUL_TIMEOUT, GUNICORN_KEEPALIVE
+GUNICORN_MAX_REQUESTS   recycle a worker after this many requests (+ jitter)
+PORT                    port to bind on all interfaces
+"""
+import math
+import os
+import signal
+import sys
+import time
+from pathlib import Path
+
+#gunicorn reads every module-level name as a setting and "config" is one of them
+from decouple import config as env
+
+WORKER_CLASSES = {
+    "sync": "sync",
+    "gthread": "gthread",
+    "uvicorn": "uvicorn_worker.UvicornWorker",
+}
+
+
+def cpu_count():
+    """
+    CPUs available to this process: the affinity mask capped by a cgroup
+    v2 CPU quota, since os.cpu_count() reports the host's CPUs.
+    """
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            count = min(count, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return count
+
+
+def default_workers(kind, cpus):
+    if kind == "sync":
+        #one request per process, oversubscribe to cover I/O waits
+        return 2 * cpus + 1
+    if kind == "gthread":
+        return cpus + 1
+    #an event loop per CPU
+    return cpus
+
+
+CPUS = cpu_count()
+ASYNC_VIEWS = env("ASYNC_VIEWS", cast=bool, default=False)
+WORKER_KIND = env("GUNICORN_WORKER_CLASS", default="uvicorn" if ASYNC_VIEWS else "gthread")
+
+wsgi_app = "cfehome.asgi:application" if WORKER_KIND == "uvicorn" else "cfehome.wsgi:application"
+bind = [f"[::]:{env('PORT', default='8000')}"]
+worker_class = WORKER_CLASSES.get(WORKER_KIND, WORKER_KIND)
+workers = env("WEB_CONCURRENCY", cast=int, default=default_workers(WORKER_KIND, CPUS))
+threads = env("GUNICORN_THREADS", cast=int, default=4 if WORKER_KIND == "gthread" else 1)
+preload_app = env("GUNICORN_PRELOAD", cast=bool, default=True)
+timeout = env("GUNICORN_TIMEOUT", cast=int, default=30)
+graceful_timeout = env("GUNICORN_GRACEFUL_TIMEOUT", cast=int, default=30)
+#seconds an idle keep-alive connection stays open, keep it above the proxy's idle timeout
+keepalive = env("GUNICORN_KEEPALIVE", cast=int, default=5)
+max_requests = env("GUNICORN_MAX_REQUESTS", cast=int, default=1000)
+max_requests_jitter = env("GUNICORN_MAX_REQUESTS_JITTER", cast=int, default=max_requests // 10)
+#heartbeat files in RAM instead of a possibly slow container disk
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+accesslog = env("GUNICORN_ACCESSLOG", default=None)
+
+
+def warm_up(log):
+    """
+    Import every view through the URLconf and compile the project's
+    templates, so the first requests of each worker don't pay for it.
+    """
+    start = time.perf_counter()
+    from django.conf import settings
+    from django.db import connections
+    from django.template import TemplateSyntaxError, engines
+    from django.template.loader import get_template
+    from django.urls import get_resolver
+
+    resolver = get_resolver()
+    resolver.url_patterns
+    #builds the reverse() lookup tables
+    resolver.reverse_dict
+    compiled = 0
+    for template_dir in map(Path, engines["django"].dirs):
+        for path in sorted(template_dir.rglob("*.html")):
+            try:
+                get_template(str(path.relative_to(template_dir)))
+                compiled += 1
+            except TemplateSyntaxError as e:
+                log.warning("Warm-up could not compile %s: %s", path, e)
+    #forked workers must not share the master's database connections
+    connections.close_all()
+    log.info(
+        "Warmed up %s URL patterns and %s templates in %.2fs (DEBUG=%s)",
+        len(resolver.url_patterns), compiled, time.perf_counter() - start, settings.DEBUG,
+    )
+
+
+def when_ready(server):
+    #runs in the master after the preloaded app is imported and before the first fork
+    if server.cfg.preload_app:
+        warm_up(server.log)
+
+
+def post_worker_init(worker):
+    if not worker.cfg.preload_app:
+        warm_up(worker.log)
+    if WORKER_KIND == "uvicorn":
+        #uvicorn re-raises SIGTERM/SIGINT after its graceful shutdown and the
+        #default handler would kill the process before worker_exit
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda signum, frame: sys.exit(0))
+
+
+def worker_exit(server, worker):
+    #write out buffered page visits before the worker goes away
+    from visits.buffer import flush_visits
+    flushed = flush_visits()
+    if flushed:
+        server.log.info("Flushed %s buffered page visits", flushed)
@@ -0,0 +1,151 @@
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+
+class QueryStats:
+    """
+    Database execute wrapper counting the queries of one request and the
+    time spent in them, on every configured connection of this thread.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self._connections = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+    def install(self):
+        self._connections = list(connections.all())
+        for connection in self._connections:
+            connection.execute_wrappers.append(self)
+
+    def uninstall(self):
+        for connection in self._connections:
+            connection.execute_wrappers.remove(self)
+        self._connections = []
+
+
+def view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "<unresolved>"
+    return match._func_path
+
+
+class InstrumentationMiddleware:
+    """
+    Per view: request latency, DB queries and DB time per request as
+    histograms, plus request and page-cache (X-Cache) counters, all in
+    helpers.metrics of this worker process (see /metrics/).
+
+    INSTRUMENTATION_SAMPLE_RATE (0-1) picks the share of requests whose
+    latency and queries are measured; requests are always counted.
+    Requests slower than INSTRUMENTATION_SLOW_REQUEST seconds are logged.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "INSTRUMENTATION_SAMPLE_RATE", 1.0)
+        self.slow_request = getattr(settings, "INSTRUMENTATION_SLOW_REQUEST", 1.0)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def _sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self._sampled():
+            response = self.get_response(request)
+            self.count(request, response)
+            return response
+        stats = QueryStats()
+        stats.install()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stats.uninstall()
+        self.record(request, response, time.perf_counter() - start, stats)
+        return response
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            response = await self.get_response(request)
+            self.count(request, response)
+            return response
+        stats = QueryStats()
+        #the ORM of an async request runs in one thread-sensitive thread, hook in there
+        await sync_to_async(stats.install)()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stats.uninstall)()
+        self.record(request, response, time.perf_counter() - start, stats)
+        return response
+
+    def count(self, request, response):
+        view = view_name(request)
+        metrics.counter(
+            metrics.key("http_requests_total", view=view, status=f"{response.status_code // 100}xx"),
+            "Requests per view and status class",
+        ).inc()
+        cache_result = response.get("X-Cache")
+        if cache_result:
+            metrics.counter(
+                metrics.key("http_page_cache_total", view=view, result=cache_result.lower()),
+                "Page cache hits/misses/bypasses per view",
+            ).inc()
+        return view
+
+    def record(self, request, response, seconds, stats):
+        view = self.count(request, response)
+        metrics.histogram(
+            metrics.key("http_request_seconds", view=view),
+            "Request latency per view (sampled)",
+        ).observe(seconds)
+        metrics.histogram(
+            metrics.key("http_request_queries", view=view),
+            "DB queries per request (sampled)",
+            buckets=QUERY_COUNT_BUCKETS,
+        ).observe(stats.count)
+        metrics.histogram(
+            metrics.key("http_request_db_seconds", view=view),
+            "Time spent in DB queries per request (sampled)",
+        ).observe(stats.seconds)
+        if self.slow_request and seconds >= self.slow_request:
+            logger.warning(
+                "Slow request %s %s",
+                request.method, request.path,
+                extra={
+                    "view": view,
+                    "status": response.status_code,
+                    "duration_ms": round(seconds * 1000, 1),
+                    "queries": stats.count,
+                    "db_ms": round(stats.seconds * 1000, 1),
+                },
+            )
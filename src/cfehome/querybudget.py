@@ -0,0 +1,189 @@
+"""
+Query budgets: the most queries a view may run per request.
+
+Declare them on the view
+
+    @query_budget(4)
+    def profile_list_view(request): ...
+
+or by view path / URL name in settings.QUERY_BUDGETS. QueryBudgetMiddleware
+(on with QUERY_BUDGET_ENABLED, DEBUG by default) checks every request
+against its budget and flags the same SELECT repeated QUERY_REPEAT_THRESHOLD
+times or more, the usual sign of an N+1 loop. It logs, or raises with
+QUERY_BUDGET_ACTION = "raise".
+
+In tests, assert_max_queries() and assert_query_budget() fail with
+QueryBudgetExceeded, an AssertionError.
+"""
+import logging
+from collections import Counter
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import resolve
+
+from helpers import metrics
+
+from .middleware import QueryStats, view_name
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(max_queries):
+    """
+    Decorator declaring the most queries the view may run per request, or
+    a function returning it when that depends on the settings.
+    """
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+def budget_for(match):
+    """
+    The budget of a resolved URL: the view's @query_budget, else
+    QUERY_BUDGETS by view path or URL name, else QUERY_BUDGET_DEFAULT.
+    """
+    budget = getattr(match.func, "query_budget", None)
+    if callable(budget):
+        budget = budget()
+    if budget is not None:
+        return budget
+    budgets = getattr(settings, "QUERY_BUDGETS", {})
+    for name in (match._func_path, match.view_name):
+        if name in budgets:
+            return budgets[name]
+    return getattr(settings, "QUERY_BUDGET_DEFAULT", None)
+
+
+class QueryLog(QueryStats):
+    """
+    QueryStats keeping the SQL of every query.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return super().__call__(execute, sql, params, many, context)
+
+    def repeated(self, threshold):
+        """
+        [(sql, times), ...] of the SELECTs run `threshold` times or more.
+        The SQL still has its placeholders, so the same lookup with other
+        parameters counts as a repeat.
+        """
+        counts = Counter(sql for sql in self.queries if sql.lstrip()[:6].upper() == "SELECT")
+        return [(sql, times) for sql, times in counts.most_common() if times >= threshold]
+
+    def describe(self, limit=20):
+        lines = [f"  {i}. {sql}" for i, sql in enumerate(self.queries[:limit], 1)]
+        if len(self.queries) > limit:
+            lines.append(f"  ... {len(self.queries) - limit} more")
+        return "\n".join(lines)
+
+
+@contextmanager
+def assert_max_queries(max_queries):
+    """
+    Fails when the block runs more than `max_queries` queries, listing them.
+
+        with assert_max_queries(3):
+            user_subscription.save()
+    """
+    log = QueryLog()
+    log.install()
+    try:
+        yield log
+    finally:
+        log.uninstall()
+    if log.count > max_queries:
+        raise QueryBudgetExceeded(f"{log.count} queries, expected at most {max_queries}:\n{log.describe()}")
+
+
+def assert_query_budget(client, path, method="get", **kwargs):
+    """
+    Requests `path` with the test client and fails when it runs more
+    queries than its view's budget. Returns the response.
+    """
+    match = resolve(path.split("?")[0])
+    budget = budget_for(match)
+    if budget is None:
+        raise QueryBudgetExceeded(f"{match._func_path} has no query budget")
+    with assert_max_queries(budget):
+        return getattr(client, method)(path, **kwargs)
+
+
+class QueryBudgetMiddleware:
+    """
+    Checks each request against its view's query budget and for repeated
+    identical SELECTs. Meant for development and staging: it keeps the
+    SQL of every query of the request. Adds an X-Query-Count header.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "QUERY_BUDGET_ENABLED", settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.action = getattr(settings, "QUERY_BUDGET_ACTION", "log")
+        self.repeat_threshold = getattr(settings, "QUERY_REPEAT_THRESHOLD", 5)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        log = QueryLog()
+        log.install()
+        try:
+            response = self.get_response(request)
+        finally:
+            log.uninstall()
+        self.check(request, response, log)
+        return response
+
+    async def __acall__(self, request):
+        log = QueryLog()
+        await sync_to_async(log.install)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(log.uninstall)()
+        self.check(request, response, log)
+        return response
+
+    def check(self, request, response, log):
+        response["X-Query-Count"] = str(log.count)
+        match = getattr(request, "resolver_match", None)
+        if match is None:
+            return
+        problems = []
+        budget = budget_for(match)
+        if budget is not None and log.count > budget:
+            problems.append(f"{log.count} queries, budget {budget}")
+        for sql, times in log.repeated(self.repeat_threshold):
+            problems.append(f"{times}x {sql}")
+        if not problems:
+            return
+        view = view_name(request)
+        metrics.counter(
+            metrics.key("query_budget_exceeded_total", view=view),
+            "Requests over their query budget or repeating a query (N+1)",
+        ).inc()
+        message = f"Query budget of {view} ({request.method} {request.path}): " + "; ".join(problems)
+        if self.action == "raise":
+            raise QueryBudgetExceeded(f"{message}\n{log.describe()}")
+        logger.warning(message, extra={"view": view, "queries": log.count, "budget": budget})
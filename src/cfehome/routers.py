@@ -0,0 +1,241 @@
+"""
+Read replicas, the DATABASES aliases in settings.DATABASE_REPLICAS.
+
+Writes always go to "default". Reads go to a replica only where they are
+allowed to be a little behind:
+
+    @use_replica
+    def profile_list_view(request): ...
+
+    with use_replica():
+        report = build_report()
+
+    StreamingHttpResponse(stream_from_replica(rows()))
+
+Reads stay on the primary once the request wrote something, and for
+REPLICA_STICKY_SECONDS after a client's POST (ReplicaMiddleware sets a
+cookie), so users see their own writes. A replica that can't be reached
+is skipped for REPLICA_RETRY_AFTER seconds and reads fall back to the
+primary.
+"""
+import logging
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+PRIMARY_COOKIE = "primary_reads"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+#a stale session would log the user out
+PRIMARY_ONLY_APPS = {"sessions"}
+
+_state = ContextVar("database_routing", default=None)
+#alias -> time.monotonic() until which the replica is skipped
+_unavailable = {}
+
+
+class RoutingState:
+    """
+    Routing of one request or use_replica() block.
+    """
+
+    def __init__(self, replica=False, pinned=False):
+        self.replica = replica  # reads may go to a replica
+        self.pinned = pinned    # this client wrote recently, read from the primary
+        self.wrote = False
+        self.alias = None       # replica chosen on the first read
+
+    def read_alias(self):
+        if not self.replica or self.pinned or self.wrote:
+            return None
+        if self.alias is None:
+            self.alias = choose_replica()
+        return self.alias
+
+
+def replica_aliases():
+    return list(getattr(settings, "DATABASE_REPLICAS", []))
+
+
+def choose_replica():
+    """
+    A random reachable replica, "default" when none is.
+    """
+    now = time.monotonic()
+    candidates = [alias for alias in replica_aliases() if _unavailable.get(alias, 0) <= now]
+    random.shuffle(candidates)
+    for alias in candidates:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError as e:
+            _unavailable[alias] = now + getattr(settings, "REPLICA_RETRY_AFTER", 30)
+            metrics.counter(
+                metrics.key("db_replica_unavailable_total", alias=alias),
+                "Times a replica couldn't be reached and was skipped",
+            ).inc()
+            logger.warning("Replica %s unavailable, skipping it: %s", alias, e)
+            continue
+        return alias
+    return DEFAULT_DB_ALIAS
+
+
+class ReplicaScope:
+    """
+    Lets the reads inside the block go to a replica.
+    """
+
+    def __enter__(self):
+        state = _state.get()
+        if state is None:
+            self._token = _state.set(RoutingState(replica=True))
+        else:
+            self._token = None
+            self._previous = state.replica
+            state.replica = True
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._token is not None:
+            _state.reset(self._token)
+        else:
+            _state.get().replica = self._previous
+
+
+def use_replica(func=None):
+    """
+    `with use_replica():` or as a decorator of sync and async views.
+    """
+    if func is None:
+        return ReplicaScope()
+    if iscoroutinefunction(func):
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            with ReplicaScope():
+                return await func(*args, **kwargs)
+        return inner
+
+    @wraps(func)
+    def inner(*args, **kwargs):
+        with ReplicaScope():
+            return func(*args, **kwargs)
+    return inner
+
+
+def stream_from_replica(iterable):
+    """
+    Wraps the iterable of a StreamingHttpResponse, which is read after the
+    view returned, so each chunk is produced with replica reads allowed.
+    Respects the request's pinning at the time it is called.
+    """
+    #not a generator itself, its body would only run once the middleware is done
+    current = _state.get()
+    pinned = current is not None and (current.pinned or current.wrote)
+    return _stream(iter(iterable), RoutingState(replica=True, pinned=pinned))
+
+
+def _stream(iterator, state):
+    while True:
+        token = _state.set(state)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _state.reset(token)
+        yield item
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or model._meta.app_label in PRIMARY_ONLY_APPS:
+            return None
+        return state.read_alias()
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        #replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        #replicas get their schema from the primary
+        if db in replica_aliases():
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """
+    Per request routing state: pinned to the primary while the client's
+    PRIMARY_COOKIE is set, which a request writing to the database with an
+    unsafe method sets for REPLICA_STICKY_SECONDS. GET/HEAD requests under
+    REPLICA_PATHS read from replicas as a whole.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replica_aliases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sticky_seconds = getattr(settings, "REPLICA_STICKY_SECONDS", 5)
+        self.paths = tuple(getattr(settings, "REPLICA_PATHS", ()))
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def state_for(self, request):
+        return RoutingState(
+            replica=request.method in ("GET", "HEAD") and bool(self.paths) and request.path.startswith(self.paths),
+            pinned=PRIMARY_COOKIE in request.COOKIES,
+        )
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = self.state_for(request)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.process_response(request, response, state)
+
+    async def __acall__(self, request):
+        state = self.state_for(request)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.process_response(request, response, state)
+
+    def process_response(self, request, response, state):
+        if state.wrote and request.method not in SAFE_METHODS and self.sticky_seconds:
+            response.set_cookie(
+                PRIMARY_COOKIE, "1",
+                max_age=self.sticky_seconds,
+                httponly=True,
+                samesite="Lax",
+                secure=request.is_secure(),
+            )
+        return response
@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -75,11 +75,14 @@ INSTALLED_APPS = [
     'profiles',
     'subscriptions',
     'visits',
+    'outbox',
+    'exports',
     #third party apps
     'allauth_ui',
     'allauth',
     'allauth.account',
     'allauth.socialaccount',
+    #its provider module imports requests from socialaccount's ready(), ~75ms of startup
     'allauth.socialaccount.providers.github',
     'widget_tweaks',
     'slippers',
@@ -90,6 +93,12 @@ SILENCED_SYSTEM_CHECKS =  ["slippers.E001"]
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    #after whitenoise so static files aren't measured
+    'cfehome.middleware.InstrumentationMiddleware',
+    #only with QUERY_BUDGET_ENABLED, sees the session/auth queries too
+    'cfehome.querybudget.QueryBudgetMiddleware',
+    #only with read replicas, around the session middleware so its writes count
+    'cfehome.routers.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -132,17 +141,206 @@ DATABASES = {
 
 CONN_MAX_AGE = config("CONN_MAX_AGE", cast=int, default=30)
 DATABASE_URL = config("DATABASE_URL", default=None)
+#PostgreSQL only: connections from a psycopg_pool pool per worker process (cfehome.db.postgresql)
+DATABASE_POOL = config("DATABASE_POOL", cast=bool, default=False)
+#a checkout round trip per request, the pool already drops broken and old connections
+CONN_HEALTH_CHECKS = config("CONN_HEALTH_CHECKS", cast=bool, default=not DATABASE_POOL)
 
 if DATABASE_URL is not None:
     import dj_database_url
     DATABASES = {
         "default": dj_database_url.config(
             default=DATABASE_URL,
-            conn_max_age=CONN_MAX_AGE,
-            conn_health_checks=True,
+            #with the pool a request's connection goes back to it when the request ends
+            conn_max_age=0 if DATABASE_POOL else CONN_MAX_AGE,
+            conn_health_checks=CONN_HEALTH_CHECKS,
         )
     }
 
+#Read replicas (cfehome.routers): comma separated database URLs, used by @use_replica reads
+DATABASE_REPLICA_URLS = config("DATABASE_REPLICA_URLS", cast=Csv(), default="")
+DATABASE_REPLICAS = []
+for _i, _url in enumerate(DATABASE_REPLICA_URLS, 1):
+    import dj_database_url
+    DATABASES[f"replica{_i}"] = dj_database_url.parse(
+        _url,
+        conn_max_age=0 if DATABASE_POOL else CONN_MAX_AGE,
+        conn_health_checks=CONN_HEALTH_CHECKS,
+    )
+    DATABASE_REPLICAS.append(f"replica{_i}")
+DATABASE_ROUTERS = ["cfehome.routers.ReplicaRouter"] if DATABASE_REPLICAS else []
+#seconds a client reads from the primary after a POST that wrote, to see its own writes
+REPLICA_STICKY_SECONDS = config("REPLICA_STICKY_SECONDS", cast=int, default=5)
+#seconds an unreachable replica is skipped
+REPLICA_RETRY_AFTER = config("REPLICA_RETRY_AFTER", cast=int, default=30)
+#GET requests under these paths read from replicas
+REPLICA_PATHS = ["/admin/"]
+
+for _database in DATABASES.values():
+    if _database["ENGINE"] != "django.db.backends.postgresql":
+        continue
+    if DATABASE_POOL:
+        _database["ENGINE"] = "cfehome.db.postgresql"
+        _database.setdefault("OPTIONS", {})["pool"] = {
+            #per worker process, max_size x processes must stay below Postgres' max_connections
+            "min_size": config("DATABASE_POOL_MIN_SIZE", cast=int, default=2),
+            "max_size": config("DATABASE_POOL_MAX_SIZE", cast=int, default=10),
+            #seconds a request waits for a free connection before failing
+            "timeout": config("DATABASE_POOL_TIMEOUT", cast=float, default=10.0),
+            "max_lifetime": config("DATABASE_POOL_MAX_LIFETIME", cast=float, default=3600.0),
+            "max_idle": config("DATABASE_POOL_MAX_IDLE", cast=float, default=600.0),
+        }
+    #behind pgbouncer in transaction mode a cursor can't outlive its transaction
+    #(QuerySet.iterator() then loads the whole result)
+    if config("DATABASE_PGBOUNCER", cast=bool, default=False):
+        _database["DISABLE_SERVER_SIDE_CURSORS"] = True
+
+#SQLite tuning (cfehome.db.sqlite3), for deployments without a database server
+SQLITE_TUNING = config("SQLITE_TUNING", cast=bool, default=True)
+#WAL lets readers work alongside the one writer, NORMAL only syncs at checkpoints in WAL mode
+SQLITE_PRAGMAS = {
+    "journal_mode": config("SQLITE_JOURNAL_MODE", cast=str, default="wal"),
+    "synchronous": config("SQLITE_SYNCHRONOUS", cast=str, default="normal"),
+    #milliseconds a connection waits for a lock before "database is locked"
+    "busy_timeout": config("SQLITE_BUSY_TIMEOUT", cast=int, default=5000),
+    #negative is KiB, per connection
+    "cache_size": config("SQLITE_CACHE_SIZE", cast=int, default=-20000),
+    "mmap_size": config("SQLITE_MMAP_SIZE", cast=int, default=128 * 1024 * 1024),
+    "temp_store": "memory",
+}
+#"DEFERRED" (SQLite's default) takes the write lock at a transaction's first write. "IMMEDIATE"
+#takes it when the transaction begins, so read-then-write transactions wait for each other instead
+#of failing with "database is locked", but read-only atomic() blocks queue behind writers too.
+#Opt in after measuring with `python manage.py sqlite_concurrency`.
+SQLITE_TRANSACTION_MODE = config("SQLITE_TRANSACTION_MODE", cast=str, default="DEFERRED")
+
+for _database in DATABASES.values():
+    if SQLITE_TUNING and _database["ENGINE"] == "django.db.backends.sqlite3":
+        _database["ENGINE"] = "cfehome.db.sqlite3"
+        _database.setdefault("OPTIONS", {}).update({
+            "pragmas": SQLITE_PRAGMAS,
+            "transaction_mode": SQLITE_TRANSACTION_MODE,
+        })
+
+#Cache
+#"locmem" is per process, "file" and "db" are shared between workers
+#("db" needs `python manage.py createcachetable`), or a dotted path to a backend.
+#The default cache only holds anonymous pages for PAGE_CACHE_TIMEOUT seconds, so "locmem"
+#is fine in production: each worker renders a page once per timeout. Shared data that must
+#be invalidated everywhere at once uses its own alias (see "permissions" below).
+CACHE_BACKEND = config("CACHE_BACKEND", cast=str, default="locmem")
+CACHE_BACKENDS = {
+    "locmem": ("django.core.cache.backends.locmem.LocMemCache", "cfehome"),
+    "file": ("django.core.cache.backends.filebased.FileBasedCache", "/tmp/cfehome-cache"),
+    "db": ("django.core.cache.backends.db.DatabaseCache", "django_cache"),
+    "dummy": ("django.core.cache.backends.dummy.DummyCache", ""),
+}
+_cache_backend, _cache_location = CACHE_BACKENDS.get(CACHE_BACKEND, (CACHE_BACKEND, ""))
+CACHES = {
+    "default": {
+        "BACKEND": _cache_backend,
+        "LOCATION": config("CACHE_LOCATION", cast=str, default=_cache_location),
+        "TIMEOUT": config("CACHE_TIMEOUT", cast=int, default=300),
+    }
+}
+#permission sets of subscriptions.backends.CachedPermissionBackend, every worker must see the same
+#entries to see revoked permissions: "file", "db" or a shared backend path, with "locmem" nothing is cached
+PERMISSION_CACHE_BACKEND = config("PERMISSION_CACHE_BACKEND", cast=str, default=CACHE_BACKEND)
+_permission_backend, _permission_location = CACHE_BACKENDS.get(PERMISSION_CACHE_BACKEND, (PERMISSION_CACHE_BACKEND, ""))
+CACHES["permissions"] = {
+    "BACKEND": _permission_backend,
+    "LOCATION": config("PERMISSION_CACHE_LOCATION", cast=str, default=_permission_location),
+}
+#seconds anonymous home/about pages are served from the cache (visit counts lag by this much), 0 disables
+PAGE_CACHE_TIMEOUT = config("PAGE_CACHE_TIMEOUT", cast=int, default=5)
+
+#async home/about views, only worth it when served through cfehome.asgi (see there)
+ASYNC_VIEWS = config("ASYNC_VIEWS", cast=bool, default=False)
+
+#Request instrumentation (cfehome.middleware), served on /metrics/
+#share of requests whose latency and queries are measured, 0-1
+INSTRUMENTATION_SAMPLE_RATE = config("INSTRUMENTATION_SAMPLE_RATE", cast=float, default=1.0)
+#log requests slower than this many seconds, 0 disables
+INSTRUMENTATION_SLOW_REQUEST = config("INSTRUMENTATION_SLOW_REQUEST", cast=float, default=1.0)
+#lets a Prometheus scraper read /metrics/ with "Authorization: Bearer <token>"
+METRICS_TOKEN = config("METRICS_TOKEN", cast=str, default="")
+
+#Query budgets (cfehome.querybudget), views declare theirs with @query_budget
+QUERY_BUDGET_ENABLED = config("QUERY_BUDGET_ENABLED", cast=bool, default=DEBUG)
+#"log" a warning or "raise" QueryBudgetExceeded (500 page)
+QUERY_BUDGET_ACTION = config("QUERY_BUDGET_ACTION", cast=str, default="log")
+#the same SELECT this many times in one request is reported as N+1
+QUERY_REPEAT_THRESHOLD = config("QUERY_REPEAT_THRESHOLD", cast=int, default=5)
+#budgets by view path or URL name for views without @query_budget, e.g. {"admin:index": 10}
+QUERY_BUDGETS = {}
+QUERY_BUDGET_DEFAULT = None
+
+#Logging
+#"json" writes one JSON object per line (cfehome.jsonlog), "text" is for reading in a terminal
+LOG_FORMAT = config("LOG_FORMAT", cast=str, default="text" if DEBUG else "json")
+LOG_LEVEL = config("LOG_LEVEL", cast=str, default="INFO")
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "json": {"()": "cfehome.jsonlog.JsonFormatter"},
+        "text": {"format": "%(asctime)s %(levelname)s %(name)s: %(message)s"},
+    },
+    "filters": {
+        "require_debug_false": {"()": "django.utils.log.RequireDebugFalse"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": LOG_FORMAT},
+        #500 errors to ADMINS, as in Django's default logging
+        "mail_admins": {
+            "level": "ERROR",
+            "filters": ["require_debug_false"],
+            "class": "django.utils.log.AdminEmailHandler",
+        },
+    },
+    "root": {"handlers": ["console"], "level": LOG_LEVEL},
+    "loggers": {
+        "django": {"handlers": ["mail_admins"], "level": LOG_LEVEL},
+    },
+}
+
+#Page visit buffering (visits.buffer)
+#visits are queued in memory and written with bulk_create by size or time
+VISITS_BUFFER_ENABLED = config("VISITS_BUFFER_ENABLED", cast=bool, default=True)
+VISITS_BUFFER_FLUSH_SIZE = config("VISITS_BUFFER_FLUSH_SIZE", cast=int, default=100)
+VISITS_BUFFER_FLUSH_INTERVAL = config("VISITS_BUFFER_FLUSH_INTERVAL", cast=float, default=5.0) # seconds
+VISITS_BUFFER_MAX_SIZE = config("VISITS_BUFFER_MAX_SIZE", cast=int, default=10000)
+VISITS_BUFFER_OVERFLOW = config("VISITS_BUFFER_OVERFLOW", cast=str, default="drop") # "drop" or "write"
+#raw visits older than this are deleted by compact_visits once rolled up
+VISITS_RAW_RETENTION_DAYS = config("VISITS_RAW_RETENTION_DAYS", cast=int, default=30)
+
+#Billing (helpers.billing)
+#"stripe" for the real API, "local" for the offline stand-in, or a dotted path to a backend class
+STRIPE_SECRET_KEY = config("STRIPE_SECRET_KEY", cast=str, default="")
+BILLING_BACKEND = config("BILLING_BACKEND", cast=str, default="stripe")
+#stripe backend only: one keep-alive pool per process, timeouts in seconds
+STRIPE_POOL_SIZE = config("STRIPE_POOL_SIZE", cast=int, default=10)
+STRIPE_CONNECT_TIMEOUT = config("STRIPE_CONNECT_TIMEOUT", cast=float, default=5.0)
+STRIPE_READ_TIMEOUT = config("STRIPE_READ_TIMEOUT", cast=float, default=30.0)
+STRIPE_MAX_RETRIES = config("STRIPE_MAX_RETRIES", cast=int, default=2)
+#local backend only: ":memory:" or a sqlite file shared between processes
+BILLING_LOCAL_DATABASE = config("BILLING_LOCAL_DATABASE", cast=str, default=":memory:")
+#local backend only: simulated latency in seconds, "0.2" or a "min,max" range
+BILLING_LOCAL_LATENCY = config("BILLING_LOCAL_LATENCY", cast=lambda v: tuple(float(x) for x in str(v).split(",")), default="0")
+BILLING_LOCAL_FAILURE_RATE = config("BILLING_LOCAL_FAILURE_RATE", cast=float, default=0.0) # 0-1
+
+#Billing side-effects (outbox app)
+#when async, model saves only enqueue Stripe jobs and `python manage.py process_outbox` runs them
+BILLING_ASYNC = config("BILLING_ASYNC", cast=bool, default=True)
+OUTBOX_MAX_ATTEMPTS = config("OUTBOX_MAX_ATTEMPTS", cast=int, default=8)
+OUTBOX_RETRY_BASE = config("OUTBOX_RETRY_BASE", cast=float, default=5) # seconds, doubles per attempt
+OUTBOX_RETRY_MAX_DELAY = config("OUTBOX_RETRY_MAX_DELAY", cast=float, default=3600)
+
+#seconds a per-user permission set of subscriptions.backends.CachedPermissionBackend is kept
+PERMISSION_CACHE_TIMEOUT = config("PERMISSION_CACHE_TIMEOUT", cast=int, default=60)
+
+#users per page on /profiles/
+PROFILES_PAGE_SIZE = config("PROFILES_PAGE_SIZE", cast=int, default=50)
 
 
 # Password validation
@@ -174,7 +372,8 @@ ACCOUNT_EMAIL_REQUIRED=True
 AUTHENTICATION_BACKENDS = [
     # ...
     # Needed to login by username in Django admin, regardless of `allauth`
-    'django.contrib.auth.backends.ModelBackend',
+    # (a ModelBackend that caches each user's permissions)
+    'subscriptions.backends.CachedPermissionBackend',
 
     # `allauth` specific authentication methods, such as login by email
     'allauth.account.auth_backends.AuthenticationBackend',
@@ -208,13 +407,16 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATICFILES_BASE_DIR = BASE_DIR / "staticfiles"
-STATICFILES_BASE_DIR.mkdir(parents=True, exist_ok=True)
 STATICFILES_VENDOR_DIR = STATICFILES_BASE_DIR / "vendors"
+#pinned SRI hashes/ETags for vendor_pull
+VENDOR_LOCKFILE = BASE_DIR / "vendor.lock.json"
 
 #source(s) for python manage.py collectstatic
+#no mkdir at import time (read-only filesystems, every process pays for it),
+#vendor_pull creates the directory
 STATICFILES_DIRS = [
     STATICFILES_BASE_DIR
-]
+] if STATICFILES_BASE_DIR.is_dir() else []
 
 # Output for python manage.py collectstatic
 # local cdn (content delivery network)
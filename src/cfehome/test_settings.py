@@ -0,0 +1,21 @@
+"""
+Settings for the test suite, with a read replica to route to:
+
+    python manage.py test --settings=cfehome.test_settings
+
+"replica1" gets a test database of its own, so a test can tell its reads
+from the primary's. Routing stays off unless a test sets DATABASE_REPLICAS
+and DATABASE_ROUTERS (see profiles.tests.ReplicaRouterTests).
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+DATABASES = {
+    "default": DATABASES["default"],
+    "replica1": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "replica1.sqlite3",
+    },
+}
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = []
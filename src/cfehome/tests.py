@@ -0,0 +1,114 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import resolve
+
+from visits import buffer
+from visits.buffer import VisitBuffer
+
+from .querybudget import QueryBudgetMiddleware, assert_query_budget
+from .views import PAGE_QUERY_BUDGET, UNBUFFERED_PAGE_QUERY_BUDGET
+
+# Create your tests here.
+
+User = get_user_model()
+
+
+class VisitBufferMixin:
+    """
+    Visits of the test's requests go to a buffer of its own that is never
+    flushed, not to the process-wide one.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.visit_buffer = VisitBuffer()
+        self.enterContext(mock.patch.object(self.visit_buffer, "_ensure_flusher"))
+        self.enterContext(mock.patch.object(buffer, "_buffer", self.visit_buffer))
+
+
+#no collectstatic manifest in tests
+@override_settings(
+    STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+    PAGE_CACHE_TIMEOUT=60,
+)
+class PageCacheTests(VisitBufferMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_anonymous_page_is_cached(self):
+        self.assertEqual(self.client.get("/about/")["X-Cache"], "MISS")
+        self.assertEqual(self.client.get("/about/")["X-Cache"], "HIT")
+        #counted on cache hits too
+        self.assertEqual(len(self.visit_buffer), 2)
+
+    def test_query_string_bypasses_the_cache(self):
+        for query in ["?utm_source=mail", "?utm_source=mail", "?x=1"]:
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f"/about/{query}")["X-Cache"], "BYPASS")
+        self.assertEqual(self.client.get("/about/")["X-Cache"], "MISS")
+
+
+#no collectstatic manifest in tests
+@override_settings(STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}})
+@override_settings(QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_ACTION="log", QUERY_REPEAT_THRESHOLD=5)
+class QueryBudgetTests(VisitBufferMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_pages_within_budget(self):
+        user = User.objects.create_user("member", password="pw")
+        for path in ["/", "/about/", "/hello-world/"]:
+            with self.subTest(path=path, user=None):
+                self.assertEqual(assert_query_budget(self.client, path).status_code, 200)
+        self.client.force_login(user)
+        for path in ["/", "/about/"]:
+            with self.subTest(path=path, user=user.username):
+                response = assert_query_budget(self.client, path)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response["X-Query-Count"], str(PAGE_QUERY_BUDGET))
+        self.assertEqual(len(self.visit_buffer), 5)
+
+    @override_settings(VISITS_BUFFER_ENABLED=False)
+    def test_pages_within_budget_without_the_visit_buffer(self):
+        self.client.force_login(User.objects.create_user("member", password="pw"))
+        for path in ["/", "/about/"]:
+            with self.subTest(path=path):
+                response = assert_query_budget(self.client, path)
+                self.assertEqual(response.status_code, 200)
+                self.assertGreater(int(response["X-Query-Count"]), PAGE_QUERY_BUDGET)
+                self.assertLessEqual(int(response["X-Query-Count"]), UNBUFFERED_PAGE_QUERY_BUDGET)
+        self.assertEqual(len(self.visit_buffer), 0)
+
+    def test_repeated_select_is_reported(self):
+        def view(request):
+            for username in ["a", "b", "c", "d", "e"]:
+                User.objects.filter(username=username).exists()
+            return HttpResponse()
+
+        #a view without a budget
+        request = RequestFactory().get("/metrics/")
+        request.resolver_match = resolve("/metrics/")
+        with self.assertLogs("cfehome.querybudget", "WARNING") as logs:
+            response = QueryBudgetMiddleware(view)(request)
+        self.assertEqual(response["X-Query-Count"], "5")
+        self.assertIn("5x SELECT", logs.output[0])
+
+    def test_queries_under_the_threshold_are_not_reported(self):
+        def view(request):
+            for username in ["a", "b", "c", "d"]:
+                User.objects.filter(username=username).exists()
+            return HttpResponse()
+
+        #a view without a budget
+        request = RequestFactory().get("/metrics/")
+        request.resolver_match = resolve("/metrics/")
+        with self.assertNoLogs("cfehome.querybudget", "WARNING"):
+            QueryBudgetMiddleware(view)(request)
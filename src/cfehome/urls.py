@@ -14,17 +14,24 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from auth import views as auth_views
 from .views import (
     home_view,
     about_view,
+    ahome_view,
+    aabout_view,
     pw_protected_view,
     user_only_view,
-    staff_only_view
+    staff_only_view,
+    metrics_view
     )
 
+if settings.ASYNC_VIEWS:
+    home_view, about_view = ahome_view, aabout_view
+
 
 urlpatterns = [
     path('', home_view, name='home'), #index page -> root page
@@ -36,7 +43,9 @@ urlpatterns = [
     path('protected/user-only/', user_only_view),
     path('protected/staff-only/', staff_only_view),
     path('protected/', pw_protected_view),
+    path('metrics/', metrics_view),
     path('profiles/', include('profiles.urls')),
+    path('exports/', include('exports.urls')),
     path('admin/', admin.site.urls),
 
 ]
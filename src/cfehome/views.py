@@ -1,3 +1,5 @@
+import json
+import logging
 import pathlib
 
 from django.shortcuts import render
@@ -5,40 +7,105 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 from django.conf import settings
 
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
 
-from visits.models import PageVisit
+from helpers import metrics
+
+from visits.buffer import arecord_visit, record_visit
+from visits.counters import aget_visit_counts, get_visit_counts
+
+from .cache import cache_anonymous_page
+from .querybudget import query_budget
+from .routers import use_replica
 
 LOGIN_URL = settings.LOGIN_URL
 
+logger = logging.getLogger(__name__)
+
 this_dir = pathlib.Path(__file__).resolve().parent
 
+#signed in: session, user, visit counts; the buffer writes visits later
+PAGE_QUERY_BUDGET = 3
+#plus the visit insert and counter updates when VISITS_BUFFER_ENABLED is off
+UNBUFFERED_PAGE_QUERY_BUDGET = 10
+
+
+def page_query_budget():
+    if getattr(settings, "VISITS_BUFFER_ENABLED", True):
+        return PAGE_QUERY_BUDGET
+    return UNBUFFERED_PAGE_QUERY_BUDGET
+
+
+@query_budget(page_query_budget)
 def home_view(request, *args, **kwargs):
     if request.user.is_authenticated:
-        print(request.user.first_name)
+        logger.debug("Home page for user %s", request.user.pk)
     return about_view(request, *args, **kwargs)
 
+@query_budget(page_query_budget)
+#visit counts may lag a little, they are cached for anonymous visitors anyway
+@use_replica
 def about_view(request, *args, **kwargs):
-    qs = PageVisit.objects.all()
-    page_qs = PageVisit.objects.filter(path=request.path)
+    response = about_page(request, *args, **kwargs)
+    #counted on cache hits too
+    record_visit(request.path)
+    return response
+
+@cache_anonymous_page
+def about_page(request, *args, **kwargs):
+    page_visit_count, total_visit_count = get_visit_counts(request.path)
     try:
-        percent = page_qs.count() / qs.count() * 100
-    except:
+        percent = page_visit_count / total_visit_count * 100
+    except ZeroDivisionError:
         percent = 0
     
     my_title = "My Page"
     html_template = "home.html"
     my_context = {
         "my_title": my_title,
-        "page_visit_count": page_qs.count(),
-        "total_visit_count": qs.count(),
+        "page_visit_count": page_visit_count,
+        "total_visit_count": total_visit_count,
         "percent": percent
 
     }
-    PageVisit.objects.create(path = request.path)
-
     return render(request, html_template, my_context)
 
+#async versions of home/about, used when settings.ASYNC_VIEWS is on (serve cfehome.asgi)
+
+@query_budget(page_query_budget)
+async def ahome_view(request, *args, **kwargs):
+    user = await request.auser()
+    if user.is_authenticated:
+        logger.debug("Home page for user %s", user.pk)
+    return await aabout_view(request, *args, **kwargs)
+
+@query_budget(page_query_budget)
+@use_replica
+async def aabout_view(request, *args, **kwargs):
+    response = await aabout_page(request, *args, **kwargs)
+    #fire and forget, the response doesn't wait for it
+    arecord_visit(request.path)
+    return response
+
+@cache_anonymous_page
+async def aabout_page(request, *args, **kwargs):
+    #templates read request.user synchronously, hand them the loaded user
+    request.user = await request.auser()
+    page_visit_count, total_visit_count = await aget_visit_counts(request.path)
+    try:
+        percent = page_visit_count / total_visit_count * 100
+    except ZeroDivisionError:
+        percent = 0
+
+    my_context = {
+        "my_title": "My Page",
+        "page_visit_count": page_visit_count,
+        "total_visit_count": total_visit_count,
+        "percent": percent
+    }
+    return render(request, "home.html", my_context)
+
 #Example of session usage,eg method to collect email address and then allow access to protected page
 
 VALID_CODE = "123456"
@@ -61,5 +128,18 @@ def user_only_view(request, *args, **kwargs):
 
 @staff_member_required(login_url=LOGIN_URL)
 def staff_only_view(request, *args, **kwargs):
-    print(request.user.is_staff) #this is a built in attribute of the user model
-    return render(request, "protected/staff-only.html")
\ No newline at end of file
+    logger.debug("Staff page for user %s", request.user.pk)
+    return render(request, "protected/staff-only.html")
+
+def metrics_view(request, *args, **kwargs):
+    """
+    Metrics of the worker process that serves the request, as Prometheus
+    text or ?format=json. Staff only, or "Authorization: Bearer <METRICS_TOKEN>".
+    """
+    token = settings.METRICS_TOKEN
+    has_token = bool(token) and constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}")
+    if not has_token and not request.user.is_staff:
+        return HttpResponseForbidden()
+    if request.GET.get("format") == "json":
+        return HttpResponse(json.dumps(metrics.snapshot(), indent=2), content_type="application/json")
+    return HttpResponse(metrics.render_prometheus(), content_type="text/plain; version=0.0.4")
\ No newline at end of file
@@ -0,0 +1,97 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+
+from typing import Any
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from helpers.bench import load, percentile
+
+SERVERS = {
+    #sync views behind gunicorn's default sync workers
+    "sync": ["gunicorn", "cfehome.wsgi:application"],
+    #async views on uvicorn workers, one event loop per process
+    "async": ["gunicorn", "cfehome.asgi:application", "-k", "uvicorn_worker.UvicornWorker"],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def get(url):
+    def call(session):
+        try:
+            session.get(url, timeout=30).raise_for_status()
+        except requests.RequestException:
+            return False
+        return True
+    return call
+
+
+class Command(BaseCommand):
+
+    """ Compare throughput of the sync (WSGI) and async (ASGI) home/about views """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", choices=["sync", "async", "both"], default="both")
+        parser.add_argument("--path", default="/about/")
+        parser.add_argument("--workers", type=int, default=2, help="Server processes per run")
+        parser.add_argument("--concurrency", type=int, default=50, help="Client threads")
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds per run")
+        parser.add_argument("--warmup", type=float, default=2.0)
+
+    def handle(self, *args: Any, **options: Any):
+        modes = ["sync", "async"] if options["mode"] == "both" else [options["mode"]]
+        for mode in modes:
+            port = free_port()
+            env = {
+                **os.environ,
+                "ASYNC_VIEWS": "True" if mode == "async" else "False",
+                "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "cfehome.settings"),
+            }
+            command = SERVERS[mode] + [
+                "--bind", f"127.0.0.1:{port}",
+                "--workers", str(options["workers"]),
+                "--log-level", "warning",
+            ]
+            server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL)
+            try:
+                if not wait_for_port(port):
+                    raise CommandError(f"{mode} server did not start: {' '.join(command)}")
+                url = f"http://127.0.0.1:{port}{options['path']}"
+                load(get(url), options["concurrency"], duration=options["warmup"], setup=requests.Session)
+                latencies, errors, seconds = load(
+                    get(url), options["concurrency"], duration=options["duration"], setup=requests.Session,
+                )
+            finally:
+                server.terminate()
+                server.wait()
+            self.stdout.write(
+                f"{mode:>5}: {len(latencies) / seconds:8.1f} req/s  "
+                f"p50 {percentile(latencies, 0.5) * 1000:7.1f}ms  "
+                f"p95 {percentile(latencies, 0.95) * 1000:7.1f}ms  "
+                f"p99 {percentile(latencies, 0.99) * 1000:7.1f}ms  "
+                f"errors {errors}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['concurrency']} clients, {options['workers']} workers, {options['duration']}s per run, python {sys.version.split()[0]}"
+        ))
@@ -0,0 +1,362 @@
+import json
+import platform
+import tempfile
+import time
+from datetime import datetime, timezone
+from io import StringIO
+from pathlib import Path
+
+import django
+import requests
+
+from typing import Any
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.testcases import LiveServerThread, _StaticFilesHandler
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import resolve
+
+from cfehome.middleware import QueryStats
+from customers.models import Customer
+from helpers import metrics
+from helpers.bench import load, percentile
+from subscriptions.models import SUBSCRIPTION_PERMISSIONS, Subscription, UserSubscription
+from visits.buffer import flush_visits
+from visits.models import PageVisit
+
+User = get_user_model()
+
+PASSWORD = "bench-password"
+STAFF_USERNAME = "bench_staff"
+MEMBER_USERNAME = "user000000"
+VISIT_PATHS = ["/", "/about/", "/hello-world/", "/pricing/", "/profiles/"]
+MODES = ["client", "live"]
+
+#name: (method, path, who is logged in); "login" posts the login form, "orm" is no request
+SCENARIOS = {
+    "home_anonymous": ("GET", "/", None),
+    "about_anonymous": ("GET", "/about/", None),
+    "about_member": ("GET", "/about/", MEMBER_USERNAME),
+    "profile_list": ("GET", "/profiles/", STAFF_USERNAME),
+    "profile_detail": ("GET", f"/profiles/{MEMBER_USERNAME}/", STAFF_USERNAME),
+    "login": ("POST", "/login/", None),
+    "subscription_save": ("ORM", None, None),
+}
+
+
+def summarize(latencies, seconds, queries, errors):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": round(len(latencies) / seconds, 1) if seconds else 0.0,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "queries": round(queries / len(latencies), 2) if latencies else 0.0,
+    }
+
+
+def seed(users, visits, batch_size=1000):
+    """
+    Plans with their groups and permissions, `users` members with a
+    customer and a subscription each, a staff user and `visits` page
+    visits. Bulk inserts, so no Stripe calls and no signals.
+    """
+    password = make_password(PASSWORD)
+    permissions = list(Permission.objects.filter(
+        content_type__app_label="subscriptions",
+        codename__in=[codename for codename, _ in SUBSCRIPTION_PERMISSIONS],
+    ))
+    plans = []
+    for i, name in enumerate(["Basic", "Basic AI", "Pro", "Advanced"]):
+        group = Group.objects.create(name=f"bench-{name.lower()}")
+        plan = Subscription.objects.bulk_create([Subscription(name=name, stripe_id=f"prod_bench_{i}")])[0]
+        plan.groups.add(group)
+        plan.permissions.add(*permissions[:i + 1])
+        group.permissions.add(*permissions[:i + 1])
+        plans.append((plan, group))
+
+    User.objects.create_superuser(STAFF_USERNAME, f"{STAFF_USERNAME}@example.com", PASSWORD)
+    for start in range(0, users, batch_size):
+        batch = User.objects.bulk_create([
+            User(username=f"user{i:06d}", email=f"user{i:06d}@example.com", password=password)
+            for i in range(start, min(start + batch_size, users))
+        ])
+        Customer.objects.bulk_create([
+            Customer(user=user, stripe_id=f"cus_bench_{user.pk}", init_email=user.email, init_email_confirmed=True)
+            for user in batch
+        ])
+        UserSubscription.objects.bulk_create([
+            UserSubscription(user=user, subscription=plans[user.pk % len(plans)][0])
+            for user in batch
+        ])
+        User.groups.through.objects.bulk_create([
+            User.groups.through(user_id=user.pk, group_id=plans[user.pk % len(plans)][1].pk)
+            for user in batch
+        ])
+    for start in range(0, visits, batch_size):
+        PageVisit.objects.bulk_create([
+            PageVisit(path=VISIT_PATHS[i % len(VISIT_PATHS)])
+            for i in range(start, min(start + batch_size, visits))
+        ])
+    call_command("rebuild_visit_counters", stdout=StringIO())
+    return [plan for plan, _ in plans]
+
+
+def client_for(username):
+    client = Client()
+    if username:
+        client.force_login(User.objects.get(username=username))
+    return client
+
+
+def run_client(name, count, plans):
+    """
+    `count` requests through the test client in this thread, queries
+    counted on this thread's connections.
+    """
+    method, path, username = SCENARIOS[name]
+    latencies = []
+    errors = 0
+    stats = QueryStats()
+    if method == "ORM":
+        user_subscription = UserSubscription.objects.select_related("user").get(user__username=MEMBER_USERNAME)
+    else:
+        client = client_for(username)
+        data = {"username": MEMBER_USERNAME, "password": PASSWORD}
+    stats.install()
+    start = time.perf_counter()
+    try:
+        for i in range(count):
+            request_start = time.perf_counter()
+            if method == "ORM":
+                #plan change: save() plus the post_save group reconciliation
+                user_subscription.subscription = plans[i % len(plans)]
+                user_subscription.save()
+                ok = True
+            elif method == "POST":
+                response = client.post(path, data)
+                ok = response.status_code == 302
+            else:
+                response = client.get(path)
+                ok = response.status_code == 200
+            if ok:
+                latencies.append(time.perf_counter() - request_start)
+            else:
+                errors += 1
+    finally:
+        stats.uninstall()
+    return summarize(latencies, time.perf_counter() - start, stats.count, errors)
+
+
+def query_histogram(path):
+    key = metrics.key("http_request_queries", view=resolve(path)._func_path)
+    histogram = metrics.get_metrics(key).get(key)
+    if histogram is None:
+        return 0, 0
+    data = histogram.snapshot()
+    return data["count"], data["sum"]
+
+
+def run_live(name, count, concurrency, base_url):
+    """
+    `count` requests from `concurrency` threads, a requests.Session each,
+    against the live server. Queries come from the instrumentation
+    middleware's histograms, the server runs in this process.
+    """
+    method, path, username = SCENARIOS[name]
+    url = base_url + path
+    cookies = {}
+    if username:
+        client = client_for(username)
+        cookies = {key: morsel.value for key, morsel in client.cookies.items()}
+
+    def setup():
+        session = requests.Session()
+        session.cookies.update(cookies)
+        if method == "POST":
+            session.get(url, timeout=30)
+        return session
+
+    def call(session):
+        try:
+            if method == "POST":
+                data = {
+                    "username": MEMBER_USERNAME,
+                    "password": PASSWORD,
+                    "csrfmiddlewaretoken": session.cookies.get("csrftoken"),
+                }
+                response = session.post(url, data=data, allow_redirects=False, timeout=30)
+                return response.status_code == 302
+            return session.get(url, timeout=30).status_code == 200
+        except requests.RequestException:
+            return False
+
+    queries_before = query_histogram(path)[1]
+    latencies, errors, seconds = load(call, concurrency, count=count, setup=setup)
+    return summarize(latencies, seconds, query_histogram(path)[1] - queries_before, errors)
+
+
+def compare(baseline, results, threshold):
+    """
+    [(mode, scenario, field, old, new, regressed), ...] for the scenarios
+    in both runs. Latency regresses beyond `threshold`, queries on any
+    increase since they don't vary between runs.
+    """
+    rows = []
+    for mode, scenarios in results.items():
+        for name, new in scenarios.items():
+            old = baseline.get("results", {}).get(mode, {}).get(name)
+            if not old:
+                continue
+            for field in ("p50_ms", "p95_ms", "p99_ms", "throughput", "queries"):
+                if field == "queries":
+                    regressed = new[field] > old[field]
+                elif field == "throughput":
+                    regressed = new[field] < old[field] * (1 - threshold)
+                else:
+                    regressed = new[field] > old[field] * (1 + threshold)
+                rows.append((mode, name, field, old[field], new[field], regressed))
+    return rows
+
+
+class Command(BaseCommand):
+
+    """ Seed a throwaway test database and benchmark the main views, login and plan changes """
+
+    def add_arguments(self, parser):
+        parser.add_argument("args", nargs="*", metavar="scenario", help=f"Default: all of {', '.join(SCENARIOS)}")
+        parser.add_argument("--mode", choices=MODES + ["both"], default="both",
+                            help="client: Django test client, live: threaded HTTP clients against a live server")
+        parser.add_argument("--users", type=int, default=10_000)
+        parser.add_argument("--visits", type=int, default=50_000)
+        parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+        parser.add_argument("--login-requests", type=int, default=20, help="Password hashing makes logins slow")
+        parser.add_argument("--concurrency", type=int, default=8, help="Client threads in live mode")
+        parser.add_argument("--warmup", type=int, default=10, help="Untimed requests per scenario")
+        parser.add_argument("--save-baseline", metavar="PATH", help="Write the results as JSON")
+        parser.add_argument("--compare", metavar="PATH", help="Compare against a saved baseline")
+        parser.add_argument("--threshold", type=float, default=0.1, help="Allowed latency/throughput change, 0.1 = 10%%")
+        parser.add_argument("--fail-on-regression", action="store_true")
+
+    def handle(self, *args: Any, **options: Any):
+        names = list(args) or list(SCENARIOS)
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        modes = MODES if options["mode"] == "both" else [options["mode"]]
+        baseline = None
+        if options["compare"]:
+            try:
+                baseline = json.loads(Path(options["compare"]).read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Can't read baseline {options['compare']}: {e}")
+
+        #DEBUG off like production, it keeps every query in memory otherwise
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict["NAME"]
+        tmp_dir = tempfile.TemporaryDirectory()
+        if connection.vendor == "sqlite":
+            #a file, an in-memory database can't be shared with the live server's threads
+            connection.settings_dict.setdefault("TEST", {})["NAME"] = str(Path(tmp_dir.name) / "benchmark.sqlite3")
+        self.stdout.write(f"Creating test database for {connection.alias}...")
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            #no collectstatic manifest needed, {% static %} isn't what's measured
+            with override_settings(
+                STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+                ALLOWED_HOSTS=["*"],
+                INSTRUMENTATION_SAMPLE_RATE=1.0,
+                INSTRUMENTATION_SLOW_REQUEST=0,
+            ):
+                seed_start = time.perf_counter()
+                plans = seed(options["users"], options["visits"])
+                self.stdout.write(
+                    f"Seeded {options['users']} users and {options['visits']} visits "
+                    f"in {time.perf_counter() - seed_start:.1f}s"
+                )
+                results = {mode: self.run_mode(mode, names, plans, options) for mode in modes}
+        finally:
+            flush_visits()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            tmp_dir.cleanup()
+            teardown_test_environment()
+
+        report = {
+            "meta": {
+                "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "database": connection.vendor,
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "users": options["users"],
+                "visits": options["visits"],
+                "requests": options["requests"],
+                "concurrency": options["concurrency"],
+            },
+            "results": results,
+        }
+        if options["save_baseline"]:
+            Path(options["save_baseline"]).write_text(json.dumps(report, indent=2))
+            self.stdout.write(f"Saved baseline to {options['save_baseline']}")
+        if baseline is not None:
+            self.report_comparison(baseline, results, options)
+
+    def run_mode(self, mode, names, plans, options):
+        server = None
+        if mode == "live":
+            server = LiveServerThread("127.0.0.1", _StaticFilesHandler)
+            server.daemon = True
+            server.start()
+            server.is_ready.wait()
+            if server.error:
+                raise server.error
+        results = {}
+        try:
+            self.stdout.write(f"\n{mode} {'':<18} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'queries':>8} {'errors':>7}")
+            for name in names:
+                method = SCENARIOS[name][0]
+                if mode == "live" and method == "ORM":
+                    continue
+                count = options["login_requests"] if name == "login" else options["requests"]
+                #each scenario starts from an empty page cache, then the warm-up fills it
+                cache.clear()
+                if mode == "live":
+                    base_url = f"http://127.0.0.1:{server.port}"
+                    run_live(name, min(options["warmup"], count), options["concurrency"], base_url)
+                    result = run_live(name, count, options["concurrency"], base_url)
+                else:
+                    run_client(name, min(options["warmup"], count), plans)
+                    result = run_client(name, count, plans)
+                results[name] = result
+                self.stdout.write(
+                    f"  {name:<22} {result['throughput']:8.1f} {result['p50_ms']:7.1f}ms {result['p95_ms']:7.1f}ms "
+                    f"{result['p99_ms']:7.1f}ms {result['queries']:8.1f} {result['errors']:7}"
+                )
+        finally:
+            if server is not None:
+                server.terminate()
+                server.join()
+        return results
+
+    def report_comparison(self, baseline, results, options):
+        rows = compare(baseline, results, options["threshold"])
+        self.stdout.write(f"\nCompared with the baseline of {baseline.get('meta', {}).get('created', '?')}:")
+        regressions = 0
+        for mode, name, field, old, new, regressed in rows:
+            change = (new - old) / old * 100 if old else 0.0
+            line = f"  {mode:<6} {name:<22} {field:<10} {old:>9} -> {new:>9} ({change:+.1f}%)"
+            if regressed:
+                regressions += 1
+                self.stdout.write(self.style.ERROR(line + "  REGRESSION"))
+            elif field != "queries" or new != old:
+                self.stdout.write(line)
+        if regressions and options["fail_on_regression"]:
+            raise CommandError(f"{regressions} regressions against {options['compare']}")
+        self.stdout.write(self.style.SUCCESS(f"Done, {regressions} regressions."))
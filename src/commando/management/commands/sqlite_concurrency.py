@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from typing import Any
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+
+from helpers.bench import percentile
+from visits.buffer import save_visits
+from visits.counters import get_visit_counts, increment_counters
+
+#environment of each configuration, on top of a SQLite DATABASE_URL
+CONFIGS = {
+    #Django's stock backend: rollback journal, deferred transactions
+    "default": {"SQLITE_TUNING": "False"},
+    "tuned": {"SQLITE_TUNING": "True", "SQLITE_TRANSACTION_MODE": "DEFERRED"},
+    "immediate": {"SQLITE_TUNING": "True", "SQLITE_TRANSACTION_MODE": "IMMEDIATE"},
+}
+
+PATHS = ["/", "/about/", "/pricing/", "/profiles/"]
+
+
+def visit(path):
+    #about_view with VISITS_BUFFER_ENABLED off: read the counts, write the visit
+    get_visit_counts(path)
+    save_visits([path])
+
+
+def counter(path):
+    #a transaction that reads before it writes
+    with transaction.atomic():
+        increment_counters([path])
+
+
+WORKLOADS = {"visit": visit, "counter": counter}
+
+
+class Command(BaseCommand):
+
+    """ Concurrent SQLite writer processes against Django's default and the tuned SQLite settings """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--configs", nargs="+", choices=list(CONFIGS), default=list(CONFIGS))
+        parser.add_argument("--writers", nargs="+", type=int, default=[1, 4, 8, 16], help="Writer processes per run")
+        parser.add_argument("--workload", choices=list(WORKLOADS), default="visit")
+        parser.add_argument("--duration", type=float, default=5.0, help="Seconds per run")
+        #internal: run as one writer process
+        parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+        parser.add_argument("--start-at", type=float, default=0, help=argparse.SUPPRESS)
+
+    def handle(self, *args: Any, **options: Any):
+        if options["worker"]:
+            return self.run_worker(options)
+        tmp_dir = Path(tempfile.mkdtemp(prefix="sqlite-concurrency-"))
+        try:
+            template = tmp_dir / "template.sqlite3"
+            self.stdout.write("Migrating a fresh database...")
+            subprocess.run(
+                [sys.executable, "manage.py", "migrate", "-v", "0"],
+                cwd=settings.BASE_DIR, env=self.env(template, "default"), check=True,
+            )
+            self.stdout.write(
+                f"{options['workload']} workload, {options['duration']}s per run\n"
+                f"{'config':<10} {'writers':>7} {'writes/s':>9} {'locked':>7} {'p50':>9} {'p95':>9} {'p99':>9}"
+            )
+            for config in options["configs"]:
+                for writers in options["writers"]:
+                    db = tmp_dir / f"{config}-{writers}.sqlite3"
+                    shutil.copy(template, db)
+                    result = self.run(db, config, writers, options)
+                    self.stdout.write(
+                        f"{config:<10} {writers:>7} {result['throughput']:9.1f} {result['locked']:>7} "
+                        f"{result['p50'] * 1000:7.1f}ms {result['p95'] * 1000:7.1f}ms {result['p99'] * 1000:7.1f}ms"
+                    )
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.stdout.write(self.style.SUCCESS("Done."))
+
+    def env(self, db, config):
+        return {
+            **os.environ,
+            **CONFIGS[config],
+            "DATABASE_URL": f"sqlite:///{db}",
+            #every visit goes straight to the database
+            "VISITS_BUFFER_ENABLED": "False",
+            "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "cfehome.settings"),
+        }
+
+    def run(self, db, config, writers, options):
+        #all writers start at the same moment, after every process has set up Django
+        start_at = time.time() + 3 + 0.1 * writers
+        command = [
+            "sqlite_concurrency", "--worker",
+            "--workload", options["workload"],
+            "--duration", str(options["duration"]),
+            "--start-at", str(start_at),
+        ]
+        with tempfile.TemporaryDirectory() as out_dir:
+            processes = []
+            for i in range(writers):
+                out = open(Path(out_dir) / f"{i}.json", "w+")
+                processes.append((out, subprocess.Popen(
+                    [sys.executable, "manage.py", *command],
+                    cwd=settings.BASE_DIR, env=self.env(db, config), stdout=out, stderr=subprocess.DEVNULL,
+                )))
+            latencies = []
+            locked = 0
+            for out, process in processes:
+                process.wait()
+                out.seek(0)
+                try:
+                    data = json.loads(out.read().strip().splitlines()[-1])
+                except (ValueError, IndexError):
+                    raise CommandError(f"A {config} writer failed (exit code {process.returncode})")
+                finally:
+                    out.close()
+                latencies += data["latencies"]
+                locked += data["locked"]
+        latencies.sort()
+        return {
+            "throughput": len(latencies) / options["duration"],
+            "locked": locked,
+            "p50": percentile(latencies, 0.5),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+        }
+
+    def run_worker(self, options):
+        work = WORKLOADS[options["workload"]]
+        #connect before the clock starts
+        connection.ensure_connection()
+        time.sleep(max(0, options["start_at"] - time.time()))
+        latencies = []
+        locked = 0
+        deadline = time.monotonic() + options["duration"]
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                work(random.choice(PATHS))
+                latencies.append(time.perf_counter() - start)
+            except OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+                locked += 1
+        self.stdout.write(json.dumps({"latencies": latencies, "locked": locked}))
@@ -0,0 +1,133 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+from typing import Any
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+#runs in a fresh interpreter under -X importtime: times every AppConfig.ready()
+#and django.setup(), then optionally runs a management command
+PROFILE_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from django.apps.config import AppConfig
+
+ready_times = {}
+_create = AppConfig.create.__func__
+
+def create(cls, entry):
+    app_config = _create(cls, entry)
+    ready = app_config.ready
+
+    def timed_ready():
+        ready_start = time.perf_counter()
+        ready()
+        ready_times[app_config.label] = time.perf_counter() - ready_start
+
+    app_config.ready = timed_ready
+    return app_config
+
+AppConfig.create = classmethod(create)
+
+import django
+django.setup()
+setup_seconds = time.perf_counter() - start
+if len(sys.argv) > 2:
+    from django.core.management import execute_from_command_line
+    try:
+        execute_from_command_line(["manage.py"] + sys.argv[2:])
+    except SystemExit:
+        pass
+with open(sys.argv[1], "w") as f:
+    json.dump({
+        "setup": setup_seconds,
+        "total": time.perf_counter() - start,
+        "ready": ready_times,
+    }, f)
+"""
+
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def parse_importtime(text):
+    """
+    [(module, self_us, cumulative_us, depth), ...] from -X importtime output.
+    """
+    rows = []
+    for line in text.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+
+class Command(BaseCommand):
+
+    """ Report import time per module/package and AppConfig.ready() time of a cold start """
+
+    def add_arguments(self, parser):
+        parser.add_argument("args", nargs="*", help="Management command to run after setup, after --, e.g. -- migrate --check")
+        parser.add_argument("--top", type=int, default=20)
+        parser.add_argument("--json", action="store_true", help="Print the raw numbers as JSON")
+
+    def handle(self, *args: Any, **options: Any):
+        with tempfile.NamedTemporaryFile(suffix=".json") as result_file:
+            env = {
+                **os.environ,
+                "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "cfehome.settings"),
+            }
+            process = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", PROFILE_SCRIPT, result_file.name, *args],
+                cwd=settings.BASE_DIR,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+            try:
+                timings = json.loads(Path(result_file.name).read_text())
+            except ValueError:
+                raise CommandError(f"Profiling failed:\n{process.stderr[-2000:]}")
+
+        rows = parse_importtime(process.stderr)
+        packages = defaultdict(int)
+        for module, self_us, _, _ in rows:
+            packages[module.split(".")[0]] += self_us
+        top_level = [row for row in rows if row[3] == 0]
+        report = {
+            "command": list(args),
+            "total_seconds": timings["total"],
+            "setup_seconds": timings["setup"],
+            "import_seconds": sum(row[1] for row in rows) / 1e6,
+            "modules": len(rows),
+            "packages": dict(sorted(packages.items(), key=lambda item: -item[1])[:options["top"]]),
+            "slowest_imports": [
+                {"module": module, "cumulative_ms": cumulative_us / 1000}
+                for module, _, cumulative_us, _ in sorted(top_level, key=lambda row: -row[2])[:options["top"]]
+            ],
+            "ready": dict(sorted(timings["ready"].items(), key=lambda item: -item[1])),
+        }
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(f"{report['modules']} modules imported in {report['import_seconds'] * 1000:.0f}ms")
+        self.stdout.write(f"django.setup() took {report['setup_seconds'] * 1000:.0f}ms, total {report['total_seconds'] * 1000:.0f}ms")
+        self.stdout.write("\nSelf import time per package:")
+        for package, self_us in report["packages"].items():
+            self.stdout.write(f"  {self_us / 1000:8.1f}ms  {package}")
+        self.stdout.write("\nSlowest top-level imports (cumulative):")
+        for row in report["slowest_imports"]:
+            self.stdout.write(f"  {row['cumulative_ms']:8.1f}ms  {row['module']}")
+        self.stdout.write("\nAppConfig.ready():")
+        for label, seconds in report["ready"].items():
+            if seconds >= 0.0005:
+                self.stdout.write(f"  {seconds * 1000:8.1f}ms  {label}")
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -1,9 +1,14 @@
-import helpers
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
 
 from typing import Any
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
+from helpers.downloader import DEFAULT_TIMEOUT, IntegrityError, download, pooled_session, sri_hash
+
 VENDOR_STATICFILES = {
     "flowbite.min.css": "https://cdn.jsdelivr.net/npm/flowbite@3.1.2/dist/flowbite.min.css",
     "flowbite.min.js": "https://cdn.jsdelivr.net/npm/flowbite@3.1.2/dist/flowbite.min.js",
@@ -11,23 +16,107 @@ VENDOR_STATICFILES = {
 }
 
 STATICFILES_VENDOR_DIR = getattr(settings, "STATICFILES_VENDOR_DIR")
+VENDOR_LOCKFILE = getattr(settings, "VENDOR_LOCKFILE", settings.BASE_DIR / "vendor.lock.json")
+
+
+def read_lock(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_lock(path, lock):
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(lock, indent=2, sort_keys=True) + "\n")
+    tmp_path.replace(path)
+
+
+def pull(name, url, out_path, entry, session, timeout, force=False, update_lock=False):
+    """
+    Returns (action, DownloadResult or None). Files without a pinned SRI
+    hash fail unless update_lock. Files matching it are skipped without a
+    request. With update_lock they are re-checked with the lockfile ETag,
+    so unchanged files cost a 304.
+    """
+    entry = entry if entry.get("url") == url else {}
+    integrity = entry.get("integrity")
+    if not integrity and not update_lock:
+        raise IntegrityError(f"{name} is not pinned in the lockfile, run vendor_pull --update-lock")
+    local_ok = bool(integrity) and out_path.exists() and sri_hash(out_path, integrity.split("-", 1)[0]) == integrity
+    if local_ok and not force and not update_lock:
+        return "up-to-date", None
+    result = download(
+        url, out_path,
+        session=session,
+        timeout=timeout,
+        #a 304 only means something if the local copy is the pinned one
+        etag=entry.get("etag") if local_ok and not force else None,
+        integrity=None if update_lock else integrity,
+    )
+    return result.status, result
+
 
 class Command(BaseCommand):
-    
+
+    """ Download VENDOR_STATICFILES in parallel, pinned by vendor.lock.json (created on the first run) """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT[1], help="Read timeout in seconds")
+        parser.add_argument("--lockfile", default=str(VENDOR_LOCKFILE))
+        parser.add_argument("--update-lock", action="store_true", help="Accept new hashes instead of failing on a mismatch")
+        parser.add_argument("--force", action="store_true", help="Download even if the local copy matches")
+
     def handle(self, *args: Any, **options: Any):
         self.stdout.write("Downloading vendor static files...")
-        completed_urls = []
-    
-        for name, url in VENDOR_STATICFILES.items():
-            out_path = STATICFILES_VENDOR_DIR / name
-            dl_success = helpers.download_to_local(url, out_path)
-            if dl_success:
-                completed_urls.append(url)
-            else:
-                self.stderr.write(
-                    self.style.ERROR(f"Failed to download {url}")
-                )
-        if set(completed_urls) == set(VENDOR_STATICFILES.values()):
+        STATICFILES_VENDOR_DIR.mkdir(parents=True, exist_ok=True)
+        lock_path = settings.BASE_DIR / options["lockfile"]
+        update_lock = options["update_lock"]
+        try:
+            lock = read_lock(lock_path)
+        except FileNotFoundError:
+            #first run, pin whatever is downloaded now
+            if not update_lock:
+                self.stderr.write(self.style.WARNING(
+                    f"{lock_path} not found, pinning the downloaded files in it. Commit it to check later downloads."
+                ))
+            update_lock = True
+            lock = {}
+        new_lock = dict(lock)
+        workers = max(1, min(options["workers"], len(VENDOR_STATICFILES)))
+        timeout = (DEFAULT_TIMEOUT[0], options["timeout"])
+        failed = []
+
+        with pooled_session(workers) as session, ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(
+                    pull, name, url, STATICFILES_VENDOR_DIR / name, lock.get(name, {}),
+                    session, timeout, options["force"], update_lock,
+                ): name
+                for name, url in VENDOR_STATICFILES.items()
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                url = VENDOR_STATICFILES[name]
+                try:
+                    action, result = future.result()
+                except (requests.RequestException, IntegrityError, OSError) as e:
+                    failed.append(url)
+                    self.stderr.write(self.style.ERROR(f"Failed to download {url}: {e}"))
+                    continue
+                if result is None:
+                    self.stdout.write(f"  {name}: {action}")
+                    continue
+                self.stdout.write(f"  {name}: {action} in {result.seconds * 1000:.0f}ms ({result.size} bytes)")
+                entry = {**lock.get(name, {}), "url": url}
+                if result.status == "downloaded":
+                    entry["integrity"] = result.integrity
+                    entry["etag"] = result.etag
+                new_lock[name] = entry
+
+        if new_lock != lock:
+            write_lock(lock_path, new_lock)
+            self.stdout.write(f"Updated {lock_path}")
+        if not failed:
             self.stdout.write(
                 self.style.SUCCESS("Successfully downloaded vendor static files.")
             )
@@ -35,6 +124,3 @@ class Command(BaseCommand):
             self.stdout.write(
                 self.style.WARNING("Some vendor static files were not downloaded.")
             )
-
-
-
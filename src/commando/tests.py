@@ -1,3 +1,225 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import json
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+import requests
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from commando.management.commands import vendor_pull
+from helpers.bench import load, percentile
+from helpers.downloader import download, sri_hash
 
 # Create your tests here.
+
+class VendorServer(ThreadingHTTPServer):
+    """
+    Serves `files` with strong ETags, 304s and Range requests, and records
+    the status of every response.
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), VendorHandler)
+        self.files = {}
+        self.statuses = []
+        self.headers = []
+        #gzip the body: "accepted" for clients asking for it, "always" for any client
+        self.gzip = None
+        #the next 206 starts this many bytes before the requested offset
+        self.range_shift = 0
+
+    @staticmethod
+    def etag(body):
+        return f'"{hashlib.sha1(body).hexdigest()}"'
+
+    def url(self, name):
+        return f"http://127.0.0.1:{self.server_port}/{name}"
+
+
+class VendorHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.server.headers.append(dict(self.headers))
+        body = self.server.files[self.path.lstrip("/")]
+        etag = self.server.etag(body)
+        if self.headers.get("If-None-Match") == etag:
+            return self.reply(304, etag)
+        headers = {}
+        if self.server.gzip == "always" or (self.server.gzip and "gzip" in self.headers.get("Accept-Encoding", "")):
+            #ranges are served from the encoded body, like most servers do
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        start = 0
+        range_header = self.headers.get("Range", "")
+        if range_header.startswith("bytes=") and self.headers.get("If-Range") == etag:
+            start = int(range_header[len("bytes="):].rstrip("-"))
+            if start:
+                start, self.server.range_shift = max(0, start - self.server.range_shift), 0
+        status = 206 if start else 200
+        headers["Content-Length"] = str(len(body) - start)
+        if start:
+            headers["Content-Range"] = f"bytes {start}-{len(body) - 1}/{len(body)}"
+        self.reply(status, etag, headers, body[start:])
+
+    def reply(self, status, etag, headers=None, body=b""):
+        self.server.statuses.append(status)
+        self.send_response(status)
+        self.send_header("ETag", etag)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class VendorPullTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = VendorServer()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.dir = Path(tmp_dir.name)
+        self.lock_path = self.dir / "vendor.lock.json"
+        self.body = b"/* flowbite */" * 1000
+        self.server.files = {"app.js": self.body}
+        self.server.statuses = []
+        self.server.headers = []
+        self.server.gzip = None
+        self.server.range_shift = 0
+        for name, value in (
+            ("VENDOR_STATICFILES", {"app.js": self.server.url("app.js")}),
+            ("STATICFILES_VENDOR_DIR", self.dir / "vendors"),
+        ):
+            patcher = mock.patch.object(vendor_pull, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write_lock(self, **entry):
+        self.lock_path.write_text(json.dumps({"app.js": {"url": self.server.url("app.js"), **entry}}))
+
+    def write_part(self, size):
+        #what a dropped connection left behind
+        (self.dir / "app.js.part").write_bytes(self.body[:size])
+        (self.dir / "app.js.part.json").write_text(
+            json.dumps({"url": self.server.url("app.js"), "validator": self.server.etag(self.body)})
+        )
+
+    def vendor_pull(self, *args):
+        stdout, stderr = StringIO(), StringIO()
+        call_command("vendor_pull", "--lockfile", str(self.lock_path), *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_missing_lockfile_pins_the_downloads(self):
+        _, stderr = self.vendor_pull()
+        self.assertIn("not found, pinning the downloaded files", stderr)
+        self.assertEqual(json.loads(self.lock_path.read_text())["app.js"]["integrity"], sri_hash(self.body))
+        #later runs check against it
+        self.server.files["app.js"] = b"/* tampered */"
+        _, stderr = self.vendor_pull("--force")
+        self.assertIn("does not match", stderr)
+        self.assertEqual((self.dir / "vendors" / "app.js").read_bytes(), self.body)
+
+    def test_unpinned_file_fails(self):
+        self.lock_path.write_text("{}")
+        _, stderr = self.vendor_pull()
+        self.assertIn("is not pinned in the lockfile", stderr)
+
+    def test_integrity_mismatch_fails(self):
+        self.write_lock(integrity=sri_hash(b"something else"))
+        _, stderr = self.vendor_pull()
+        self.assertIn("does not match", stderr)
+        self.assertFalse((self.dir / "vendors" / "app.js").exists())
+
+    def test_unchanged_file_is_not_downloaded_again(self):
+        (self.dir / "vendors").mkdir()
+        (self.dir / "vendors" / "app.js").write_bytes(self.body)
+        self.write_lock(integrity=sri_hash(self.body), etag=self.server.etag(self.body))
+        stdout, _ = self.vendor_pull("--update-lock")
+        self.assertIn("app.js: not-modified", stdout)
+        self.assertEqual(self.server.statuses, [304])
+
+    def test_update_lock_accepts_new_hashes(self):
+        self.write_lock(integrity=sri_hash(b"old release"), etag='"old"')
+        self.vendor_pull("--update-lock")
+        entry = json.loads(self.lock_path.read_text())["app.js"]
+        self.assertEqual(entry["integrity"], sri_hash(self.body))
+        self.assertEqual(entry["etag"], self.server.etag(self.body))
+        self.assertEqual((self.dir / "vendors" / "app.js").read_bytes(), self.body)
+
+    def test_partial_download_is_resumed(self):
+        out_path = self.dir / "app.js"
+        self.write_part(5000)
+        result = download(self.server.url("app.js"), out_path, integrity=sri_hash(self.body))
+        self.assertEqual(result.resumed_from, 5000)
+        self.assertEqual(self.server.statuses, [206])
+        self.assertEqual(out_path.read_bytes(), self.body)
+        self.assertFalse((self.dir / "app.js.part").exists())
+
+    def test_resume_asks_for_the_unencoded_body(self):
+        self.server.gzip = "accepted"
+        self.write_part(5000)
+        out_path = self.dir / "app.js"
+        result = download(self.server.url("app.js"), out_path, integrity=sri_hash(self.body))
+        self.assertEqual(self.server.headers[0]["Accept-Encoding"], "identity")
+        self.assertEqual(result.resumed_from, 5000)
+        self.assertEqual(out_path.read_bytes(), self.body)
+
+    def test_encoded_body_is_not_resumable(self):
+        self.server.gzip = "always"
+        out_path = self.dir / "app.js"
+
+        def drop_connection(done, total):
+            self.assertIsNone(total)
+            raise requests.ConnectionError("dropped")
+
+        with self.assertRaises(requests.ConnectionError):
+            download(self.server.url("app.js"), out_path, retries=0, progress=drop_connection)
+        #the decoded bytes on disk don't match the server's offsets
+        self.assertFalse((self.dir / "app.js.part.json").exists())
+        result = download(self.server.url("app.js"), out_path, integrity=sri_hash(self.body))
+        self.assertEqual((result.resumed_from, result.size), (0, len(self.body)))
+        self.assertEqual(out_path.read_bytes(), self.body)
+
+    def test_range_at_another_offset_starts_over(self):
+        self.server.range_shift = 1000
+        self.write_part(5000)
+        out_path = self.dir / "app.js"
+        result = download(self.server.url("app.js"), out_path, integrity=sri_hash(self.body), backoff=0)
+        self.assertEqual(self.server.statuses, [206, 200])
+        self.assertEqual(self.server.headers[1].get("Range"), None)
+        self.assertEqual(result.resumed_from, 0)
+        self.assertEqual(out_path.read_bytes(), self.body)
+
+
+class BenchHelperTests(SimpleTestCase):
+
+    def test_percentile(self):
+        values = list(range(100))
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([], 0.5), 0.0)
+
+    def test_load_makes_count_calls_across_threads(self):
+        calls = []
+        latencies, failures, _ = load(lambda client: calls.append(client) or len(calls) % 2, 3, count=10, setup=object)
+        self.assertEqual(len(calls), 10)
+        self.assertEqual(len(set(calls)), 3)
+        self.assertEqual(len(latencies) + failures, 10)
+        self.assertEqual(latencies, sorted(latencies))
+
@@ -0,0 +1,29 @@
+import time
+
+from allauth.account.models import EmailAddress
+from django.core.management.base import BaseCommand
+from typing import Any
+
+from customers.models import Customer, confirm_customer_emails
+
+
+class Command(BaseCommand):
+
+    """ Replay email confirmations: confirm customers whose email allauth has verified """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args: Any, **options: Any):
+        start = time.perf_counter()
+        pending = Customer.objects.filter(init_email_confirmed=False).exclude(init_email__isnull=True)
+        emails = (
+            EmailAddress.objects.filter(verified=True, email__in=pending.values("init_email"))
+            .values_list("email", flat=True)
+            .distinct()
+        )
+        confirmed = confirm_customer_emails(emails.iterator(), batch_size=options["batch_size"])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(f"Confirmed {confirmed} customers in {elapsed:.2f}s.")
+        )
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0002_customer_init_email_customer_init_email_confirmed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['init_email', 'init_email_confirmed'], name='customer_init_email_idx'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 import helpers.billing
+import outbox.jobs
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 
 from allauth.account.signals import(
     user_signed_up as allauth_user_signed_up,
@@ -19,25 +20,40 @@ class Customer(models.Model):
     init_email = models.EmailField(null=True, blank=True)
     init_email_confirmed = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            #email confirmation looks customers up by (init_email, init_email_confirmed)
+            models.Index(fields=["init_email", "init_email_confirmed"], name="customer_init_email_idx"),
+        ]
+
     def __str__(self):
         return f"{self.user.username}"
     
+    @property
+    def needs_stripe_id(self):
+        return not self.stripe_id and self.init_email_confirmed and bool(self.init_email)
+
+    def create_stripe_id(self, idempotency_key=None):
+        return helpers.billing.create_customer(
+                        email=self.init_email,
+                        metadata={
+                            "user_id": self.user.id,
+                            "username": self.user.username,
+                            },
+                        raw=False,
+                        idempotency_key=idempotency_key)
+
     #the dot save commits the changes to the database
     def save(self, *args, **kwargs):
-             
-        if not self.stripe_id:
-            if self.init_email_confirmed and self.init_email:
-                email = self.init_email
-                if email != "" or email is not None:
-                    stripe_id = helpers.billing.create_customer(
-                                    email=email, 
-                                    metadata={
-                                        "user_id": self.user.id,
-                                        "username": self.user.username,
-                                        },
-                                    raw=False)
-                    self.stripe_id = stripe_id
-        super().save(*args, **kwargs)
+        needs_stripe_id = self.needs_stripe_id
+        if needs_stripe_id and not outbox.jobs.billing_is_async():
+            self.stripe_id = self.create_stripe_id()
+            needs_stripe_id = False
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if needs_stripe_id:
+                #the Stripe customer is created by the process_outbox worker
+                outbox.jobs.enqueue(outbox.jobs.Kind.STRIPE_CUSTOMER, self.pk)
 
 
 
@@ -51,16 +67,58 @@ def allauth_user_signed_up_handler(request,user, *args, **kwargs):
 
 allauth_user_signed_up.connect(allauth_user_signed_up_handler)
 
+def confirm_customer_emails(emails, batch_size=500):
+    """
+    Mark every unconfirmed Customer with one of these emails as confirmed and
+    schedule Stripe customers for the ones that don't have one yet.
+    Works `batch_size` emails at a time: one indexed SELECT and one UPDATE per
+    batch instead of a save() per row. Returns the number of customers confirmed.
+    """
+    emails = list(dict.fromkeys(str(email) for email in emails if email))
+    confirmed = 0
+    for i in range(0, len(emails), batch_size):
+        batch = emails[i:i + batch_size]
+        with transaction.atomic():
+            rows = list(
+                Customer.objects.select_for_update()
+                .filter(init_email__in=batch, init_email_confirmed=False)
+                .values_list("id", "stripe_id")
+            )
+            if not rows:
+                continue
+            ids = [pk for pk, _ in rows]
+            confirmed += Customer.objects.filter(id__in=ids).update(init_email_confirmed=True)
+            needs_stripe_ids = [pk for pk, stripe_id in rows if not stripe_id]
+            if not needs_stripe_ids:
+                continue
+            if outbox.jobs.billing_is_async():
+                outbox.jobs.enqueue_many(outbox.jobs.Kind.STRIPE_CUSTOMER, needs_stripe_ids)
+            else:
+                _create_stripe_customers(needs_stripe_ids)
+    return confirmed
+
+
+def _create_stripe_customers(ids):
+    #synchronous mode: one batched billing call for the whole batch
+    customers = list(Customer.objects.filter(id__in=ids).select_related("user"))
+    stripe_ids = helpers.billing.create_customers([
+        {
+            "email": obj.init_email,
+            "metadata": {
+                "user_id": obj.user.id,
+                "username": obj.user.username,
+            },
+        }
+        for obj in customers
+    ])
+    for obj, stripe_id in zip(customers, stripe_ids):
+        obj.stripe_id = stripe_id
+    Customer.objects.bulk_update(customers, ["stripe_id"])
+
+
 def allauth_email_confirmed_handler(request, email_address, *args, **kwargs):
-    qs = Customer.objects.filter(
-        init_email=email_address,
-        init_email_confirmed=False,
-    )
-    #qs.update(init_email_confirmed=True), alternatively would not send the save method
-    #  in the Customer model or create the strip customer
-    for obj in qs:
-        obj.init_email_confirmed = True
-        #send the signal
-        obj.save() #triggers the save method in the Customer model
+    #email_address is allauth's EmailAddress
+    email = getattr(email_address, "email", email_address)
+    confirm_customer_emails([email])
 
 allauth_email_confirmed.connect(allauth_email_confirmed_handler)    
@@ -0,0 +1,126 @@
+import csv
+import json
+
+from django.contrib.auth import get_user_model
+
+from customers.models import Customer
+from subscriptions.models import UserSubscription
+
+User = get_user_model()
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def _users(chunk_size):
+    qs = User.objects.order_by("id").prefetch_related("groups")
+    #with chunk_size, iterator() runs the prefetch per chunk (and uses a
+    #server-side cursor on Postgres), so memory doesn't grow with the table
+    for user in qs.iterator(chunk_size=chunk_size):
+        yield {
+            "id": user.id,
+            "username": user.username,
+            "email": user.email,
+            "first_name": user.first_name,
+            "last_name": user.last_name,
+            "is_active": user.is_active,
+            "is_staff": user.is_staff,
+            "date_joined": user.date_joined,
+            "last_login": user.last_login,
+            "groups": ";".join(group.name for group in user.groups.all()),
+        }
+
+
+def _customers(chunk_size):
+    qs = Customer.objects.order_by("id").select_related("user")
+    for customer in qs.iterator(chunk_size=chunk_size):
+        yield {
+            "id": customer.id,
+            "user_id": customer.user_id,
+            "username": customer.user.username,
+            "stripe_id": customer.stripe_id,
+            "init_email": customer.init_email,
+            "init_email_confirmed": customer.init_email_confirmed,
+        }
+
+
+def _subscriptions(chunk_size):
+    qs = UserSubscription.objects.order_by("id").select_related("user", "subscription")
+    for user_sub in qs.iterator(chunk_size=chunk_size):
+        subscription = user_sub.subscription
+        yield {
+            "id": user_sub.id,
+            "user_id": user_sub.user_id,
+            "username": user_sub.user.username,
+            "subscription_id": user_sub.subscription_id,
+            "subscription": subscription.name if subscription else None,
+            "subscription_stripe_id": subscription.stripe_id if subscription else None,
+            "active": user_sub.active,
+        }
+
+
+DATASETS = {
+    "users": _users,
+    "customers": _customers,
+    "subscriptions": _subscriptions,
+}
+
+#CSV columns, the keys of each dataset's rows
+FIELDS = {
+    "users": [
+        "id", "username", "email", "first_name", "last_name",
+        "is_active", "is_staff", "date_joined", "last_login", "groups",
+    ],
+    "customers": ["id", "user_id", "username", "stripe_id", "init_email", "init_email_confirmed"],
+    "subscriptions": [
+        "id", "user_id", "username", "subscription_id", "subscription",
+        "subscription_stripe_id", "active",
+    ],
+}
+
+FORMATS = ("csv", "jsonl")
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+
+
+#a cell starting with one of these is run as a formula by spreadsheet apps
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def escape_formula(value):
+    """
+    Prefixes text a spreadsheet would evaluate with ', so it is shown as is.
+    """
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+class Echo:
+    """
+    File-like object that hands back what is written, for csv.writer.
+    """
+    def write(self, value):
+        return value
+
+
+def iter_rows(dataset, chunk_size=DEFAULT_CHUNK_SIZE):
+    return DATASETS[dataset](chunk_size)
+
+
+def iter_export(dataset, fmt="csv", chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields the export line by line as strings.
+    """
+    rows = iter_rows(dataset, chunk_size)
+    if fmt == "jsonl":
+        for row in rows:
+            yield json.dumps(row, default=str) + "\n"
+        return
+    #the header even when there are no rows
+    writer = csv.DictWriter(Echo(), fieldnames=FIELDS[dataset])
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow({key: escape_formula(value) for key, value in row.items()})
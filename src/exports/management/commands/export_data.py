@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from typing import Any
+
+from exports.datasets import DATASETS, DEFAULT_CHUNK_SIZE, FORMATS, iter_export
+
+
+class Command(BaseCommand):
+
+    """ Stream users, customers or subscriptions to CSV/JSONL """
+
+    def add_arguments(self, parser):
+        parser.add_argument("dataset", choices=sorted(DATASETS))
+        parser.add_argument("--format", choices=FORMATS, default="csv")
+        parser.add_argument("--output", "-o", default="-", help="File to write, - for stdout")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args: Any, **options: Any):
+        lines = iter_export(options["dataset"], options["format"], chunk_size=options["chunk_size"])
+        if options["output"] == "-":
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+        count = 0
+        with open(options["output"], "w", newline="") as f:
+            for line in lines:
+                f.write(line)
+                count += 1
+        self.stderr.write(self.style.SUCCESS(f"Wrote {count} lines to {options['output']}."))
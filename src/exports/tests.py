@@ -0,0 +1,48 @@
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from .datasets import DATASETS, FIELDS, iter_rows
+
+# Create your tests here.
+
+class ExportDataCommandTests(TestCase):
+
+    def export(self, dataset):
+        stdout = StringIO()
+        call_command("export_data", dataset, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_empty_dataset_has_the_header(self):
+        for dataset in DATASETS:
+            with self.subTest(dataset=dataset):
+                self.assertEqual(self.export(dataset), ",".join(FIELDS[dataset]) + "\r\n")
+
+    def test_rows_match_the_header(self):
+        get_user_model().objects.create(username="exported")
+        lines = self.export("users").splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(FIELDS["users"], list(next(iter_rows("users"))))
+
+    def test_formulas_are_escaped(self):
+        get_user_model().objects.create(username="@evil", first_name="=HYPERLINK(\"http://example.com\")", last_name="-1+2")
+        row = self.export("users").splitlines()[1]
+        self.assertIn(",'@evil,", row)
+        self.assertIn('"\'=HYPERLINK(""http://example.com"")"', row)
+        self.assertIn(",'-1+2,", row)
+
+    def test_jsonl_is_not_escaped(self):
+        get_user_model().objects.create(username="@evil")
+        stdout = StringIO()
+        call_command("export_data", "users", "--format", "jsonl", stdout=stdout)
+        self.assertIn('"username": "@evil"', stdout.getvalue())
+
+
+class ExportViewTests(TestCase):
+
+    def test_anonymous_is_sent_to_the_login_page(self):
+        response = self.client.get("/exports/users.csv")
+        self.assertRedirects(response, f"{settings.LOGIN_URL}?next=/exports/users.csv", fetch_redirect_response=False)
@@ -0,0 +1,10 @@
+
+from django.urls import path
+
+from . import views
+
+
+urlpatterns = [
+    path('<str:dataset>.<str:fmt>', views.export_view),
+
+]
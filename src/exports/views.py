@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+
+from cfehome.routers import stream_from_replica
+
+from .datasets import CONTENT_TYPES, DATASETS, FORMATS, iter_export
+
+# Create your views here.
+
+@staff_member_required(login_url=settings.LOGIN_URL)
+def export_view(request, dataset=None, fmt="csv", *args, **kwargs):
+    if dataset not in DATASETS or fmt not in FORMATS:
+        raise Http404
+    response = StreamingHttpResponse(stream_from_replica(iter_export(dataset, fmt)), content_type=CONTENT_TYPES[fmt])
+    filename = f"{dataset}-{timezone.now():%Y%m%d-%H%M%S}.{fmt}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
@@ -1,3 +1,17 @@
-from .downloader import download_to_local
+#helpers.downloader imports requests, so it is only loaded when used
+#(helpers.billing and helpers.metrics are imported by every process)
+_LAZY = {
+    "download_to_local": "helpers.downloader",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        import importlib
+        value = getattr(importlib.import_module(_LAZY[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = ["download_to_local"]
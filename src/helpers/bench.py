@@ -0,0 +1,61 @@
+"""
+Shared by the benchmark management commands.
+
+    latencies, failures, seconds = load(call, concurrency=8, duration=10, setup=requests.Session)
+    p95 = percentile(latencies, 0.95)
+"""
+import threading
+import time
+
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile of sorted `values`, 0.0 for none.
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def load(call, concurrency, duration=None, count=None, setup=None):
+    """
+    `concurrency` threads calling `call(client)` back to back, for
+    `duration` seconds or `count` calls in total. `client` is what
+    `setup()` returned in that thread, e.g. a requests.Session (None
+    without setup). A call succeeded when it returns a true value, only
+    those are timed. Returns (sorted latencies, failures, seconds).
+    """
+    if (duration is None) == (count is None):
+        raise ValueError("Pass duration or count")
+    if count is None:
+        counts = [None] * concurrency
+    else:
+        counts = [count // concurrency + (1 if i < count % concurrency else 0) for i in range(concurrency)]
+    latencies = []
+    failures = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration if duration is not None else None
+
+    def client(remaining):
+        state = setup() if setup is not None else None
+        own = []
+        failed = 0
+        while remaining != 0 and (deadline is None or time.monotonic() < deadline):
+            start = time.perf_counter()
+            if call(state):
+                own.append(time.perf_counter() - start)
+            else:
+                failed += 1
+            if remaining is not None:
+                remaining -= 1
+        with lock:
+            latencies.extend(own)
+            failures[0] += failed
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in counts if n != 0]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), failures[0], time.perf_counter() - start
@@ -0,0 +1,157 @@
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from helpers import metrics
+
+from .base import BaseBillingBackend, BillingError
+
+#short names for BILLING_BACKEND, anything else is a dotted path
+BACKEND_ALIASES = {
+    "stripe": "helpers.billing.stripe_backend.StripeBillingBackend",
+    "local": "helpers.billing.local.LocalBillingBackend",
+    "fake": "helpers.billing.local.LocalBillingBackend",
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _backend_options(path):
+    if path.endswith("StripeBillingBackend"):
+        return {
+            "api_key": getattr(settings, "STRIPE_SECRET_KEY", ""),
+            "debug": settings.DEBUG,
+            "pool_size": getattr(settings, "STRIPE_POOL_SIZE", 10),
+            "connect_timeout": getattr(settings, "STRIPE_CONNECT_TIMEOUT", 5.0),
+            "read_timeout": getattr(settings, "STRIPE_READ_TIMEOUT", 30.0),
+            "max_retries": getattr(settings, "STRIPE_MAX_RETRIES", 2),
+        }
+    if path.endswith("LocalBillingBackend"):
+        return {
+            "database": getattr(settings, "BILLING_LOCAL_DATABASE", ":memory:"),
+            "latency": getattr(settings, "BILLING_LOCAL_LATENCY", 0),
+            "failure_rate": getattr(settings, "BILLING_LOCAL_FAILURE_RATE", 0.0),
+        }
+    return {}
+
+
+def get_backend():
+    """
+    The billing backend picked by settings.BILLING_BACKEND, created on
+    first use and shared by the whole process.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = getattr(settings, "BILLING_BACKEND", "stripe")
+                path = BACKEND_ALIASES.get(name, name)
+                options = {**_backend_options(path), **getattr(settings, "BILLING_BACKEND_OPTIONS", {})}
+                _backend = import_string(path)(**options)
+    return _backend
+
+
+def set_backend(backend):
+    """
+    Swap the backend, e.g. in a benchmark. None goes back to the settings.
+    """
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def _result(response, raw):
+    if raw:
+        return response
+    return response.id
+
+
+def create_customer(
+        name="",
+        email="",
+        metadata={},
+        raw=False,
+        idempotency_key=None):
+
+    response = get_backend().create_customer(
+        name=name,
+        email=email,
+        metadata=metadata,
+        idempotency_key=idempotency_key,
+    )
+    return _result(response, raw)
+
+#https://docs.stripe.com/api/products/create?lang=python
+def create_product(
+        name="",
+        metadata={},
+        raw=False,
+        idempotency_key=None):
+
+    response = get_backend().create_product(
+        name=name,
+        metadata=metadata,
+        idempotency_key=idempotency_key,
+    )
+    return _result(response, raw)
+
+def create_price(
+            currency="usd",
+            unit_amount="9999",
+            interval="month",
+            product=None,
+            metadata={},
+        raw=False,
+        idempotency_key=None):
+
+    if product is None:
+        return None
+
+    response = get_backend().create_price(
+            currency=currency,
+            unit_amount=unit_amount,
+            interval=interval,
+            product=product,
+            metadata=metadata,
+            idempotency_key=idempotency_key,
+            )
+    return _result(response, raw)
+
+#batched variants: take a list of keyword-argument dicts, return ids in the same order
+def create_customers(customers, raw=False):
+    responses = get_backend().create_customers(customers)
+    return [_result(response, raw) for response in responses]
+
+def create_products(products, raw=False):
+    responses = get_backend().create_products(products)
+    return [_result(response, raw) for response in responses]
+
+def create_prices(prices, raw=False):
+    responses = get_backend().create_prices(prices)
+    return [_result(response, raw) for response in responses]
+
+
+def get_metrics():
+    """
+    Snapshot of the Stripe client metrics in this process: request latency
+    histogram, retries, connection errors, in-flight requests and how often
+    a request had to wait for a pooled connection.
+    """
+    return metrics.snapshot("billing_")
+
+
+__all__ = [
+    "BaseBillingBackend",
+    "BillingError",
+    "get_backend",
+    "set_backend",
+    "create_customer",
+    "create_product",
+    "create_price",
+    "create_customers",
+    "create_products",
+    "create_prices",
+    "get_metrics",
+]
@@ -0,0 +1,33 @@
+class BillingError(Exception):
+    """
+    Raised by billing backends when the provider rejects or fails a call.
+    """
+    pass
+
+
+class BaseBillingBackend:
+    """
+    Interface every billing backend implements. Each create_* call returns
+    the provider object (it must have an `id`); the batched variants take a
+    list of keyword-argument dicts and return the objects in the same order.
+    A repeated idempotency_key must return the object created the first time.
+    """
+
+    def create_customer(self, name="", email="", metadata=None, idempotency_key=None):
+        raise NotImplementedError
+
+    def create_product(self, name="", metadata=None, idempotency_key=None):
+        raise NotImplementedError
+
+    def create_price(self, currency="usd", unit_amount=9999, interval="month", product=None,
+                     metadata=None, idempotency_key=None):
+        raise NotImplementedError
+
+    def create_customers(self, items):
+        return [self.create_customer(**item) for item in items]
+
+    def create_products(self, items):
+        return [self.create_product(**item) for item in items]
+
+    def create_prices(self, items):
+        return [self.create_price(**item) for item in items]
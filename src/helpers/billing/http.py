@@ -0,0 +1,60 @@
+import threading
+import time
+
+import requests
+import stripe
+from requests.adapters import HTTPAdapter
+
+from helpers import metrics
+
+REQUEST_SECONDS = metrics.histogram("billing_request_seconds", "Latency of each HTTP request to Stripe")
+REQUEST_ERRORS = metrics.counter("billing_request_errors_total", "Stripe requests that failed to connect or timed out")
+RETRIES = metrics.counter("billing_retries_total", "Stripe requests that were retried")
+IN_FLIGHT = metrics.gauge("billing_requests_in_flight", "Stripe requests currently running")
+POOL_SIZE = metrics.gauge("billing_pool_size", "Connections in the Stripe HTTP pool")
+POOL_SATURATED = metrics.counter("billing_pool_saturated_total", "Stripe requests that had to wait for a pooled connection")
+
+
+class PooledStripeClient(stripe.RequestsClient):
+    """
+    One keep-alive connection pool shared by every thread in the process,
+    with connect/read timeouts on every request and metrics around it.
+    Retries are left to stripe (max_network_retries) so they stay
+    idempotent; this client only counts them.
+    """
+
+    def __init__(self, pool_size=10, connect_timeout=5.0, read_timeout=30.0, **kwargs):
+        session = requests.Session()
+        #pool_block: wait for a free connection instead of opening extra ones
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        super().__init__(timeout=(connect_timeout, read_timeout), session=session, **kwargs)
+        self.pool_size = pool_size
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        POOL_SIZE.set(pool_size)
+
+    def request(self, method, url, headers, post_data=None):
+        with self._lock:
+            if self._in_flight >= self.pool_size:
+                POOL_SATURATED.inc()
+            self._in_flight += 1
+        IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            return super().request(method, url, headers, post_data)
+        except stripe.APIConnectionError:
+            REQUEST_ERRORS.inc()
+            raise
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - start)
+            IN_FLIGHT.dec()
+            with self._lock:
+                self._in_flight -= 1
+
+    def _should_retry(self, response, api_connection_error, num_retries, max_network_retries):
+        should_retry = super()._should_retry(response, api_connection_error, num_retries, max_network_retries)
+        if should_retry:
+            RETRIES.inc()
+        return should_retry
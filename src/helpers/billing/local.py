@@ -0,0 +1,137 @@
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+from helpers import metrics
+
+from .base import BaseBillingBackend, BillingError
+
+#same metrics the real Stripe client records, so load tests look alike
+REQUEST_SECONDS = metrics.histogram("billing_request_seconds", "Latency of each HTTP request to Stripe")
+REQUEST_ERRORS = metrics.counter("billing_request_errors_total", "Stripe requests that failed to connect or timed out")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS billing_objects (
+    id TEXT PRIMARY KEY,
+    object TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created REAL NOT NULL,
+    idempotency_key TEXT UNIQUE
+)
+"""
+
+
+class LocalBillingBackend(BaseBillingBackend):
+    """
+    Offline stand-in for Stripe. Objects are kept in SQLite (in memory by
+    default, or in a file so several processes can share them) and get
+    Stripe-looking ids.
+
+    `latency` is a delay in seconds, or a (min, max) range, added to every
+    call and `failure_rate` is the chance (0-1) that a call raises
+    BillingError, so slow or flaky Stripe can be simulated under load.
+    A batched call counts as one call.
+    """
+
+    def __init__(self, database=":memory:", latency=0, failure_rate=0.0, seed=None):
+        if isinstance(latency, (int, float)):
+            latency = (latency,)
+        latency = tuple(latency)
+        self.latency = (latency[0], latency[-1])
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(database or ":memory:", check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(SCHEMA)
+
+    def _simulate_network(self):
+        start = time.perf_counter()
+        low, high = self.latency
+        if high > 0:
+            time.sleep(self.random.uniform(low, high))
+        REQUEST_SECONDS.observe(time.perf_counter() - start)
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            REQUEST_ERRORS.inc()
+            raise BillingError("Simulated billing failure")
+
+    def _create(self, object_type, prefix, items):
+        self._simulate_network()
+        now = time.time()
+        objs = []
+        with self._lock:
+            for params in items:
+                key = params.pop("idempotency_key", None)
+                if key:
+                    #same key, same object (like Stripe)
+                    row = self._db.execute(
+                        "SELECT data FROM billing_objects WHERE idempotency_key = ?", (key,)
+                    ).fetchone()
+                    if row is not None:
+                        objs.append(SimpleNamespace(**json.loads(row[0])))
+                        continue
+                obj = SimpleNamespace(
+                    id=f"{prefix}_local{uuid.uuid4().hex[:20]}",
+                    object=object_type,
+                    created=int(now),
+                    **params,
+                )
+                self._db.execute(
+                    "INSERT INTO billing_objects (id, object, data, created, idempotency_key) VALUES (?, ?, ?, ?, ?)",
+                    (obj.id, object_type, json.dumps(vars(obj), default=str), now, key),
+                )
+                objs.append(obj)
+        return objs
+
+    def retrieve(self, stripe_id):
+        with self._lock:
+            row = self._db.execute("SELECT data FROM billing_objects WHERE id = ?", (stripe_id,)).fetchone()
+        if row is None:
+            raise BillingError(f"No such object: {stripe_id}")
+        return SimpleNamespace(**json.loads(row[0]))
+
+    def count(self, object_type=None):
+        query, params = "SELECT COUNT(*) FROM billing_objects", ()
+        if object_type is not None:
+            query, params = query + " WHERE object = ?", (object_type,)
+        with self._lock:
+            return self._db.execute(query, params).fetchone()[0]
+
+    def _customer_params(self, name="", email="", metadata=None, idempotency_key=None):
+        return {"name": name, "email": email, "metadata": metadata or {}, "idempotency_key": idempotency_key}
+
+    def _product_params(self, name="", metadata=None, idempotency_key=None):
+        return {"name": name, "metadata": metadata or {}, "idempotency_key": idempotency_key}
+
+    def _price_params(self, currency="usd", unit_amount=9999, interval="month", product=None,
+                      metadata=None, idempotency_key=None):
+        return {
+            "idempotency_key": idempotency_key,
+            "currency": currency,
+            "unit_amount": unit_amount,
+            "recurring": {"interval": interval},
+            "product": product,
+            "metadata": metadata or {},
+        }
+
+    def create_customer(self, **params):
+        return self.create_customers([params])[0]
+
+    def create_product(self, **params):
+        return self.create_products([params])[0]
+
+    def create_price(self, **params):
+        return self.create_prices([params])[0]
+
+    def create_customers(self, items):
+        return self._create("customer", "cus", [self._customer_params(**item) for item in items])
+
+    def create_products(self, items):
+        return self._create("product", "prod", [self._product_params(**item) for item in items])
+
+    def create_prices(self, items):
+        return self._create("price", "price", [self._price_params(**item) for item in items])
@@ -0,0 +1,76 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from .base import BaseBillingBackend, BillingError
+
+
+class StripeBillingBackend(BaseBillingBackend):
+    """
+    Talks to the real Stripe API. The stripe SDK is only imported when this
+    backend is created, not when helpers.billing is imported.
+
+    All calls share one pooled keep-alive client (helpers.billing.http) with
+    connect/read timeouts; connection errors, 409s and 5xx are retried up to
+    `max_retries` times. Pass an idempotency_key so retries, and re-runs of
+    the same outbox job, never create a second object.
+    """
+
+    def __init__(self, api_key="", debug=False, batch_concurrency=4,
+                 pool_size=10, connect_timeout=5.0, read_timeout=30.0, max_retries=2):
+        if "sk_test" in api_key and not debug:
+            raise ValueError("Invalid Stripe key for production")
+        import stripe
+        from .http import PooledStripeClient
+        self.stripe = stripe
+        self.stripe.api_key = api_key
+        self.stripe.max_network_retries = max_retries
+        self.stripe.default_http_client = PooledStripeClient(
+            pool_size=pool_size,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+        )
+        self.batch_concurrency = batch_concurrency
+
+    def _call(self, resource, idempotency_key=None, **params):
+        if idempotency_key:
+            params["idempotency_key"] = idempotency_key
+        try:
+            return resource.create(**params)
+        except self.stripe.StripeError as e:
+            raise BillingError(str(e)) from e
+
+    def create_customer(self, name="", email="", metadata=None, idempotency_key=None):
+        return self._call(self.stripe.Customer, idempotency_key,
+                          name=name, email=email, metadata=metadata or {})
+
+    #https://docs.stripe.com/api/products/create?lang=python
+    def create_product(self, name="", metadata=None, idempotency_key=None):
+        return self._call(self.stripe.Product, idempotency_key,
+                          name=name, metadata=metadata or {})
+
+    def create_price(self, currency="usd", unit_amount=9999, interval="month", product=None,
+                     metadata=None, idempotency_key=None):
+        return self._call(
+            self.stripe.Price,
+            idempotency_key,
+            currency=currency,
+            unit_amount=unit_amount,
+            recurring={"interval": interval},
+            product=product,
+            metadata=metadata or {},
+        )
+
+    #Stripe has no batch create endpoints, so run the calls side by side
+    #(never more than the pool has connections)
+    def _map(self, func, items):
+        workers = min(self.batch_concurrency, self.stripe.default_http_client.pool_size)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda item: func(**item), items))
+
+    def create_customers(self, items):
+        return self._map(self.create_customer, items)
+
+    def create_products(self, items):
+        return self._map(self.create_product, items)
+
+    def create_prices(self, items):
+        return self._map(self.create_price, items)
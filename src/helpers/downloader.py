@@ -1,19 +1,332 @@
-import requests
+"""
+Download engine: streams to a ".part" file next to the target, resumes it
+with an HTTP Range request after a dropped connection (or a later run),
+retries transient failures with exponential backoff, verifies a checksum
+and renames the finished file into place.
+
+    result = download(url, path, integrity="sha384-...", progress=print)
+    results = asyncio.run(adownload_many([(url, path), ...], concurrency=8))
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import time
+from dataclasses import dataclass
 from pathlib import Path
 
-def download_to_local(url: str, out_path: Path, parent_mkdir: bool = True):
+import requests
+from requests.adapters import HTTPAdapter
+
+CHUNK_SIZE = 64 * 1024
+#(connect, read) seconds, read is the longest wait between two chunks
+DEFAULT_TIMEOUT = (5, 30)
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+@dataclass
+class DownloadResult:
+    url: str
+    path: Path
+    status: str  # "downloaded" or "not-modified"
+    integrity: str = ""
+    etag: str = ""
+    size: int = 0
+    seconds: float = 0.0
+    resumed_from: int = 0
+    attempts: int = 1
+
+
+class IntegrityError(Exception):
+    pass
+
+
+class _Retry(requests.RequestException):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+RETRY_EXCEPTIONS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    _Retry,
+)
+
+
+def parse_checksum(value):
+    """
+    (algorithm, expected) for an SRI string ("sha384-<base64>") or a
+    "<algorithm>:<hex>" checksum ("sha256:9f86d0...").
+    """
+    if ":" in value:
+        algorithm, expected = value.split(":", 1)
+        return algorithm.lower(), expected.lower()
+    algorithm, _ = value.split("-", 1)
+    return algorithm, value
+
+
+def checksum_matches(digest, expected):
+    if expected.startswith(f"{digest.name}-"):
+        return _sri(digest) == expected
+    return digest.hexdigest() == expected
+
+
+def _sri(digest):
+    return f"{digest.name}-{base64.b64encode(digest.digest()).decode()}"
+
+
+def _hash_file(path, digest, limit=None):
+    with open(path, "rb") as f:
+        remaining = limit
+        while remaining is None or remaining > 0:
+            chunk = f.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest
+
+
+def sri_hash(data_or_path, algorithm="sha384"):
+    """
+    Subresource Integrity string ("sha384-<base64>") of bytes or a file.
+    """
+    digest = hashlib.new(algorithm)
+    if isinstance(data_or_path, (bytes, bytearray)):
+        digest.update(data_or_path)
+    else:
+        _hash_file(data_or_path, digest)
+    return _sri(digest)
+
+
+def _part_paths(out_path):
+    part_path = out_path.with_name(f"{out_path.name}.part")
+    return part_path, out_path.with_name(f"{out_path.name}.part.json")
+
+
+def _discard_part(part_path, meta_path):
+    part_path.unlink(missing_ok=True)
+    meta_path.unlink(missing_ok=True)
+
+
+def _validator(response):
+    #weak ETags can't be used with If-Range
+    etag = response.headers.get("ETag", "")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified", "")
+
+
+def _resume_offset(part_path, meta_path, url):
+    """
+    Size of a partial download we can continue and the validator it was
+    started with, (0, "") if there is nothing usable.
+    """
+    if not part_path.exists():
+        return 0, ""
+    try:
+        meta = json.loads(meta_path.read_text())
+    except (FileNotFoundError, ValueError):
+        meta = {}
+    if meta.get("url") != url or not meta.get("validator"):
+        _discard_part(part_path, meta_path)
+        return 0, ""
+    return part_path.stat().st_size, meta["validator"]
+
+
+def _content_range_start(response):
+    #"bytes 100-199/200"
+    value = response.headers.get("Content-Range", "")
+    try:
+        return int(value.split()[1].split("-")[0])
+    except (IndexError, ValueError):
+        return None
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+
+
+def _backoff_delay(attempt, backoff, retry_after=None):
+    if retry_after is not None:
+        return min(retry_after, MAX_BACKOFF)
+    delay = min(backoff * 2 ** (attempt - 1), MAX_BACKOFF)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _attempt(url, out_path, session, timeout, etag, integrity, resume, progress, chunk_size, last):
+    part_path, meta_path = _part_paths(out_path)
+    offset, validator = _resume_offset(part_path, meta_path, url) if resume else (0, "")
+    headers = {}
+    if resume:
+        #Range offsets and Content-Length count encoded bytes, the .part file holds decoded ones
+        headers["Accept-Encoding"] = "identity"
+    if etag and out_path.exists():
+        headers["If-None-Match"] = etag
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+    with session.get(url, stream=True, timeout=timeout, headers=headers) as response:
+        if response.status_code == 304:
+            return DownloadResult(url, out_path, "not-modified", etag=etag)
+        if response.status_code == 416:
+            #the partial file doesn't fit the remote one anymore
+            _discard_part(part_path, meta_path)
+            raise _Retry(f"{url}: stale partial download", retry_after=0)
+        if response.status_code in RETRY_STATUSES and not last:
+            raise _Retry(f"{url}: HTTP {response.status_code}", retry_after=_retry_after(response))
+        response.raise_for_status()
+        encoded = response.headers.get("Content-Encoding", "identity") != "identity"
+        if response.status_code == 206 and (encoded or _content_range_start(response) != offset):
+            #a part of the file, but not the bytes that continue ours
+            _discard_part(part_path, meta_path)
+            raise _Retry(f"{url}: range doesn't continue the partial download at byte {offset}", retry_after=0)
+        if response.status_code != 206:
+            #full body, the server ignored or refused the range
+            offset = 0
+        algorithm = parse_checksum(integrity)[0] if integrity else "sha384"
+        digest = hashlib.new(algorithm)
+        if offset:
+            _hash_file(part_path, digest, limit=offset)
+        elif resume:
+            #a body decoded on the fly can't be resumed by byte offset
+            validator = "" if encoded else _validator(response)
+            if validator:
+                meta_path.write_text(json.dumps({"url": url, "validator": validator}))
+            else:
+                meta_path.unlink(missing_ok=True)
+        length = response.headers.get("Content-Length")
+        total = offset + int(length) if length and length.isdigit() and not encoded else None
+        done = offset
+        #binary mode so no newline conversions happen
+        with open(part_path, "r+b" if offset else "wb") as f:
+            f.seek(offset)
+            f.truncate()
+            for chunk in response.iter_content(chunk_size):
+                f.write(chunk)
+                digest.update(chunk)
+                done += len(chunk)
+                if progress is not None:
+                    progress(done, total)
+        if total is not None and done < total:
+            raise requests.exceptions.ChunkedEncodingError(f"{url}: got {done} of {total} bytes")
+        if integrity and not checksum_matches(digest, parse_checksum(integrity)[1]):
+            _discard_part(part_path, meta_path)
+            if offset and not last:
+                #the resumed prefix may be what's wrong, start over once
+                raise _Retry(f"{url}: checksum mismatch after resume", retry_after=0)
+            raise IntegrityError(f"{url} does not match {integrity}")
+        os.chmod(part_path, 0o644)
+        os.replace(part_path, out_path)
+        meta_path.unlink(missing_ok=True)
+        return DownloadResult(
+            url, out_path, "downloaded",
+            integrity=_sri(digest),
+            etag=response.headers.get("ETag", ""),
+            size=done,
+            resumed_from=offset,
+        )
+
+
+def download(
+        url: str,
+        out_path: Path,
+        session=None,
+        timeout=DEFAULT_TIMEOUT,
+        etag=None,
+        integrity=None,
+        resume=True,
+        retries=DEFAULT_RETRIES,
+        backoff=DEFAULT_BACKOFF,
+        progress=None,
+        chunk_size=CHUNK_SIZE):
+    """
+    Stream `url` to `out_path`, which is only replaced once the whole body
+    arrived and checked out.
+
+    - `etag`: make the request conditional, a 304 leaves out_path alone.
+    - `integrity`: "sha384-<base64>" or "sha256:<hex>", a mismatch raises
+      IntegrityError.
+    - `resume`: keep "<name>.part" between attempts and runs and continue it
+      with a Range request (only if the server sent a strong ETag or
+      Last-Modified to validate it with). Asks for the body without
+      Content-Encoding, so offsets are the file's own bytes.
+    - `retries`/`backoff`: connection errors, timeouts, truncated bodies
+      and 408/429/5xx are retried with exponential backoff and jitter.
+    - `progress(done_bytes, total_bytes_or_None)` is called per chunk.
+
+    Don't download the same out_path from two places at once.
+    """
+    out_path = Path(out_path)
+    session = session or requests.Session()
+    start = time.perf_counter()
+    attempt = 0
+    while True:
+        attempt += 1
+        last = attempt > retries
+        try:
+            result = _attempt(url, out_path, session, timeout, etag, integrity, resume, progress, chunk_size, last)
+        except RETRY_EXCEPTIONS as e:
+            if last:
+                raise
+            time.sleep(_backoff_delay(attempt, backoff, getattr(e, "retry_after", None)))
+            continue
+        result.seconds = time.perf_counter() - start
+        result.attempts = attempt
+        return result
+
+
+def download_to_local(url: str, out_path: Path, parent_mkdir: bool = True, **kwargs):
     if not isinstance(out_path, Path):
         raise ValueError(f"{out_path} must be a Path object")
     if parent_mkdir:
         out_path.parent.mkdir(parents=True, exist_ok=True)
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        #Write the file out in binary mode to prevent any newline conversions.
-        out_path.write_bytes(response.content)
+        download(url, out_path, **kwargs)
         return True
-    except requests.RequestException as e:
+    except (requests.RequestException, IntegrityError, OSError) as e:
         print(f"Failed to downloading {url}: {e}")
         return False
 
 
+def pooled_session(pool_size=10):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+async def adownload(url: str, out_path: Path, **kwargs):
+    """
+    download() for asyncio code, run in the default thread pool (progress
+    callbacks are called from that thread).
+    """
+    return await asyncio.to_thread(download, url, out_path, **kwargs)
+
+
+async def adownload_many(items, concurrency=4, session=None, **kwargs):
+    """
+    Download (url, out_path) pairs with at most `concurrency` at a time over
+    one pooled session. Returns a DownloadResult, or the exception that
+    download failed with, per item in order.
+    """
+    session = session or pooled_session(concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _one(url, out_path):
+        async with semaphore:
+            return await adownload(url, out_path, session=session, **kwargs)
+
+    return await asyncio.gather(*(_one(url, out_path) for url, out_path in items), return_exceptions=True)
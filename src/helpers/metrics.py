@@ -0,0 +1,235 @@
+"""
+Small in-process metrics: counters, gauges and bucketed histograms kept
+per worker process. Metrics are created once by name and shared:
+
+    REQUEST_LATENCY = metrics.histogram("billing_request_seconds", "Stripe request latency")
+    REQUEST_LATENCY.observe(0.12)
+
+Labelled series are separate metrics whose name carries the labels, see key().
+Values read from elsewhere (e.g. a connection pool) are set by collectors,
+see register_collector().
+"""
+import bisect
+import threading
+
+#seconds, roughly Prometheus' default buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def snapshot(self):
+        return {"value": self._value}
+
+    def reset(self):
+        with self._lock:
+            self._value = 0
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help="", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            #the last slot counts values above the largest bucket
+            self._counts = [0] * (len(self.buckets) + 1)
+            self._sum = 0.0
+            self._count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def sum(self):
+        return self._sum
+
+    def cumulative_counts(self):
+        """
+        [(upper_bound, count of values <= upper_bound), ...] ending with +inf.
+        """
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float("inf"),), self._counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        """
+        Estimate the q-quantile (0-1) by interpolating inside its bucket.
+        """
+        if not self._count:
+            return None
+        rank = q * self._count
+        lower = 0.0
+        previous = 0
+        for bound, cumulative in self.cumulative_counts():
+            if cumulative >= rank:
+                if bound == float("inf"):
+                    return lower
+                in_bucket = cumulative - previous
+                fraction = (rank - previous) / in_bucket if in_bucket else 0
+                return lower + (bound - lower) * fraction
+            lower, previous = bound, cumulative
+        return lower
+
+    def snapshot(self):
+        return {
+            "count": self._count,
+            "sum": round(self._sum, 6),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _get_or_create(cls, name, help, **kwargs):
+    metric = _registry.get(name)
+    if metric is None:
+        with _registry_lock:
+            metric = _registry.get(name)
+            if metric is None:
+                metric = cls(name, help, **kwargs)
+                _registry[name] = metric
+    if type(metric) is not cls:
+        raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+    return metric
+
+
+def key(name, **labels):
+    """
+    Metric name with Prometheus-style labels: key("x", view="a") -> 'x{view="a"}'.
+    """
+    if not labels:
+        return name
+    pairs = ",".join(f'{label}="{_escape(value)}"' for label, value in sorted(labels.items()))
+    return f"{name}{{{pairs}}}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def split_key(name):
+    """
+    ('x', 'view="a"') for 'x{view="a"}', ('x', '') without labels.
+    """
+    if name.endswith("}") and "{" in name:
+        family, labels = name[:-1].split("{", 1)
+        return family, labels
+    return name, ""
+
+
+def counter(name, help=""):
+    return _get_or_create(Counter, name, help)
+
+
+def gauge(name, help=""):
+    return _get_or_create(Gauge, name, help)
+
+
+def histogram(name, help="", buckets=DEFAULT_BUCKETS):
+    return _get_or_create(Histogram, name, help, buckets=buckets)
+
+
+_collectors = []
+
+
+def register_collector(collector):
+    """
+    Register a callable that updates its gauges right before metrics are
+    read by snapshot() and render_prometheus().
+    """
+    if collector not in _collectors:
+        _collectors.append(collector)
+    return collector
+
+
+def collect():
+    for collector in list(_collectors):
+        collector()
+
+
+def get_metrics(prefix=""):
+    return {name: metric for name, metric in sorted(_registry.items()) if name.startswith(prefix)}
+
+
+def snapshot(prefix=""):
+    collect()
+    return {name: metric.snapshot() for name, metric in get_metrics(prefix).items()}
+
+
+def _series(name, labels, value, extra=""):
+    all_labels = ",".join(part for part in (labels, extra) if part)
+    return f"{name}{{{all_labels}}} {value}" if all_labels else f"{name} {value}"
+
+
+def render_prometheus(prefix=""):
+    """
+    The metrics of this process in the Prometheus text exposition format.
+    """
+    collect()
+    lines = []
+    seen = set()
+    #a family's series have to be contiguous
+    for name, metric in sorted(get_metrics(prefix).items(), key=lambda item: split_key(item[0])):
+        family, labels = split_key(name)
+        if family not in seen:
+            seen.add(family)
+            if metric.help:
+                lines.append(f"# HELP {family} {metric.help}")
+            lines.append(f"# TYPE {family} {metric.kind}")
+        if metric.kind != "histogram":
+            lines.append(_series(family, labels, metric.value))
+            continue
+        for bound, count in metric.cumulative_counts():
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(_series(f"{family}_bucket", labels, count, f'le="{le}"'))
+        lines.append(_series(f"{family}_sum", labels, metric.sum))
+        lines.append(_series(f"{family}_count", labels, metric.count))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,130 @@
+import datetime
+import logging
+import random
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import OutboxJob
+
+logger = logging.getLogger(__name__)
+
+Kind = OutboxJob.KindChoices
+Status = OutboxJob.StatusChoices
+
+#kind -> model that owns the stripe_id; the model implements create_stripe_id()
+STRIPE_JOB_MODELS = {
+    Kind.STRIPE_CUSTOMER: "customers.Customer",
+    Kind.STRIPE_PRODUCT: "subscriptions.Subscription",
+    Kind.STRIPE_PRICE: "subscriptions.SubscriptionPrice",
+}
+
+
+class JobNotReady(Exception):
+    """
+    The job can't run yet (e.g. a price whose product has no stripe_id),
+    it is retried with backoff like any other failure.
+    """
+    pass
+
+
+def billing_is_async():
+    return getattr(settings, "BILLING_ASYNC", True)
+
+
+def enqueue(kind, object_id):
+    enqueue_many(kind, [object_id])
+
+
+def enqueue_many(kind, object_ids, batch_size=1000):
+    """
+    Add pending jobs, skipping objects that already have one pending.
+    Call it inside the transaction that saves the objects.
+    """
+    OutboxJob.objects.bulk_create(
+        [OutboxJob(kind=kind, object_id=object_id) for object_id in object_ids],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+
+
+def claim_jobs(limit=10, lease=60):
+    """
+    Claim up to `limit` due jobs. Claimed jobs are pushed `lease` seconds
+    into the future so other workers skip them; if this worker dies they
+    become due again once the lease runs out.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutboxJob.objects.select_for_update(skip_locked=True)
+            .filter(status=Status.PENDING, run_after__lte=now)
+            .order_by("run_after", "id")
+            .values_list("id", flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        OutboxJob.objects.filter(id__in=ids).update(
+            run_after=now + datetime.timedelta(seconds=lease),
+            attempts=F("attempts") + 1,
+        )
+    return list(OutboxJob.objects.filter(id__in=ids).order_by("run_after", "id"))
+
+
+def run_stripe_job(job):
+    model = apps.get_model(STRIPE_JOB_MODELS[job.kind])
+    obj = model.objects.filter(pk=job.object_id).first()
+    if obj is None or obj.stripe_id:
+        #deleted or already synced, nothing to do
+        return None
+    #a re-run of the same job (crash, lost lease) returns the object Stripe already made
+    stripe_id = obj.create_stripe_id(idempotency_key=f"outbox-{job.kind}-{job.id}")
+    if not stripe_id:
+        raise JobNotReady(f"{model.__name__} {obj.pk} isn't ready to sync to Stripe")
+    #update() instead of save() so the model doesn't enqueue itself again
+    model.objects.filter(
+        Q(stripe_id__isnull=True) | Q(stripe_id=""),
+        pk=obj.pk,
+    ).update(stripe_id=stripe_id)
+    return stripe_id
+
+
+def backoff_delay(attempts, base=None, cap=None):
+    base = base if base is not None else getattr(settings, "OUTBOX_RETRY_BASE", 5)
+    cap = cap if cap is not None else getattr(settings, "OUTBOX_RETRY_MAX_DELAY", 3600)
+    delay = min(base * 2 ** max(attempts - 1, 0), cap)
+    #jitter so a burst of failures doesn't retry in lockstep
+    return delay * random.uniform(0.5, 1.0)
+
+
+def run_job(job, max_attempts=None):
+    """
+    Run a claimed job and record the outcome. Returns True on success.
+    """
+    max_attempts = max_attempts or getattr(settings, "OUTBOX_MAX_ATTEMPTS", 8)
+    try:
+        run_stripe_job(job)
+    except Exception as e:
+        logger.warning("Outbox job %s failed (attempt %s): %s", job.id, job.attempts, e)
+        if job.attempts >= max_attempts:
+            status = Status.FAILED
+            run_after = timezone.now()
+        else:
+            status = Status.PENDING
+            run_after = timezone.now() + datetime.timedelta(seconds=backoff_delay(job.attempts))
+        OutboxJob.objects.filter(id=job.id).update(
+            status=status,
+            run_after=run_after,
+            last_error=f"{type(e).__name__}: {e}",
+            updated=timezone.now(),
+        )
+        return False
+    OutboxJob.objects.filter(id=job.id).update(
+        status=Status.DONE,
+        last_error="",
+        updated=timezone.now(),
+    )
+    return True
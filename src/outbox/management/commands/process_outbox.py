@@ -0,0 +1,53 @@
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from typing import Any
+
+from outbox.jobs import claim_jobs, run_job
+
+
+def _run_in_thread(job, max_attempts):
+    #worker threads keep their own connection, drop it if it went stale
+    close_old_connections()
+    return run_job(job, max_attempts=max_attempts)
+
+
+class Command(BaseCommand):
+
+    """ Run pending outbox jobs (Stripe side-effects of model saves) """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=4,
+                            help="Number of jobs to run at the same time")
+        parser.add_argument("--batch-size", type=int, default=20,
+                            help="Number of jobs claimed per round")
+        parser.add_argument("--poll-interval", type=float, default=2.0,
+                            help="Seconds to wait when there is nothing to do")
+        parser.add_argument("--lease", type=int, default=60,
+                            help="Seconds a claimed job is hidden from other workers")
+        parser.add_argument("--max-attempts", type=int,
+                            default=getattr(settings, "OUTBOX_MAX_ATTEMPTS", 8))
+        parser.add_argument("--once", action="store_true",
+                            help="Exit once no jobs are due instead of polling")
+
+    def handle(self, *args: Any, **options: Any):
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            while True:
+                jobs = claim_jobs(limit=options["batch_size"], lease=options["lease"])
+                if not jobs:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+                    continue
+                results = pool.map(lambda job: _run_in_thread(job, options["max_attempts"]), jobs)
+                for job, ok in zip(jobs, results):
+                    if ok:
+                        done += 1
+                    else:
+                        failed += 1
+                        self.stderr.write(self.style.WARNING(f"Job {job.id} ({job.kind} #{job.object_id}) failed, attempt {job.attempts}"))
+        self.stdout.write(self.style.SUCCESS(f"Processed outbox: {done} done, {failed} failed."))
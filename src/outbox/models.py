@@ -0,0 +1,49 @@
+from django.db import models
+from django.utils import timezone
+
+# Create your models here.
+
+class OutboxJob(models.Model):
+    """
+    A side-effect (e.g. "create this customer in Stripe") that has to happen
+    after a row is saved. Jobs are written in the same transaction as the
+    row and run later by the process_outbox command.
+    """
+    class KindChoices(models.TextChoices):
+        STRIPE_CUSTOMER = "stripe_customer", "Create Stripe customer"
+        STRIPE_PRODUCT = "stripe_product", "Create Stripe product"
+        STRIPE_PRICE = "stripe_price", "Create Stripe price"
+
+    class StatusChoices(models.TextChoices):
+        PENDING = "pending", "Pending"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    kind = models.CharField(max_length=50, choices=KindChoices.choices)
+    object_id = models.BigIntegerField()
+    status = models.CharField(max_length=20,
+                              default=StatusChoices.PENDING,
+                              choices=StatusChoices.choices
+                              )
+    attempts = models.PositiveIntegerField(default=0)
+    #the job isn't picked up before this, used for backoff and for claiming
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    timestamp = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="outbox_due_idx"),
+        ]
+        constraints = [
+            #at most one pending job per object and kind
+            models.UniqueConstraint(
+                fields=["kind", "object_id"],
+                condition=models.Q(status="pending"),
+                name="outbox_unique_pending_job",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.object_id} - {self.status}"
@@ -0,0 +1,140 @@
+import datetime
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+import helpers.billing
+from customers.models import Customer
+from helpers.billing.local import LocalBillingBackend
+
+from . import jobs
+from .jobs import Kind, Status, claim_jobs, run_job
+from .models import OutboxJob
+
+# Create your tests here.
+
+User = get_user_model()
+
+
+class BillingBackendMixin:
+    """
+    Customers with a confirmed email enqueue a Stripe customer job, run
+    against the offline billing backend.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.backend = LocalBillingBackend()
+        helpers.billing.set_backend(self.backend)
+        self.addCleanup(helpers.billing.set_backend, None)
+
+    def create_customer(self, username="member"):
+        user = User.objects.create(username=username, email=f"{username}@example.com")
+        return Customer.objects.create(user=user, init_email=user.email, init_email_confirmed=True)
+
+
+@override_settings(BILLING_ASYNC=True, OUTBOX_MAX_ATTEMPTS=3, OUTBOX_RETRY_BASE=10, OUTBOX_RETRY_MAX_DELAY=3600)
+class OutboxJobTests(BillingBackendMixin, TestCase):
+
+    def later(self, seconds):
+        return mock.patch.object(jobs.timezone, "now", return_value=timezone.now() + datetime.timedelta(seconds=seconds))
+
+    def test_save_enqueues_one_pending_job(self):
+        customer = self.create_customer()
+        customer.save()
+        job = OutboxJob.objects.get()
+        self.assertEqual((job.kind, job.object_id, job.status), (Kind.STRIPE_CUSTOMER, customer.pk, Status.PENDING))
+        self.assertIsNone(customer.stripe_id)
+
+    def test_claimed_job_is_leased(self):
+        self.create_customer()
+        [job] = claim_jobs(lease=60)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(claim_jobs(lease=60), [])
+        #the worker died, the job is due again once the lease ran out
+        with self.later(61):
+            [job] = claim_jobs(lease=60)
+        self.assertEqual(job.attempts, 2)
+
+    def test_claim_limit_and_order(self):
+        first, second, third = (self.create_customer(f"member{i}") for i in range(3))
+        self.assertEqual([job.object_id for job in claim_jobs(limit=2)], [first.pk, second.pk])
+        self.assertEqual([job.object_id for job in claim_jobs(limit=2)], [third.pk])
+
+    def test_run_job_creates_the_stripe_customer(self):
+        customer = self.create_customer()
+        [job] = claim_jobs()
+        self.assertTrue(run_job(job))
+        customer.refresh_from_db()
+        self.assertTrue(customer.stripe_id.startswith("cus_local"))
+        self.assertEqual(self.backend.retrieve(customer.stripe_id).email, customer.init_email)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Status.DONE)
+
+    def test_rerun_job_reuses_the_stripe_customer(self):
+        customer = self.create_customer()
+        [job] = claim_jobs()
+        with mock.patch.object(self.backend, "create_customer", wraps=self.backend.create_customer) as create:
+            run_job(job)
+            stripe_id = Customer.objects.get(pk=customer.pk).stripe_id
+            #crashed after Stripe answered, before the stripe_id was stored
+            Customer.objects.filter(pk=customer.pk).update(stripe_id=None)
+            run_job(job)
+        self.assertEqual(Customer.objects.get(pk=customer.pk).stripe_id, stripe_id)
+        self.assertEqual(self.backend.count("customer"), 1)
+        self.assertEqual(
+            [call.kwargs["idempotency_key"] for call in create.call_args_list],
+            [f"outbox-stripe_customer-{job.id}"] * 2,
+        )
+
+    def test_failed_job_is_retried_with_backoff(self):
+        self.backend.failure_rate = 1.0
+        self.create_customer()
+        [job] = claim_jobs()
+        before = timezone.now()
+        self.assertFalse(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Status.PENDING)
+        self.assertIn("Simulated billing failure", job.last_error)
+        #OUTBOX_RETRY_BASE with jitter
+        self.assertGreaterEqual(job.run_after, before + datetime.timedelta(seconds=5))
+        self.assertLessEqual(job.run_after, timezone.now() + datetime.timedelta(seconds=10))
+        self.assertEqual(claim_jobs(), [])
+
+    def test_backoff_doubles_up_to_the_cap(self):
+        with mock.patch.object(jobs.random, "uniform", return_value=1.0):
+            self.assertEqual([jobs.backoff_delay(attempts) for attempts in (1, 2, 3)], [10, 20, 40])
+            self.assertEqual(jobs.backoff_delay(20), 3600)
+
+    def test_job_fails_for_good_after_max_attempts(self):
+        self.backend.failure_rate = 1.0
+        customer = self.create_customer()
+        for attempt in range(1, 4):
+            with self.later(attempt * 3600):
+                [job] = claim_jobs()
+            self.assertEqual(job.attempts, attempt)
+            self.assertFalse(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Status.FAILED)
+        with self.later(10 * 3600):
+            self.assertEqual(claim_jobs(), [])
+        #a failed job doesn't block a new one for the same customer
+        jobs.enqueue(Kind.STRIPE_CUSTOMER, customer.pk)
+        self.assertEqual(OutboxJob.objects.filter(status=Status.PENDING).count(), 1)
+
+
+@override_settings(BILLING_ASYNC=True)
+class ProcessOutboxCommandTests(BillingBackendMixin, TransactionTestCase):
+    #the command runs jobs in worker threads with their own connections
+
+    def test_once_runs_every_due_job(self):
+        customers = [self.create_customer(f"member{i}") for i in range(3)]
+        stdout = StringIO()
+        call_command("process_outbox", "--once", "--concurrency", "2", stdout=stdout, stderr=StringIO())
+        self.assertIn("3 done, 0 failed", stdout.getvalue())
+        self.assertFalse(Customer.objects.filter(pk__in=[c.pk for c in customers], stripe_id__isnull=True).exists())
+        self.assertEqual(self.backend.count("customer"), 3)
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+INDEX_NAME = 'profiles_user_active_username_idx'
+
+
+def concurrently(schema_editor):
+    #PostgreSQL builds the index without locking auth_user against writes
+    return 'CONCURRENTLY ' if schema_editor.connection.vendor == 'postgresql' else ''
+
+
+def create_index(apps, schema_editor):
+    schema_editor.execute(
+        f'CREATE INDEX {concurrently(schema_editor)}IF NOT EXISTS {INDEX_NAME} ON auth_user (is_active, username);'
+    )
+
+
+def drop_index(apps, schema_editor):
+    schema_editor.execute(f'DROP INDEX {concurrently(schema_editor)}IF EXISTS {INDEX_NAME};')
+
+
+class Migration(migrations.Migration):
+
+    #CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        #keyset pagination in profile_list_view: WHERE is_active AND username > %s ORDER BY username
+        migrations.RunPython(create_index, drop_index, elidable=False),
+    ]
@@ -1,3 +1,153 @@
-from django.test import TestCase
+import json
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.db import OperationalError, connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from cfehome import routers
+from cfehome.querybudget import assert_query_budget
+from cfehome.routers import PRIMARY_COOKIE, ReplicaMiddleware, stream_from_replica, use_replica
 
 # Create your tests here.
+
+User = get_user_model()
+
+
+#no collectstatic manifest in tests
+@override_settings(STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}})
+class ProfileQueryBudgetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user("viewer", password="pw")
+        cls.viewer.user_permissions.add(Permission.objects.get(codename="view_user"))
+        User.objects.bulk_create([User(username=f"member{i:03d}") for i in range(60)])
+
+    def setUp(self):
+        #permissions are cached per user, start from a cold cache
+        cache.clear()
+        self.client.force_login(self.viewer)
+
+    def test_profile_list(self):
+        response = assert_query_budget(self.client, "/profiles/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["object_list"]), 50)
+
+    def test_profile_list_next_page(self):
+        response = assert_query_budget(self.client, "/profiles/?after=member049")
+        self.assertEqual(len(response.context["object_list"]), 11)
+
+    def test_profile_detail(self):
+        with self.assertLogs("profiles.views", "DEBUG"):
+            response = assert_query_budget(self.client, "/profiles/member001/")
+        self.assertEqual(response.status_code, 200)
+
+
+class ProfileListJsonTests(TestCase):
+
+    def test_anonymous_is_sent_to_the_login_page(self):
+        response = self.client.get("/profiles/users.json")
+        self.assertRedirects(response, f"{settings.LOGIN_URL}?next=/profiles/users.json", fetch_redirect_response=False)
+
+    def test_staff_gets_every_active_user(self):
+        staff = User.objects.create_user("staff", is_staff=True)
+        User.objects.create_user("inactive", is_active=False)
+        self.client.force_login(staff)
+        response = self.client.get("/profiles/users.json")
+        data = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(data, [{"id": staff.pk, "username": "staff"}])
+
+
+#python manage.py test --settings=cfehome.test_settings
+HAS_REPLICA = "replica1" in settings.DATABASES
+
+
+@skipUnless(HAS_REPLICA, "needs the replica1 database of cfehome.test_settings")
+@override_settings(
+    DATABASE_REPLICAS=["replica1"],
+    DATABASE_ROUTERS=["cfehome.routers.ReplicaRouter"],
+    REPLICA_STICKY_SECONDS=5,
+    REPLICA_RETRY_AFTER=30,
+)
+class ReplicaRouterTests(TestCase):
+    #replica1 has a test database of its own, it never sees rows written to default
+    databases = {"default", "replica1"} if HAS_REPLICA else {"default"}
+
+    def setUp(self):
+        routers._unavailable.clear()
+        self.addCleanup(routers._unavailable.clear)
+
+    @staticmethod
+    def user_exists(username):
+        return User.objects.filter(username=username).exists()
+
+    def view(self, request):
+        if request.method == "POST":
+            User.objects.create(username="written")
+            return HttpResponse()
+        with use_replica():
+            return HttpResponse(str(self.user_exists("written")))
+
+    def test_replica_reads_miss_primary_writes(self):
+        User.objects.create(username="written")
+        with use_replica():
+            self.assertFalse(self.user_exists("written"))
+        self.assertTrue(self.user_exists("written"))
+
+    def test_reads_after_a_write_stay_on_the_primary(self):
+        with use_replica():
+            User.objects.create(username="written")
+            self.assertTrue(self.user_exists("written"))
+
+    def test_post_that_wrote_pins_the_client(self):
+        middleware = ReplicaMiddleware(self.view)
+        response = middleware(RequestFactory().post("/"))
+        cookie = response.cookies[PRIMARY_COOKIE]
+        self.assertEqual(cookie["max-age"], 5)
+        request = RequestFactory().get("/")
+        request.COOKIES[PRIMARY_COOKIE] = cookie.value
+        self.assertEqual(middleware(request).content, b"True")
+        #without the cookie the read goes to the replica, which lags
+        self.assertEqual(middleware(RequestFactory().get("/")).content, b"False")
+
+    def test_get_does_not_pin_the_client(self):
+        response = ReplicaMiddleware(self.view)(RequestFactory().get("/"))
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+
+    def test_unreachable_replica_is_skipped(self):
+        User.objects.create(username="written")
+        down = mock.patch.object(
+            connections["replica1"], "ensure_connection", side_effect=OperationalError("connection refused"),
+        )
+        with down as ensure_connection, mock.patch.object(routers.time, "monotonic", return_value=1000.0):
+            with self.assertLogs("cfehome.routers", "WARNING"), use_replica():
+                #falls back to the primary
+                self.assertTrue(self.user_exists("written"))
+            with use_replica():
+                self.assertTrue(self.user_exists("written"))
+            self.assertEqual(ensure_connection.call_count, 1)
+        self.assertEqual(routers._unavailable["replica1"], 1030.0)
+        #retried after REPLICA_RETRY_AFTER
+        with mock.patch.object(routers.time, "monotonic", return_value=1030.0), use_replica():
+            self.assertFalse(self.user_exists("written"))
+
+    def test_stream_keeps_the_request_pinning(self):
+        User.objects.create(username="written")
+
+        def rows():
+            yield str(self.user_exists("written"))
+
+        def view(request):
+            return StreamingHttpResponse(stream_from_replica(rows()))
+
+        middleware = ReplicaMiddleware(view)
+        pinned = RequestFactory().get("/")
+        pinned.COOKIES[PRIMARY_COOKIE] = "1"
+        #the body is produced after the middleware returned
+        self.assertEqual(b"".join(middleware(pinned).streaming_content), b"True")
+        self.assertEqual(b"".join(middleware(RequestFactory().get("/")).streaming_content), b"False")
@@ -8,6 +8,7 @@ from . import views
 
 urlpatterns = [
     path('', views.profile_list_view),
+    path('users.json', views.profile_list_json_view),
     path('<username>/', views.profile_detail_view),
 
 ]
@@ -1,34 +1,93 @@
+import json
+import logging
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 
 from django.contrib.auth import get_user_model
 
+from cfehome.querybudget import query_budget
+from cfehome.routers import stream_from_replica, use_replica
+
 # Create your views here.
 
 User = get_user_model()
 
-@login_required
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = getattr(settings, "PROFILES_PAGE_SIZE", 50)
+
+
+def active_users_after(after=None):
+    """
+    Active users ordered by username, starting after the `after` username
+    (keyset pagination on the (is_active, username) index). Only the
+    columns the list needs are loaded.
+    """
+    qs = User.objects.filter(is_active=True).order_by("username").only("id", "username")
+    if after:
+        qs = qs.filter(username__gt=after)
+    return qs
 
-def profile_list_view(request, *args, **kwargs):
 
+#session, user, its 2 permission queries, page of users
+@query_budget(5)
+@login_required
+@use_replica
+def profile_list_view(request, *args, **kwargs):
+    object_list = []
+    next_cursor = None
+    #the template only lists users for this permission, don't query otherwise
+    if request.user.has_perm("auth.view_user"):
+        object_list = list(active_users_after(request.GET.get("after"))[:PAGE_SIZE + 1])
+        if len(object_list) > PAGE_SIZE:
+            object_list = object_list[:PAGE_SIZE]
+            next_cursor = object_list[-1].username
     context = {
-        "object_list": User.objects.filter(is_active=True)
+        "object_list": object_list,
+        "next_cursor": next_cursor,
     }
 
     return render(request, "profiles/list.html", context)
 
+
+def _stream_users_json(batch_size=1000):
+    #walk the index one page at a time, memory stays flat
+    yield "["
+    after = None
+    first = True
+    while True:
+        page = list(active_users_after(after).values_list("id", "username")[:batch_size])
+        for user_id, username in page:
+            yield ("" if first else ",") + json.dumps({"id": user_id, "username": username})
+            first = False
+        if len(page) < batch_size:
+            break
+        after = page[-1][1]
+    yield "]"
+
+
+@staff_member_required(login_url=settings.LOGIN_URL)
+def profile_list_json_view(request, *args, **kwargs):
+    return StreamingHttpResponse(stream_from_replica(_stream_users_json()), content_type="application/json")
+
+#session, user, profile user, 2 permission queries when debug logging is on
+@query_budget(5)
 @login_required
 def profile_detail_view(request, username=None, *args, **kwargs):
     user = request.user
-    print(
-        user.has_perm("subscriptions.basic"),
-        user.has_perm("subscriptions.basic_ai"),
-        user.has_perm("subscriptions.pro"),
-        user.has_perm("subscriptions.advanced"),
-
-                      
-    )
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "Plan permissions of user %s: basic=%s basic_ai=%s pro=%s advanced=%s",
+            user.pk,
+            user.has_perm("subscriptions.basic"),
+            user.has_perm("subscriptions.basic_ai"),
+            user.has_perm("subscriptions.pro"),
+            user.has_perm("subscriptions.advanced"),
+        )
     #user_groups = user.groups.all()
     #print("user_groups", user_groups)
     #if user_groups.filter(name="basic").exists():
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SubscriptionsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'subscriptions'
+
+    def ready(self):
+        #connects the cache invalidation signals
+        from . import backends, groups  # noqa: F401
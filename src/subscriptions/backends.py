@@ -0,0 +1,151 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .groups import user_groups_reconciled
+from .models import Subscription, UserSubscription
+
+User = get_user_model()
+
+CACHE_ALIAS = "permissions"
+VERSION_KEY = "subscriptions:perms:version"
+
+
+def permission_cache():
+    """
+    The "permissions" cache, None when it isn't shared between workers: a
+    per-process cache would keep permissions that another worker revoked.
+    """
+    if CACHE_ALIAS not in settings.CACHES:
+        return None
+    cache = caches[CACHE_ALIAS]
+    if isinstance(cache, LocMemCache):
+        return None
+    return cache
+
+
+def _version(cache):
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(VERSION_KEY, version, None)
+    return version
+
+
+def perm_cache_key(user_id, version=None):
+    return f"subscriptions:perms:{version or _version(permission_cache())}:{user_id}"
+
+
+def _delete_user_permissions(user_ids):
+    cache = permission_cache()
+    if cache is not None:
+        version = _version(cache)
+        cache.delete_many([perm_cache_key(user_id, version) for user_id in user_ids])
+
+
+def _bump_version():
+    cache = permission_cache()
+    if cache is None:
+        return
+    #new version, every old key is ignored and expires on its own
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
+
+
+#both run now and again on commit, a read before the commit would cache the old permissions
+
+def invalidate_user_permissions(user_ids):
+    if permission_cache() is None:
+        return
+    user_ids = list(user_ids)
+    _delete_user_permissions(user_ids)
+    transaction.on_commit(lambda: _delete_user_permissions(user_ids))
+
+
+def invalidate_all_permissions():
+    if permission_cache() is None:
+        return
+    _bump_version()
+    transaction.on_commit(_bump_version)
+
+
+class CachedPermissionBackend(ModelBackend):
+    """
+    ModelBackend whose per-user permission set is kept in the "permissions"
+    cache, so has_perm() (e.g. the subscriptions.* feature checks or
+    {{ perms }} in templates) costs no queries once a user's permissions
+    are cached.
+
+    Entries are dropped when the user's groups, permissions or subscription
+    change and all of them when a group's or subscription's permissions
+    change. Without a shared "permissions" cache it behaves like
+    ModelBackend.
+    """
+
+    def get_all_permissions(self, user_obj, obj=None):
+        cache = permission_cache()
+        if cache is None:
+            return super().get_all_permissions(user_obj, obj)
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, "_perm_cache"):
+            key = perm_cache_key(user_obj.pk, _version(cache))
+            perms = cache.get(key)
+            if perms is None:
+                perms = super().get_all_permissions(user_obj)
+                cache.set(key, perms, getattr(settings, "PERMISSION_CACHE_TIMEOUT", 60))
+            #ModelBackend subclasses (allauth's backend) reuse this too
+            user_obj._perm_cache = perms
+        return user_obj._perm_cache
+
+
+def _membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        #user.groups / user.user_permissions changed
+        invalidate_user_permissions([instance.pk])
+    elif pk_set:
+        #group.user_set changed
+        invalidate_user_permissions(pk_set)
+    else:
+        invalidate_all_permissions()
+
+
+def _user_saved(sender, instance, **kwargs):
+    #is_active / is_superuser may have changed
+    invalidate_user_permissions([instance.pk])
+
+
+def _user_subscription_changed(sender, instance, **kwargs):
+    invalidate_user_permissions([instance.user_id])
+
+
+def _users_reconciled(sender, user_ids, **kwargs):
+    invalidate_user_permissions(user_ids)
+
+
+def _permissions_changed(sender, **kwargs):
+    action = kwargs.get("action")
+    if action is None or action.startswith("post_"):
+        invalidate_all_permissions()
+
+
+m2m_changed.connect(_membership_changed, sender=User.groups.through)
+m2m_changed.connect(_membership_changed, sender=User.user_permissions.through)
+post_save.connect(_user_saved, sender=User)
+post_save.connect(_user_subscription_changed, sender=UserSubscription)
+post_delete.connect(_user_subscription_changed, sender=UserSubscription)
+user_groups_reconciled.connect(_users_reconciled)
+m2m_changed.connect(_permissions_changed, sender=Group.permissions.through)
+m2m_changed.connect(_permissions_changed, sender=Subscription.permissions.through)
+post_save.connect(_permissions_changed, sender=Subscription)
+post_delete.connect(_permissions_changed, sender=Group)
+post_delete.connect(_permissions_changed, sender=Permission)
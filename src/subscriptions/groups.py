@@ -0,0 +1,102 @@
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.dispatch import Signal
+
+from .models import Subscription
+
+#sent after reconcile_user_groups() changed memberships without m2m signals
+user_groups_reconciled = Signal()  # kwargs: user_ids
+
+
+def get_subscription_groups():
+    """
+    Returns (groups by subscription id, ids of groups owned by any active
+    subscription) in one query.
+
+    Not cached: the map decides which memberships are written, so callers
+    read it inside the transaction that writes them.
+    """
+    groups_by_sub = defaultdict(set)
+    active_group_ids = set()
+    rows = Subscription.groups.through.objects.values_list(
+        "subscription_id", "group_id", "subscription__active"
+    )
+    for sub_id, group_id, active in rows:
+        groups_by_sub[sub_id].add(group_id)
+        if active:
+            active_group_ids.add(group_id)
+    return dict(groups_by_sub), active_group_ids
+
+
+def desired_group_ids(subscription_id, current_group_ids, groups_by_sub, active_group_ids, allow_custom_groups=True):
+    """
+    The user keeps the groups of their own subscription plus any custom
+    groups that no active subscription owns.
+    """
+    sub_group_ids = groups_by_sub.get(subscription_id, set())
+    if not allow_custom_groups:
+        return set(sub_group_ids)
+    return (set(current_group_ids) - active_group_ids) | sub_group_ids
+
+
+def reconcile_user_subscription(user_subscription, allow_custom_groups=True):
+    """
+    Bring one user's groups in line with their subscription. Two queries
+    when nothing changes, add/remove only the difference otherwise.
+    """
+    user = user_subscription.user
+    with transaction.atomic():
+        groups_by_sub, active_group_ids = get_subscription_groups()
+        current = set(user.groups.values_list("id", flat=True))
+        desired = desired_group_ids(
+            user_subscription.subscription_id, current,
+            groups_by_sub, active_group_ids, allow_custom_groups,
+        )
+        to_remove = current - desired
+        to_add = desired - current
+        if to_remove:
+            user.groups.remove(*to_remove)
+        if to_add:
+            user.groups.add(*to_add)
+    return to_add, to_remove
+
+
+def reconcile_user_groups(user_subscriptions, allow_custom_groups=True, chunk_size=500):
+    """
+    Bulk version of reconcile_user_subscription for a queryset of
+    UserSubscription (e.g. after a plan migration). Per chunk of users it
+    reads the subscription groups and the memberships once, deletes per
+    group and inserts with one bulk_create, in one transaction. Returns
+    (memberships added, memberships removed).
+    """
+    UserGroup = get_user_model().groups.through
+    rows = list(user_subscriptions.order_by("user_id").values_list("user_id", "subscription_id"))
+    added = removed = 0
+    for i in range(0, len(rows), chunk_size):
+        chunk = dict(rows[i:i + chunk_size])
+        with transaction.atomic():
+            groups_by_sub, active_group_ids = get_subscription_groups()
+            current = defaultdict(set)
+            for user_id, group_id in UserGroup.objects.filter(user_id__in=chunk.keys()).values_list("user_id", "group_id"):
+                current[user_id].add(group_id)
+            to_add = []
+            to_remove = defaultdict(list)  # group id -> user ids
+            for user_id, subscription_id in chunk.items():
+                desired = desired_group_ids(
+                    subscription_id, current[user_id],
+                    groups_by_sub, active_group_ids, allow_custom_groups,
+                )
+                to_add += [UserGroup(user_id=user_id, group_id=group_id) for group_id in desired - current[user_id]]
+                for group_id in current[user_id] - desired:
+                    to_remove[group_id].append(user_id)
+            for group_id, user_ids in to_remove.items():
+                removed += UserGroup.objects.filter(group_id=group_id, user_id__in=user_ids).delete()[0]
+            UserGroup.objects.bulk_create(to_add, ignore_conflicts=True)
+        added += len(to_add)
+        changed = {obj.user_id for obj in to_add} | {u for user_ids in to_remove.values() for u in user_ids}
+        if changed:
+            user_groups_reconciled.send(sender=UserGroup, user_ids=changed)
+    return added, removed
+
@@ -0,0 +1,106 @@
+import csv
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from typing import Any
+
+from subscriptions.models import Subscription, UserSubscription
+from subscriptions.replan import Checkpoint, replan_users
+
+User = get_user_model()
+
+
+def get_subscription(value):
+    qs = Subscription.objects.filter(id=value) if value.isdigit() else Subscription.objects.filter(name=value)
+    sub = qs.first()
+    if sub is None:
+        raise CommandError(f"Subscription {value!r} not found")
+    return sub
+
+
+def existing_user_ids(user_ids):
+    """
+    (ids of existing users, ids without a user)
+    """
+    user_ids = set(user_ids)
+    found = set()
+    ids = sorted(user_ids)
+    for i in range(0, len(ids), 1000):
+        found.update(User.objects.filter(pk__in=ids[i:i + 1000]).values_list("id", flat=True))
+    return found, user_ids - found
+
+
+def read_csv_user_ids(path):
+    """
+    User ids from a CSV with a user_id, username or email column.
+    """
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        fields = reader.fieldnames or []
+        column = next((name for name in ("user_id", "username", "email") if name in fields), None)
+        if column is None:
+            raise CommandError(f"{path} needs a user_id, username or email column")
+        values = [row[column].strip() for row in reader if row[column].strip()]
+    if column == "user_id":
+        try:
+            return [int(value) for value in values]
+        except ValueError as e:
+            raise CommandError(f"{path}: {e}")
+    ids = []
+    for i in range(0, len(values), 1000):
+        ids += User.objects.filter(**{f"{column}__in": values[i:i + 1000]}).values_list("id", flat=True)
+    return ids
+
+
+class Command(BaseCommand):
+
+    """ Move many users to another subscription plan with bulk updates """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--to", required=True, help="Target subscription id or name")
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument("--from", dest="from_sub", help="Move every user on this subscription (id or name)")
+        source.add_argument("--csv", help="CSV file with a user_id, username or email column")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--checkpoint", help="JSON file to record progress in and resume from")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args: Any, **options: Any):
+        target = get_subscription(options["to"])
+        if options["csv"]:
+            user_ids, unknown = existing_user_ids(read_csv_user_ids(options["csv"]))
+            if unknown:
+                #bulk_create would fail the chunk on the user foreign key
+                shown = ", ".join(str(user_id) for user_id in sorted(unknown)[:20])
+                self.stderr.write(f"Skipping {len(unknown)} unknown user ids: {shown}{'...' if len(unknown) > 20 else ''}")
+        else:
+            source = get_subscription(options["from_sub"])
+            user_ids = UserSubscription.objects.filter(subscription=source).values_list("user_id", flat=True)
+        user_ids = list(user_ids)
+        if options["dry_run"]:
+            self.stdout.write(f"Would move {len(set(user_ids))} users to {target}.")
+            return
+        checkpoint = None
+        if options["checkpoint"]:
+            try:
+                checkpoint = Checkpoint(options["checkpoint"], target.id)
+            except ValueError as e:
+                raise CommandError(str(e))
+            if checkpoint.last_user_id is not None:
+                self.stdout.write(f"Resuming after user {checkpoint.last_user_id} ({checkpoint.done} done).")
+        start = time.perf_counter()
+
+        def progress(done, total):
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"{done}/{total} users ({elapsed:.1f}s)")
+
+        moved = replan_users(
+            user_ids, target,
+            chunk_size=options["chunk_size"],
+            checkpoint=checkpoint,
+            progress=progress,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Moved {moved} users to {target} in {time.perf_counter() - start:.1f}s.")
+        )
@@ -1,22 +1,30 @@
+from django.contrib.auth.models import Group, Permission
 from django.core.management.base import BaseCommand
-from subscriptions.models import Subscription
+from subscriptions.sync import sync_subscription_permissions
 from typing import Any
 
 
 class Command(BaseCommand):
 
-    """ Sync subscriptions permissions to user groups """
+    """ Sync subscriptions permissions to user groups, a group in several active subscriptions gets all of their permissions """
 
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Report what would change without writing anything")
 
     def handle(self, *args:Any, **options: Any):
-        qs = Subscription.objects.filter(active=True)
-        for obj in qs:
-            #print(obj.groups.all())
-            sub_perms = obj.permissions.all()
-            for group in obj.groups.all():
-                group.permissions.set(sub_perms)
-                #for per in obj.permissions.all():
-                #    group.permissions.add(per)
-            #print(obj.permissions.all())
-
-
+        result = sync_subscription_permissions(dry_run=options["dry_run"])
+        if options["verbosity"] > 1 and result.changed:
+            groups = dict(Group.objects.values_list("id", "name"))
+            perms = dict(Permission.objects.values_list("id", "codename"))
+            for sign, changes in (("+", result.added), ("-", result.removed)):
+                for group_id, perm_id in changes:
+                    self.stdout.write(f"  {sign} {groups.get(group_id)}: {perms.get(perm_id)}")
+        timings = ", ".join(f"{phase} {seconds * 1000:.1f}ms" for phase, seconds in result.timings.items())
+        prefix = "Would add" if options["dry_run"] else "Added"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{prefix} {len(result.added)} and {'remove' if options['dry_run'] else 'removed'} "
+                f"{len(result.removed)} group permissions ({timings})."
+            )
+        )
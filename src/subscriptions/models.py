@@ -1,5 +1,6 @@
 import helpers.billing
-from django.db import models
+import outbox.jobs
+from django.db import models, transaction
 from django.contrib.auth.models import Group, Permission
 from django.db.models.signals import post_save
 from django.conf import settings
@@ -38,16 +39,23 @@ class Subscription(models.Model):
     class Meta:
         permissions = SUBSCRIPTION_PERMISSIONS
 
+    def create_stripe_id(self, idempotency_key=None):
+        return helpers.billing.create_product(
+                                name=self.name,
+                                metadata={"subscription_plan_id": self.id},
+                                raw=False,
+                                idempotency_key=idempotency_key)
+
     def save(self, *args, **kwargs):
-             
-        if not self.stripe_id:
-            stripe_id = helpers.billing.create_product(
-                                    name=self.name, 
-                                    metadata={"subscription_plan_id": self.id},
-                                    raw=False)
-            self.stripe_id = stripe_id
-                    
-        super().save(*args, **kwargs)
+        needs_stripe_id = not self.stripe_id
+        if needs_stripe_id and not outbox.jobs.billing_is_async():
+            self.stripe_id = self.create_stripe_id()
+            needs_stripe_id = False
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if needs_stripe_id:
+                #the Stripe product is created by the process_outbox worker
+                outbox.jobs.enqueue(outbox.jobs.Kind.STRIPE_PRODUCT, self.pk)
 
 
 class SubscriptionPrice(models.Model):
@@ -83,20 +91,29 @@ class SubscriptionPrice(models.Model):
         return self.subscription.stripe_id
     
 
+    def create_stripe_id(self, idempotency_key=None):
+        #None until the subscription's product exists in Stripe
+        return helpers.billing.create_price(
+                        currency=self.stripe_currency,
+                        unit_amount=self.stripe_price,
+                        interval=self.interval,
+                        product=self.product_stripe_id,
+                        metadata={"subscription_plan_price_id": self.id},
+                        raw=False,
+                        idempotency_key=idempotency_key,
+        )
+
     def save(self, *args, **kwargs):
-        if (not self.stripe_id and 
-            self.product_stripe_id is not None):
-            
-            stripe_id = helpers.billing.create_price(
-                            currency=self.stripe_currency,
-                            unit_amount=self.stripe_price,
-                            interval=self.interval,
-                            product=self.product_stripe_id,
-                            metadata={"subscription_plan_price_id": self.id},
-                            raw=False
-            )
-            self.stripe_id = stripe_id
-        super().save(*args, **kwargs)
+        needs_stripe_id = not self.stripe_id and self.subscription_id is not None
+        if needs_stripe_id and not outbox.jobs.billing_is_async():
+            if self.product_stripe_id is not None:
+                self.stripe_id = self.create_stripe_id()
+            needs_stripe_id = False
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if needs_stripe_id:
+                #the outbox worker retries until the product has a stripe_id
+                outbox.jobs.enqueue(outbox.jobs.Kind.STRIPE_PRICE, self.pk)
 
 class UserSubscription(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -107,25 +124,8 @@ class UserSubscription(models.Model):
         return f"{self.user.username} - {self.subscription.name if self.subscription else 'No Subscription'}"
 
 def user_sub_post_save(sender, instance, created, *args, **kwargs):
-    usr_sub_instance = instance
-    user = usr_sub_instance.user
-    subscription_obj = usr_sub_instance.subscription
-    groups_ids = []
-    if subscription_obj is not None:
-        groups = subscription_obj.groups.all()
-        groups_ids = groups.values_list("id", flat=True)
-    if not ALLOW_CUSTOM_GROUPS:
-        user.groups.set(groups_ids) #set the groups to the user according to the subscription
-    else:
-        subs_qs = Subscription.objects.filter(active = True)
-        if subscription_obj is not None:
-            subs_qs = subs_qs.exclude(id = subscription_obj.id)
-        subs_groups = subs_qs.values_list("groups__id", flat=True)
-        subs_groups_set = set(subs_groups)
-        current_groups = user.groups.all().values_list('id', flat=True) #[1,2,3]
-        groups_ids_set = set(groups_ids) 
-        current_groups_set = set(current_groups)-subs_groups_set
-        final_group_ids = list(groups_ids_set | current_groups_set)
-        user.groups.set(final_group_ids)
-
-post_save.connect(user_sub_post_save, sender=UserSubscription)
\ No newline at end of file
+    #only writes the memberships that differ, see subscriptions.groups
+    from .groups import reconcile_user_subscription
+    reconcile_user_subscription(instance, allow_custom_groups=ALLOW_CUSTOM_GROUPS)
+
+post_save.connect(user_sub_post_save, sender=UserSubscription)
@@ -0,0 +1,96 @@
+import json
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from .groups import get_subscription_groups, user_groups_reconciled
+from .models import ALLOW_CUSTOM_GROUPS, UserSubscription
+
+
+class Checkpoint:
+    """
+    Remembers the last user id moved to a plan in a small JSON file, so an
+    interrupted re-plan can pick up where it stopped.
+    """
+
+    def __init__(self, path, target_id):
+        self.path = Path(path)
+        self.target_id = target_id
+        self.last_user_id = None
+        self.done = 0
+        if self.path.exists():
+            data = json.loads(self.path.read_text())
+            if data.get("target_id") != target_id:
+                raise ValueError(f"{self.path} is a checkpoint for subscription {data.get('target_id')}, not {target_id}")
+            self.last_user_id = data.get("last_user_id")
+            self.done = data.get("done", 0)
+
+    def save(self, last_user_id, done):
+        self.last_user_id = last_user_id
+        self.done = done
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({
+            "target_id": self.target_id,
+            "last_user_id": last_user_id,
+            "done": done,
+        }))
+        tmp_path.replace(self.path)
+
+
+def _replan_chunk(user_ids, target):
+    UserGroup = get_user_model().groups.through
+    target_id = target.id if target is not None else None
+    with transaction.atomic():
+        groups_by_sub, active_group_ids = get_subscription_groups()
+        target_group_ids = groups_by_sub.get(target_id, set())
+        existing = set(
+            UserSubscription.objects.filter(user_id__in=user_ids).values_list("user_id", flat=True)
+        )
+        #update() and bulk_create() skip the per-row post_save signal,
+        #memberships are fixed below for the whole chunk at once
+        UserSubscription.objects.filter(user_id__in=existing).update(subscription_id=target_id)
+        UserSubscription.objects.bulk_create(
+            [UserSubscription(user_id=user_id, subscription_id=target_id) for user_id in user_ids if user_id not in existing],
+        )
+        #same outcome as subscriptions.groups.desired_group_ids, as two statements
+        stale = UserGroup.objects.filter(user_id__in=user_ids)
+        if ALLOW_CUSTOM_GROUPS:
+            stale = stale.filter(group_id__in=active_group_ids - target_group_ids)
+        else:
+            stale = stale.exclude(group_id__in=target_group_ids)
+        stale.delete()
+        UserGroup.objects.bulk_create(
+            [UserGroup(user_id=user_id, group_id=group_id) for user_id in user_ids for group_id in target_group_ids],
+            ignore_conflicts=True,
+        )
+    user_groups_reconciled.send(sender=UserGroup, user_ids=set(user_ids))
+
+
+def replan_users(user_ids, target, chunk_size=1000, checkpoint=None, progress=None):
+    """
+    Move many users to the `target` Subscription (None to clear it).
+
+    `user_ids` is any iterable of user ids (or a values_list queryset).
+    Users are handled in ascending id order, `chunk_size` per transaction.
+    With a Checkpoint, users up to its last_user_id are skipped and it is
+    updated after each chunk. `progress(done, total)` is called per chunk.
+    Returns the number of users moved in this run.
+    """
+    ids = sorted(set(user_ids))
+    done = 0
+    if checkpoint is not None and checkpoint.last_user_id is not None:
+        ids = [user_id for user_id in ids if user_id > checkpoint.last_user_id]
+        done = checkpoint.done
+    total = done + len(ids)
+    moved = 0
+    for i in range(0, len(ids), chunk_size):
+        chunk = ids[i:i + chunk_size]
+        _replan_chunk(chunk, target)
+        moved += len(chunk)
+        done += len(chunk)
+        if checkpoint is not None:
+            checkpoint.save(chunk[-1], done)
+        if progress is not None:
+            progress(done, total)
+    return moved
@@ -0,0 +1,80 @@
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.contrib.auth.models import Group
+from django.db import transaction
+
+from .backends import invalidate_all_permissions
+from .models import Subscription
+
+
+@dataclass
+class PermissionSyncResult:
+    added: list = field(default_factory=list)  # (group id, permission id)
+    removed: list = field(default_factory=list)
+    timings: dict = field(default_factory=dict)  # phase -> seconds
+    applied: bool = False
+
+    @property
+    def changed(self):
+        return bool(self.added or self.removed)
+
+
+def sync_subscription_permissions(dry_run=False):
+    """
+    Give every group of an active subscription exactly the permissions of
+    the active subscriptions it belongs to. Loads the whole mapping in
+    three queries, then applies only the difference with bulk
+    deletes/inserts, all in one transaction so the diff is applied to the
+    rows it was computed from.
+
+    A group shared by several active subscriptions gets the union of their
+    permissions. The old per-subscription group.permissions.set() let the
+    last subscription processed win, so such groups may gain permissions
+    on the first run; groups of one subscription are unaffected.
+    """
+    result = PermissionSyncResult()
+    GroupPermission = Group.permissions.through
+
+    with transaction.atomic():
+        start = time.perf_counter()
+        sub_perms = defaultdict(set)
+        for sub_id, perm_id in Subscription.permissions.through.objects.filter(
+            subscription__active=True
+        ).values_list("subscription_id", "permission_id"):
+            sub_perms[sub_id].add(perm_id)
+        desired = defaultdict(set)
+        for sub_id, group_id in Subscription.groups.through.objects.filter(
+            subscription__active=True
+        ).values_list("subscription_id", "group_id"):
+            desired[group_id] |= sub_perms[sub_id]
+        current = defaultdict(set)
+        for group_id, perm_id in GroupPermission.objects.filter(
+            group_id__in=desired.keys()
+        ).values_list("group_id", "permission_id"):
+            current[group_id].add(perm_id)
+        result.timings["load"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for group_id, perm_ids in desired.items():
+            result.added += [(group_id, perm_id) for perm_id in sorted(perm_ids - current[group_id])]
+            result.removed += [(group_id, perm_id) for perm_id in sorted(current[group_id] - perm_ids)]
+        result.timings["diff"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if result.changed and not dry_run:
+            removed_by_group = defaultdict(list)
+            for group_id, perm_id in result.removed:
+                removed_by_group[group_id].append(perm_id)
+            for group_id, perm_ids in removed_by_group.items():
+                GroupPermission.objects.filter(group_id=group_id, permission_id__in=perm_ids).delete()
+            GroupPermission.objects.bulk_create(
+                [GroupPermission(group_id=group_id, permission_id=perm_id) for group_id, perm_id in result.added],
+                ignore_conflicts=True,
+            )
+            #bulk changes don't send m2m_changed, drop cached permission sets here
+            invalidate_all_permissions()
+            result.applied = True
+        result.timings["apply"] = time.perf_counter() - start
+    return result
@@ -1,3 +1,153 @@
-from django.test import TestCase
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+
+from . import backends
+from .backends import invalidate_all_permissions, perm_cache_key
+from .groups import reconcile_user_groups, reconcile_user_subscription
+from .models import Subscription, UserSubscription
+from .sync import sync_subscription_permissions
 
 # Create your tests here.
+
+class SubscriptionGroupsTests(TestCase):
+
+    def test_reconcile_reads_the_current_groups(self):
+        basic, pro = Group.objects.create(name="Basic"), Group.objects.create(name="Pro")
+        sub = Subscription.objects.create(name="Pro")
+        sub.groups.add(basic)
+        user = get_user_model().objects.create(username="member")
+        user_sub = UserSubscription.objects.create(user=user, subscription=sub)
+        self.assertEqual(set(user.groups.all()), {basic})
+        #no worker may keep an older map and write memberships from it
+        sub.groups.add(pro)
+        reconcile_user_subscription(user_sub)
+        self.assertEqual(set(user.groups.all()), {basic, pro})
+        sub.groups.remove(basic)
+        Subscription.objects.create(name="Basic").groups.add(basic)
+        self.assertEqual(reconcile_user_groups(UserSubscription.objects.all()), (0, 1))
+        self.assertEqual(set(user.groups.all()), {pro})
+
+
+class ReplanUsersCommandTests(TestCase):
+
+    def replan(self, csv_text):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as f:
+            f.write(csv_text)
+            f.flush()
+            stderr = StringIO()
+            call_command("replan_users", "--to", "Pro", "--csv", f.name, stdout=StringIO(), stderr=stderr)
+        return stderr.getvalue()
+
+    def test_unknown_user_ids_are_skipped(self):
+        Subscription.objects.create(name="Pro")
+        user = get_user_model().objects.create(username="known")
+        stderr = self.replan(f"user_id\n{user.pk}\n{user.pk + 100}\n")
+        self.assertIn(f"Skipping 1 unknown user ids: {user.pk + 100}", stderr)
+        self.assertEqual(UserSubscription.objects.get().user_id, user.pk)
+
+    def test_invalid_user_id(self):
+        Subscription.objects.create(name="Pro")
+        with self.assertRaisesMessage(CommandError, "invalid literal for int()"):
+            self.replan("user_id\nabc\n")
+
+
+def permissions_cache_settings(backend, location):
+    return override_settings(CACHES={**settings.CACHES, "permissions": {"BACKEND": backend, "LOCATION": location}})
+
+
+class PermissionCacheTests(TestCase):
+
+    def setUp(self):
+        self.location = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(permissions_cache_settings("django.core.cache.backends.filebased.FileBasedCache", self.location))
+        self.cache = caches["permissions"]
+
+    def has_perm(self, user, perm, worker=None):
+        #a fresh user object, as in the next request
+        user = get_user_model().objects.get(pk=user.pk)
+        if worker is None:
+            return user.has_perm(perm)
+        with mock.patch.object(backends, "permission_cache", return_value=worker):
+            return user.has_perm(perm)
+
+    def test_cache_filled_before_the_commit_is_dropped(self):
+        user = get_user_model().objects.create(username="member")
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                user.user_permissions.add(Permission.objects.get(codename="view_group"))
+                #another worker reading the committed permissions before this commit
+                self.cache.set(perm_cache_key(user.pk), set())
+        self.assertIsNone(self.cache.get(perm_cache_key(user.pk)))
+        self.assertTrue(self.has_perm(user, "auth.view_group"))
+
+    def test_version_is_bumped_again_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                invalidate_all_permissions()
+                key = perm_cache_key(1)
+                self.cache.set(key, set())
+        self.assertNotEqual(perm_cache_key(1), key)
+
+    def test_invalidation_reaches_other_workers(self):
+        #two processes sharing the cache directory
+        worker_a, worker_b = FileBasedCache(self.location, {}), FileBasedCache(self.location, {})
+        user = get_user_model().objects.create(username="member")
+        group = Group.objects.create(name="Pro")
+        user.groups.add(group)
+        self.assertFalse(self.has_perm(user, "auth.view_group", worker_b))
+        self.assertIsNotNone(worker_b.get(perm_cache_key(user.pk)))
+        with mock.patch.object(backends, "permission_cache", return_value=worker_a):
+            with self.captureOnCommitCallbacks(execute=True):
+                user.user_permissions.add(Permission.objects.get(codename="view_group"))
+        self.assertTrue(self.has_perm(user, "auth.view_group", worker_b))
+        with mock.patch.object(backends, "permission_cache", return_value=worker_a):
+            with self.captureOnCommitCallbacks(execute=True):
+                group.permissions.add(Permission.objects.get(codename="change_group"))
+        self.assertTrue(self.has_perm(user, "auth.change_group", worker_b))
+
+    def test_per_process_cache_is_not_used(self):
+        self.enterContext(permissions_cache_settings("django.core.cache.backends.locmem.LocMemCache", "permissions"))
+        self.assertIsNone(backends.permission_cache())
+        user = get_user_model().objects.create(username="member")
+        self.assertFalse(self.has_perm(user, "auth.view_group"))
+        with self.captureOnCommitCallbacks(execute=True):
+            user.user_permissions.add(Permission.objects.get(codename="view_group"))
+        self.assertTrue(self.has_perm(user, "auth.view_group"))
+
+
+class SyncSubscriptionPermissionsTests(TestCase):
+
+    def test_shared_group_gets_the_union(self):
+        view, change, delete = (Permission.objects.get(codename=f"{action}_group") for action in ("view", "change", "delete"))
+        shared, pro_only = Group.objects.create(name="Members"), Group.objects.create(name="Pro")
+        basic = Subscription.objects.create(name="Basic")
+        basic.groups.add(shared)
+        basic.permissions.add(view)
+        pro = Subscription.objects.create(name="Pro")
+        pro.groups.add(shared, pro_only)
+        pro.permissions.add(view, change)
+        inactive = Subscription.objects.create(name="Legacy", active=False)
+        inactive.groups.add(shared)
+        inactive.permissions.add(delete)
+        shared.permissions.add(delete)
+
+        result = sync_subscription_permissions(dry_run=True)
+        self.assertFalse(result.applied)
+        self.assertEqual(set(shared.permissions.all()), {delete})
+
+        result = sync_subscription_permissions()
+        self.assertTrue(result.applied)
+        self.assertEqual(set(shared.permissions.all()), {view, change})
+        self.assertEqual(set(pro_only.permissions.all()), {view, change})
+        self.assertEqual(result.removed, [(shared.pk, delete.pk)])
+        self.assertFalse(sync_subscription_permissions().changed)
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .counters import increment_counters
+from .models import PageVisit
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_DROP = "drop"
+OVERFLOW_WRITE = "write"
+
+
+class VisitBuffer:
+    """
+    Queue page visits in memory and write them out with bulk_create.
+
+    A flush happens when `flush_size` visits are queued or every
+    `flush_interval` seconds, whichever comes first. At most `max_size`
+    visits are held; past that the `overflow` policy decides whether new
+    visits are dropped or written straight to the database. Each visit
+    keeps the time it was added, not the time it was written.
+    """
+
+    def __init__(self, flush_size=100, flush_interval=5.0, max_size=10000, overflow=OVERFLOW_DROP):
+        if overflow not in (OVERFLOW_DROP, OVERFLOW_WRITE):
+            raise ValueError(f"Unknown overflow policy {overflow!r}")
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.overflow = overflow
+        self.dropped = 0
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def __len__(self):
+        return len(self._queue)
+
+    def add(self, path, write=True):
+        """
+        Queue a visit. When the buffer is full with the "write" overflow
+        policy the visit is written right away, or with write=False (async
+        callers, no ORM on the event loop) returned for the caller to write.
+        Returns the (path, timestamp) visits left for the caller, normally
+        none.
+        """
+        self._ensure_flusher()
+        visit = (path, timezone.now())
+        with self._lock:
+            if len(self._queue) >= self.max_size:
+                if self.overflow == OVERFLOW_DROP:
+                    self.dropped += 1
+                    return []
+                overflow = True
+            else:
+                self._queue.append(visit)
+                overflow = False
+            should_flush = len(self._queue) >= self.flush_size
+        if overflow:
+            #buffer is full, don't lose the visit
+            if not write:
+                return [visit]
+            self._write([visit])
+        elif should_flush:
+            self._wakeup.set()
+        return []
+
+    def flush(self):
+        #only one flush at a time so batches stay in order
+        with self._flush_lock:
+            with self._lock:
+                visits = list(self._queue)
+                self._queue.clear()
+            if visits:
+                try:
+                    self._write(visits)
+                except Exception:
+                    logger.exception("Failed to flush %s page visits", len(visits))
+                    return 0
+            return len(visits)
+
+    def _write(self, visits):
+        save_visits(
+            [path for path, _ in visits],
+            batch_size=self.flush_size,
+            timestamps=[timestamp for _, timestamp in visits],
+        )
+
+    def _ensure_flusher(self):
+        #a forked worker (gunicorn) doesn't inherit the parent's thread
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run,
+                name="visit-buffer-flusher",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            self._wakeup.wait(max(next_flush - time.monotonic(), 0))
+            self._wakeup.clear()
+            close_old_connections()
+            self.flush()
+            next_flush = time.monotonic() + self.flush_interval
+
+
+def save_visits(paths, batch_size=None, timestamps=None):
+    """
+    Insert the visits and bump their counters in one transaction.
+    `timestamps` are when each visit happened, now by default.
+    """
+    if timestamps is None:
+        timestamps = [timezone.now()] * len(paths)
+    with transaction.atomic():
+        PageVisit.objects.bulk_create(
+            [PageVisit(path=path, timestamp=timestamp) for path, timestamp in zip(paths, timestamps)],
+            batch_size=batch_size,
+        )
+        increment_counters(paths)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = VisitBuffer(
+                    flush_size=getattr(settings, "VISITS_BUFFER_FLUSH_SIZE", 100),
+                    flush_interval=getattr(settings, "VISITS_BUFFER_FLUSH_INTERVAL", 5.0),
+                    max_size=getattr(settings, "VISITS_BUFFER_MAX_SIZE", 10000),
+                    overflow=getattr(settings, "VISITS_BUFFER_OVERFLOW", OVERFLOW_DROP),
+                )
+    return _buffer
+
+
+def record_visit(path):
+    """
+    Record a page visit, buffered unless VISITS_BUFFER_ENABLED is off.
+    """
+    if not getattr(settings, "VISITS_BUFFER_ENABLED", True):
+        save_visits([path])
+        return
+    get_buffer().add(path)
+
+
+_background_tasks = set()
+
+
+def arecord_visit(path):
+    """
+    record_visit() for async views, without waiting on the database: a
+    buffered visit only touches memory, a write-through save (buffering off,
+    or a full buffer with the "write" policy) runs as a background task on
+    the running loop. Returns that task, if any.
+    """
+    if getattr(settings, "VISITS_BUFFER_ENABLED", True):
+        visits = get_buffer().add(path, write=False)
+        if not visits:
+            return None
+        paths, timestamps = [visits[0][0]], [visits[0][1]]
+    else:
+        paths, timestamps = [path], None
+    task = asyncio.get_running_loop().create_task(sync_to_async(save_visits)(paths, timestamps=timestamps))
+    #the loop only keeps weak references to tasks
+    _background_tasks.add(task)
+    task.add_done_callback(_background_task_done)
+    return task
+
+
+def _background_task_done(task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Failed to record page visit", exc_info=task.exception())
+
+
+def flush_visits():
+    """
+    Write out whatever is queued. Called by the gunicorn worker_exit hook
+    (cfehome.gunicorn_conf), not atexit: by then a test run or management
+    command may have torn down the database the settings point at. Other
+    servers (runserver) lose at most the last flush_interval of visits.
+    """
+    if _buffer is None:
+        return 0
+    return _buffer.flush()
@@ -0,0 +1,101 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import PageVisit, PageVisitCounter, PageVisitRollup
+from .rollups import HOUR, get_watermark
+
+TOTAL_PATH = PageVisitCounter.TOTAL_PATH
+
+
+def _counter_key(path):
+    #PageVisit.path is nullable, the counter path is not
+    return path or ""
+
+
+def increment_counters(paths):
+    """
+    Bump the per-path counters and the total for an iterable of visited paths.
+    Meant to run in the same transaction as the PageVisit insert.
+    """
+    counts = Counter(_counter_key(path) for path in paths)
+    if not counts:
+        return
+    counts[TOTAL_PATH] = sum(counts.values())
+    now = timezone.now()
+    with transaction.atomic(savepoint=False):
+        existing = set(
+            PageVisitCounter.objects.filter(path__in=counts.keys()).values_list("path", flat=True)
+        )
+        #rows are always locked in path order, so concurrent flushes can't deadlock
+        missing = [path for path in sorted(counts) if path not in existing]
+        if missing:
+            #another worker may create the same row, so ignore conflicts and add on top
+            PageVisitCounter.objects.bulk_create(
+                [PageVisitCounter(path=path, count=0) for path in missing],
+                ignore_conflicts=True,
+            )
+        for path in sorted(counts):
+            PageVisitCounter.objects.filter(path=path).update(
+                count=F("count") + counts[path],
+                updated=now,
+            )
+
+
+def get_visit_counts(path):
+    """
+    Returns (page_visit_count, total_visit_count) with a single query.
+    """
+    path = _counter_key(path)
+    counts = dict(
+        PageVisitCounter.objects.filter(path__in=[path, TOTAL_PATH]).values_list("path", "count")
+    )
+    return counts.get(path, 0), counts.get(TOTAL_PATH, 0)
+
+
+async def aget_visit_counts(path):
+    """
+    get_visit_counts() for async views.
+    """
+    path = _counter_key(path)
+    qs = PageVisitCounter.objects.filter(path__in=[path, TOTAL_PATH]).values_list("path", "count")
+    counts = {counter_path: count async for counter_path, count in qs}
+    return counts.get(path, 0), counts.get(TOTAL_PATH, 0)
+
+
+def rebuild_counters():
+    """
+    Recompute every counter from the raw PageVisit table. Hours that were
+    already rolled up (and maybe pruned) are counted from the hourly rollups.
+    """
+    with transaction.atomic():
+        raw_qs = PageVisit.objects.all()
+        watermark = get_watermark()
+        rows = []
+        if watermark is not None:
+            raw_qs = raw_qs.filter(timestamp__gte=watermark)
+            rows += (
+                PageVisitRollup.objects.filter(period=HOUR, bucket__lt=watermark)
+                .order_by()
+                .values("path")
+                .annotate(total=Sum("count"))
+                .values_list("path", "total")
+            )
+        rows += (
+            raw_qs.order_by()
+            .values("path")
+            .annotate(total=Count("id"))
+            .values_list("path", "total")
+        )
+        counts = Counter()
+        for path, total in rows:
+            counts[_counter_key(path)] += total
+        counts[TOTAL_PATH] = sum(counts.values())
+        PageVisitCounter.objects.all().delete()
+        PageVisitCounter.objects.bulk_create(
+            [PageVisitCounter(path=path, count=count) for path, count in counts.items()],
+            batch_size=1000,
+        )
+    return counts
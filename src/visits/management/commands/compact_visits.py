@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from typing import Any
+
+from visits.rollups import prune_visits, rollup_visits
+
+
+class Command(BaseCommand):
+
+    """ Roll raw page visits up into hourly/daily buckets and delete old raw rows """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keep-days",
+            type=int,
+            default=getattr(settings, "VISITS_RAW_RETENTION_DAYS", 30),
+            help="Keep raw visits for this many days (they are only deleted once rolled up)",
+        )
+        parser.add_argument(
+            "--no-prune",
+            action="store_true",
+            help="Only roll up, don't delete any raw visits",
+        )
+
+    def handle(self, *args: Any, **options: Any):
+        rolled = rollup_visits()
+        if rolled is None:
+            self.stdout.write("No closed hours to roll up.")
+        else:
+            start, end = rolled
+            self.stdout.write(f"Rolled up visits from {start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M}.")
+        if options["no_prune"]:
+            return
+        deleted = prune_visits(keep_days=options["keep_days"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Deleted {deleted} raw visits older than {options['keep_days']} days.")
+        )
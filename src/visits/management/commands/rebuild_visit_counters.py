@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from typing import Any
+
+from visits.counters import TOTAL_PATH, rebuild_counters
+
+
+class Command(BaseCommand):
+
+    """ Rebuild the PageVisitCounter rows from the PageVisit table and its rollups """
+
+    def handle(self, *args: Any, **options: Any):
+        self.stdout.write("Rebuilding page visit counters...")
+        counts = rebuild_counters()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {len(counts) - 1} path counters ({counts[TOTAL_PATH]} total visits)."
+            )
+        )
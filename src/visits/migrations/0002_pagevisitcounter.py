@@ -0,0 +1,42 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:13
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def seed_counters(apps, schema_editor):
+    #start the counters from the visits recorded so far
+    PageVisit = apps.get_model('visits', 'PageVisit')
+    PageVisitCounter = apps.get_model('visits', 'PageVisitCounter')
+    #the database being migrated, not always "default"
+    db_alias = schema_editor.connection.alias
+    counts = {}
+    rows = PageVisit.objects.using(db_alias).order_by().values('path').annotate(total=Count('id'))
+    for row in rows:
+        path = row['path'] or ''
+        counts[path] = counts.get(path, 0) + row['total']
+    counts['*'] = sum(counts.values())
+    PageVisitCounter.objects.using(db_alias).bulk_create(
+        [PageVisitCounter(path=path, count=count) for path, count in counts.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visits', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageVisitCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.TextField(unique=True)),
+                ('count', models.BigIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
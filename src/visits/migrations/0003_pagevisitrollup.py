@@ -0,0 +1,39 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visits', '0002_pagevisitcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageVisitRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=10)),
+                ('bucket', models.DateTimeField()),
+                ('path', models.TextField(blank=True, default='')),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pagevisit',
+            index=models.Index(fields=['path', 'timestamp'], name='visits_path_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pagevisit',
+            index=models.Index(fields=['timestamp'], name='visits_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pagevisitrollup',
+            index=models.Index(fields=['period', 'bucket'], name='visits_rollup_period_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='pagevisitrollup',
+            constraint=models.UniqueConstraint(fields=('period', 'path', 'bucket'), name='visits_rollup_unique_bucket'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 class PageVisit(models.Model):
@@ -6,5 +7,54 @@ class PageVisit(models.Model):
     A model to record page visits.
     """
     path = models.TextField(null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
-    
\ No newline at end of file
+    #set by the visit buffer to when the request came in, not when it was written
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["path", "timestamp"], name="visits_path_ts_idx"),
+            models.Index(fields=["timestamp"], name="visits_ts_idx"),
+        ]
+
+
+class PageVisitCounter(models.Model):
+    """
+    Running visit count per path, kept current as visits are recorded.
+    The row with path == TOTAL_PATH holds the count across all paths.
+    """
+    TOTAL_PATH = "*"
+
+    path = models.TextField(unique=True)
+    count = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.path} - {self.count}"
+
+
+class PageVisitRollup(models.Model):
+    """
+    Number of visits to a path within an hourly or daily bucket.
+    """
+    class PeriodChoices(models.TextChoices):
+        HOUR = "hour", "Hourly"
+        DAY = "day", "Daily"
+
+    period = models.CharField(max_length=10, choices=PeriodChoices.choices)
+    bucket = models.DateTimeField()  # start of the hour/day (UTC)
+    path = models.TextField(blank=True, default="")
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["period", "path", "bucket"],
+                name="visits_rollup_unique_bucket",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["period", "bucket"], name="visits_rollup_period_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.path} - {self.period} {self.bucket:%Y-%m-%d %H:%M} - {self.count}"
@@ -0,0 +1,176 @@
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import Coalesce, TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import PageVisit, PageVisitRollup
+
+HOUR = PageVisitRollup.PeriodChoices.HOUR
+DAY = PageVisitRollup.PeriodChoices.DAY
+
+ONE_HOUR = datetime.timedelta(hours=1)
+ONE_DAY = datetime.timedelta(days=1)
+
+#buffered visits are written up to a flush interval late, so leave closed
+#hours alone for a little while before rolling them up
+SETTLE_TIME = datetime.timedelta(minutes=5)
+
+
+#buckets are UTC hours and days whatever TIME_ZONE is
+UTC = datetime.timezone.utc
+
+
+def floor_hour(value):
+    return value.astimezone(UTC).replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(value):
+    return value.astimezone(UTC).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def ceil_day(value):
+    day = floor_day(value)
+    return day if day == value else day + ONE_DAY
+
+
+def get_watermark():
+    """
+    Start of the first hour that has not been rolled up yet, or None if
+    nothing has been rolled up. Raw visits before this are covered by the
+    hourly rollups and are safe to delete.
+    """
+    last_bucket = PageVisitRollup.objects.filter(period=HOUR).aggregate(last=Max("bucket"))["last"]
+    if last_bucket is None:
+        return None
+    return last_bucket + ONE_HOUR
+
+
+def rollup_visits(now=None, batch_size=1000):
+    """
+    Roll raw visits up into hourly buckets for every closed hour past the
+    watermark, then refresh the daily buckets those hours fall in.
+    Returns the (start, end) range that was rolled up, or None.
+    """
+    now = now or timezone.now()
+    end = floor_hour(now - SETTLE_TIME)
+    with transaction.atomic():
+        start = get_watermark()
+        if start is None:
+            first = PageVisit.objects.order_by("timestamp").values_list("timestamp", flat=True).first()
+            if first is None:
+                return None
+            start = floor_hour(first)
+        if start >= end:
+            return None
+
+        hourly = (
+            PageVisit.objects.filter(timestamp__gte=start, timestamp__lt=end)
+            .annotate(bucket=TruncHour("timestamp", tzinfo=UTC))
+            .values("bucket", "path")
+            .annotate(total=Count("id"))
+            .order_by()
+        )
+        _upsert(HOUR, hourly, batch_size)
+
+        #recompute whole days from the hourly rows, the last one may be partial
+        daily = (
+            PageVisitRollup.objects.filter(period=HOUR, bucket__gte=floor_day(start), bucket__lt=end)
+            .annotate(day=TruncDay("bucket", tzinfo=UTC))
+            .values("day", "path")
+            .annotate(total=Sum("count"))
+            .order_by()
+        )
+        _upsert(DAY, ({"bucket": row["day"], "path": row["path"], "total": row["total"]} for row in daily), batch_size)
+    return start, end
+
+
+def _upsert(period, rows, batch_size):
+    objs = {}
+    for row in rows:
+        #PageVisit.path is nullable, the rollup path is not
+        key = (row["bucket"], row["path"] or "")
+        objs[key] = objs.get(key, 0) + row["total"]
+    PageVisitRollup.objects.bulk_create(
+        [PageVisitRollup(period=period, bucket=bucket, path=path, count=count) for (bucket, path), count in objs.items()],
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=["period", "path", "bucket"],
+        update_fields=["count"],
+    )
+    return len(objs)
+
+
+def prune_visits(keep_days=None, now=None, batch_size=5000):
+    """
+    Delete raw visits older than `keep_days` that are already rolled up.
+    Deletes in batches so a large backlog doesn't hold one long lock.
+    """
+    if keep_days is None:
+        keep_days = getattr(settings, "VISITS_RAW_RETENTION_DAYS", 30)
+    now = now or timezone.now()
+    watermark = get_watermark()
+    if watermark is None:
+        return 0
+    cutoff = min(now - datetime.timedelta(days=keep_days), watermark)
+    deleted = 0
+    while True:
+        ids = list(
+            PageVisit.objects.filter(timestamp__lt=cutoff)
+            .order_by("timestamp")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += PageVisit.objects.filter(id__in=ids).delete()[0]
+
+
+def _rollup_sum(period, path, start, end):
+    if start >= end:
+        return 0
+    qs = PageVisitRollup.objects.filter(period=period, bucket__gte=start, bucket__lt=end)
+    if path is not None:
+        qs = qs.filter(path=path)
+    return qs.aggregate(total=Coalesce(Sum("count"), 0))["total"]
+
+
+def count_visits(path=None, since=None, until=None):
+    """
+    Count visits to `path` (or all paths) between `since` and `until`.
+
+    Rolled-up hours are answered from the daily and hourly rollups, only
+    the tail past the watermark reads raw visits. Rolled-up ranges are
+    hour-granular: `since` and `until` are rounded down to the start of
+    their hour when they fall before the watermark.
+
+        count_visits("/about/", since=timezone.now() - timedelta(days=7))
+    """
+    until = until or timezone.now()
+    watermark = get_watermark()
+    total = 0
+    raw_start = since
+    if watermark is not None:
+        start = floor_hour(since) if since is not None else _first_rollup_bucket()
+        end = min(floor_hour(until), watermark)
+        if start is not None and start < end:
+            days_start = ceil_day(start)
+            days_end = floor_day(end)
+            if days_start < days_end:
+                total += _rollup_sum(DAY, path, days_start, days_end)
+                total += _rollup_sum(HOUR, path, start, days_start)
+                total += _rollup_sum(HOUR, path, days_end, end)
+            else:
+                total += _rollup_sum(HOUR, path, start, end)
+        raw_start = max(since, watermark) if since is not None else watermark
+    qs = PageVisit.objects.filter(timestamp__lt=until)
+    if raw_start is not None:
+        qs = qs.filter(timestamp__gte=raw_start)
+    if path is not None:
+        qs = qs.filter(path=path)
+    return total + qs.count()
+
+
+def _first_rollup_bucket():
+    return PageVisitRollup.objects.filter(period=HOUR).order_by("bucket").values_list("bucket", flat=True).first()
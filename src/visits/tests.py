@@ -1,3 +1,203 @@
-from django.test import TestCase
+import os
+import re
+import threading
+from datetime import datetime, timezone
+from unittest import mock
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from . import buffer
+from .buffer import OVERFLOW_DROP, OVERFLOW_WRITE, VisitBuffer, arecord_visit
+from .counters import get_visit_counts, increment_counters, rebuild_counters
+from .models import PageVisit, PageVisitRollup
+from .rollups import DAY, HOUR, count_visits, get_watermark, prune_visits, rollup_visits
 
 # Create your tests here.
+
+class VisitBufferTests(SimpleTestCase):
+
+    def buffer(self, **kwargs):
+        visit_buffer = VisitBuffer(**{"flush_size": 100, "flush_interval": 3600, **kwargs})
+        self.written = []
+        self.flushed = threading.Event()
+
+        def write(visits):
+            self.written += [path for path, _ in visits]
+            self.flushed.set()
+
+        patcher = mock.patch.object(visit_buffer, "_write", side_effect=write)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        #the flusher thread can't be stopped, keep it asleep after the test
+        self.addCleanup(setattr, visit_buffer, "flush_interval", 3600)
+        return visit_buffer
+
+    def test_flush_size_wakes_the_flusher(self):
+        visit_buffer = self.buffer(flush_size=3)
+        for path in ["/a/", "/b/"]:
+            visit_buffer.add(path)
+        self.assertFalse(self.flushed.wait(0.2))
+        visit_buffer.add("/c/")
+        self.assertTrue(self.flushed.wait(5))
+        self.assertEqual(self.written, ["/a/", "/b/", "/c/"])
+        self.assertEqual(len(visit_buffer), 0)
+
+    def test_flush_interval(self):
+        visit_buffer = self.buffer(flush_interval=0.05)
+        visit_buffer.add("/a/")
+        self.assertTrue(self.flushed.wait(5))
+        self.assertEqual(self.written, ["/a/"])
+
+    def test_full_buffer_drops(self):
+        visit_buffer = self.buffer(max_size=2, overflow=OVERFLOW_DROP)
+        for path in ["/a/", "/b/", "/c/"]:
+            self.assertEqual(visit_buffer.add(path), [])
+        self.assertEqual(len(visit_buffer), 2)
+        self.assertEqual(visit_buffer.dropped, 1)
+        self.assertEqual(self.written, [])
+
+    def test_full_buffer_writes_through(self):
+        visit_buffer = self.buffer(max_size=1, overflow=OVERFLOW_WRITE)
+        visit_buffer.add("/a/")
+        visit_buffer.add("/b/")
+        self.assertEqual(self.written, ["/b/"])
+        self.assertEqual(len(visit_buffer), 1)
+        self.assertEqual(visit_buffer.dropped, 0)
+
+    def test_forked_process_starts_its_own_flusher(self):
+        visit_buffer = self.buffer()
+        visit_buffer.add("/a/")
+        parent_thread = visit_buffer._thread
+        visit_buffer.add("/b/")
+        self.assertIs(visit_buffer._thread, parent_thread)
+        with mock.patch.object(buffer.os, "getpid", return_value=os.getpid() + 1):
+            visit_buffer.add("/c/")
+        self.assertIsNot(visit_buffer._thread, parent_thread)
+        self.assertTrue(visit_buffer._thread.is_alive())
+
+
+class VisitTimestampTests(TestCase):
+
+    def test_visit_keeps_the_time_it_was_added(self):
+        visit_buffer = VisitBuffer(flush_size=100, flush_interval=3600)
+        added = datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+        with mock.patch.object(buffer.timezone, "now", return_value=added):
+            visit_buffer.add("/a/")
+        self.assertEqual(visit_buffer.flush(), 1)
+        self.assertEqual(PageVisit.objects.get(path="/a/").timestamp, added)
+
+
+@override_settings(VISITS_BUFFER_ENABLED=True)
+class AsyncOverflowTests(TestCase):
+
+    async def test_full_buffer_is_written_in_the_background(self):
+        #the flusher never runs on its own during the test
+        full = VisitBuffer(flush_size=100, flush_interval=3600, max_size=1, overflow=OVERFLOW_WRITE)
+        with mock.patch.object(buffer, "_buffer", full):
+            self.assertIsNone(arecord_visit("/queued/"))
+            #no ORM call on the event loop, the overflow is a background task
+            task = arecord_visit("/overflow/")
+            self.assertIsNotNone(task)
+            await task
+        self.assertEqual(len(full), 1)
+        self.assertEqual(await PageVisit.objects.filter(path="/overflow/").acount(), 1)
+
+
+class IncrementCountersTests(TestCase):
+
+    def test_counters_are_updated_in_path_order(self):
+        with CaptureQueriesContext(connection) as queries:
+            increment_counters(["/b/", "/a/", "/b/"])
+        updated = [
+            re.search(r"\"path\" = '([^']*)'", query["sql"]).group(1)
+            for query in queries if query["sql"].startswith("UPDATE")
+        ]
+        #the TOTAL_PATH "*" sorts first
+        self.assertEqual(updated, ["*", "/a/", "/b/"])
+        self.assertEqual(get_visit_counts("/b/"), (2, 3))
+
+
+def utc(day, hour, minute=0):
+    return datetime(2026, 3, day, hour, minute, tzinfo=timezone.utc)
+
+
+class RollupTests(TestCase):
+
+    def visit(self, path, timestamp):
+        PageVisit.objects.create(path=path, timestamp=timestamp)
+
+    def rollups(self, period):
+        return {
+            (row.bucket, row.path): row.count
+            for row in PageVisitRollup.objects.filter(period=period)
+        }
+
+    def setUp(self):
+        for path, timestamp in [
+            ("/a/", utc(1, 10, 10)),
+            ("/a/", utc(1, 10, 50)),
+            ("/b/", utc(1, 11, 20)),
+            ("/a/", utc(1, 23, 30)),
+            ("/a/", utc(2, 0, 58)),
+        ]:
+            self.visit(path, timestamp)
+
+    def test_rollup_closed_hours(self):
+        #the 00:00 hour of the 2nd is still settling
+        self.assertEqual(rollup_visits(now=utc(2, 1, 2)), (utc(1, 10), utc(2, 0)))
+        self.assertEqual(self.rollups(HOUR), {
+            (utc(1, 10), "/a/"): 2,
+            (utc(1, 11), "/b/"): 1,
+            (utc(1, 23), "/a/"): 1,
+        })
+        self.assertEqual(self.rollups(DAY), {(utc(1, 0), "/a/"): 3, (utc(1, 0), "/b/"): 1})
+        self.assertEqual(get_watermark(), utc(2, 0))
+
+    def test_rerun_is_idempotent_and_advances_the_watermark(self):
+        rollup_visits(now=utc(2, 1, 2))
+        self.assertIsNone(rollup_visits(now=utc(2, 1, 2)))
+        self.visit("/a/", utc(2, 2, 15))
+        self.assertEqual(rollup_visits(now=utc(2, 4)), (utc(2, 0), utc(2, 3)))
+        self.assertEqual(get_watermark(), utc(2, 3))
+        self.assertEqual(self.rollups(DAY), {
+            (utc(1, 0), "/a/"): 3,
+            (utc(1, 0), "/b/"): 1,
+            (utc(2, 0), "/a/"): 2,
+        })
+        self.assertEqual(sum(self.rollups(HOUR).values()), 6)
+
+    @override_settings(TIME_ZONE="Asia/Kolkata")
+    def test_buckets_are_utc(self):
+        #20:00 UTC is 01:30 on the next day in Kolkata
+        PageVisit.objects.all().delete()
+        self.visit("/a/", utc(1, 20, 10))
+        rollup_visits(now=utc(2, 12))
+        self.assertEqual(self.rollups(HOUR), {(utc(1, 20), "/a/"): 1})
+        self.assertEqual(self.rollups(DAY), {(utc(1, 0), "/a/"): 1})
+
+    def test_prune_only_deletes_rolled_up_visits(self):
+        self.assertEqual(prune_visits(keep_days=0, now=utc(2, 1, 2)), 0)
+        rollup_visits(now=utc(2, 1, 2))
+        self.assertEqual(prune_visits(keep_days=0, now=utc(2, 1, 2), batch_size=2), 4)
+        self.assertEqual(list(PageVisit.objects.values_list("timestamp", flat=True)), [utc(2, 0, 58)])
+
+    def test_prune_keeps_recent_visits(self):
+        rollup_visits(now=utc(2, 1, 2))
+        #older than 11:00 on the 1st
+        self.assertEqual(prune_visits(keep_days=1, now=utc(2, 11)), 2)
+        self.assertEqual(PageVisit.objects.count(), 3)
+
+    def test_counts_combine_rollups_and_raw_visits(self):
+        rollup_visits(now=utc(2, 1, 2))
+        prune_visits(keep_days=0, now=utc(2, 1, 2))
+        self.visit("/a/", utc(2, 5))
+        until = utc(2, 6)
+        self.assertEqual(count_visits("/a/", until=until), 5)
+        self.assertEqual(count_visits(until=until), 6)
+        self.assertEqual(count_visits("/a/", since=utc(1, 11), until=until), 3)
+        self.assertEqual(count_visits("/a/", since=utc(1, 0), until=utc(1, 23)), 2)
+        counts = rebuild_counters()
+        self.assertEqual(counts["/a/"], 5)
+        self.assertEqual(get_visit_counts("/b/"), (1, 6))